@@ -3,7 +3,7 @@
 """
 import os
 
-from requests import get, post
+from geosys.bridge_api.session import get_session
 
 __copyright__ = "Copyright 2019, Kartoza"
 __license__ = "GPL version 3"
@@ -16,7 +16,7 @@ class ApiClient(object):
 
     VERSION = 0
 
-    def __init__(self, access_token='', endpoint_url=''):
+    def __init__(self, access_token='', endpoint_url='', token_renewer=None):
         """Base class for API client.
 
         :param access_token: The access token.
@@ -24,6 +24,11 @@ class ApiClient(object):
 
         :param endpoint_url: API base url.
         :type endpoint_url: str
+
+        :param token_renewer: Function called with the rejected access token
+            when a request is answered with 401, returning a new access token
+            or None. Requests are not sent again if not given.
+        :type token_renewer: function
         """
         self.access_token = access_token
         self.endpoint_url = endpoint_url
@@ -31,6 +36,46 @@ class ApiClient(object):
             'authorization': 'Bearer %s' % self.access_token
         }
         self.proxy = {}
+        self.token_renewer = token_renewer
+
+    def set_access_token(self, access_token):
+        """Set the access token sent with the requests.
+
+        The headers are updated in place, so requests sent with them
+        elsewhere, e.g. by the downloader, use the new token as well.
+
+        :param access_token: The access token.
+        :type access_token: str
+        """
+        self.access_token = access_token
+        self.headers['authorization'] = 'Bearer %s' % access_token
+
+    def renew_rejected_token(self, response):
+        """Renew the access token when a request was rejected with 401.
+
+        :param response: The API response.
+        :type response: requests.Response
+
+        :return: Whether the token was renewed and the request can be sent
+            again.
+        :rtype: bool
+        """
+        if response.status_code != 401 or self.token_renewer is None:
+            return False
+        access_token = self.token_renewer(self.access_token)
+        if not access_token:
+            return False
+        self.set_access_token(access_token)
+        return True
+
+    @property
+    def session(self):
+        """HTTP session shared by all API clients.
+
+        :return: The pooled keep-alive session.
+        :rtype: requests.Session
+        """
+        return get_session()
 
     def set_proxy(self, proxy_host, proxy_port, proxy_user, proxy_password):
         """Set proxy server.
@@ -99,7 +144,11 @@ class ApiClient(object):
         if kwargs.get('headers'):
             kwargs['headers'].update(self.headers)
 
-        response = get(url, proxies=self.proxy, **kwargs)
+        response = self.session.get(url, proxies=self.proxy, **kwargs)
+        if self.renew_rejected_token(response):
+            if kwargs.get('headers'):
+                kwargs['headers'].update(self.headers)
+            response = self.session.get(url, proxies=self.proxy, **kwargs)
         return response
 
     def post(self, url, **kwargs):
@@ -117,7 +166,11 @@ class ApiClient(object):
         if kwargs.get('headers'):
             kwargs['headers'].update(self.headers)
 
-        response = post(url, proxies=self.proxy, **kwargs)
+        response = self.session.post(url, proxies=self.proxy, **kwargs)
+        if self.renew_rejected_token(response):
+            if kwargs.get('headers'):
+                kwargs['headers'].update(self.headers)
+            response = self.session.post(url, proxies=self.proxy, **kwargs)
         return response
 
     def get_content(self, url, params=None):
@@ -132,7 +185,61 @@ class ApiClient(object):
         :return: Response content.
         :rtype: bytes
         """
-        response = get(
+        response = self.session.get(
             url, headers=self.headers, params=params, proxies=self.proxy,
             stream=True)
+        if self.renew_rejected_token(response):
+            response = self.session.get(
+                url, headers=self.headers, params=params, proxies=self.proxy,
+                stream=True)
+        return response.content
+
+    def get_cached_content(self, url, cache, params=None, namespace=''):
+        """Get the response content through a content cache.
+
+        Fresh cache entries are returned without a request. Stale ones are
+        revalidated with their ETag and Last-Modified validators.
+
+        :param url: API url.
+        :type url: str
+
+        :param cache: Content cache.
+        :type cache: ContentCache
+
+        :param params: Request parameters.
+        :type params: str
+
+        :param namespace: Namespace of the cache entry, e.g. the account the
+            content is fetched with, so it is not served to other accounts.
+        :type namespace: str
+
+        :return: Response content.
+        :rtype: bytes
+        """
+        entry = cache.get(url, namespace)
+        if entry and cache.is_fresh(entry):
+            return entry['content']
+
+        headers = dict(self.headers)
+        if entry and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        response = self.session.get(
+            url, headers=headers, params=params, proxies=self.proxy)
+        if self.renew_rejected_token(response):
+            headers.update(self.headers)
+            response = self.session.get(
+                url, headers=headers, params=params, proxies=self.proxy)
+        if entry and response.status_code == 304:
+            cache.touch(url, namespace)
+            return entry['content']
+
+        if response.status_code == 200:
+            cache.put(
+                url, response.content,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+                namespace=namespace)
         return response.content
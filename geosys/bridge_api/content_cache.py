@@ -0,0 +1,211 @@
+# coding=utf-8
+"""Persistent on-disk cache of Bridge API response contents.
+
+Each entry is stored as a content file named after the hash of its url and
+namespace, e.g. the account it was fetched with, with a json sidecar
+holding the validators (ETag and Last-Modified) needed to revalidate it.
+The modification time of the content file records the last access,
+entries are evicted least recently used first once the cache grows beyond
+its size budget.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+LOGGER = logging.getLogger('geosys')
+
+META_EXT = '.json'
+
+
+class ContentCache(object):
+    """Size-bounded LRU cache of response contents."""
+
+    def __init__(self, directory, max_size, max_age=0):
+        """Size-bounded LRU cache of response contents.
+
+        :param directory: Directory where the cache entries are stored.
+        :type directory: str
+
+        :param max_size: Size budget of the cache in bytes.
+        :type max_size: int
+
+        :param max_age: Seconds an entry is served without revalidation.
+        :type max_age: int
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        self._size = sum(
+            size for _, _, size in self._content_files())
+
+    @staticmethod
+    def key(url, namespace=''):
+        """Cache key of an url.
+
+        :param url: The url of the content.
+        :type url: str
+
+        :param namespace: Namespace of the entry, e.g. the account the
+            content is fetched with.
+        :type namespace: str
+
+        :return: Cache key.
+        :rtype: str
+        """
+        if namespace:
+            url = '{}\n{}'.format(namespace, url)
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def _path(self, url, namespace=''):
+        """Path of the content file of an url."""
+        return os.path.join(self.directory, self.key(url, namespace))
+
+    def _content_files(self):
+        """List content files as (path, last access, size) tuples."""
+        content_files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(META_EXT):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            content_files.append((path, stat.st_mtime, stat.st_size))
+        return content_files
+
+    def get(self, url, namespace=''):
+        """Get a cache entry.
+
+        :param url: The url of the content.
+        :type url: str
+
+        :param namespace: Namespace of the entry.
+        :type namespace: str
+
+        :return: Entry with content, etag, last_modified and fetched_at
+            keys, or None when the url is not cached.
+        :rtype: dict
+        """
+        path = self._path(url, namespace)
+        with self._lock:
+            try:
+                with open(path + META_EXT) as meta_file:
+                    entry = json.load(meta_file)
+                with open(path, 'rb') as content_file:
+                    entry['content'] = content_file.read()
+                os.utime(path, None)
+            except (IOError, OSError, ValueError):
+                return None
+        return entry
+
+    def is_fresh(self, entry):
+        """Check whether an entry can be served without revalidation.
+
+        :param entry: Cache entry.
+        :type entry: dict
+
+        :return: True if the entry is younger than max_age.
+        :rtype: bool
+        """
+        return time.time() - entry.get('fetched_at', 0) < self.max_age
+
+    def put(self, url, content, etag=None, last_modified=None, namespace=''):
+        """Store the content of an url.
+
+        :param url: The url of the content.
+        :type url: str
+
+        :param content: The content.
+        :type content: bytes
+
+        :param etag: ETag response header.
+        :type etag: str
+
+        :param last_modified: Last-Modified response header.
+        :type last_modified: str
+
+        :param namespace: Namespace of the entry.
+        :type namespace: str
+        """
+        path = self._path(url, namespace)
+        meta = {
+            'url': url,
+            'namespace': namespace,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': time.time()
+        }
+        with self._lock:
+            try:
+                old_size = os.path.getsize(path)
+            except OSError:
+                old_size = 0
+            try:
+                with open(path, 'wb') as content_file:
+                    content_file.write(content)
+                with open(path + META_EXT, 'w') as meta_file:
+                    json.dump(meta, meta_file)
+            except (IOError, OSError) as e:
+                LOGGER.debug('Unable to cache %s: %s' % (url, e))
+                self._remove(path)
+                return
+            self._size += len(content) - old_size
+            if self._size > self.max_size:
+                self._evict()
+
+    def touch(self, url, namespace=''):
+        """Mark an entry as revalidated by the server.
+
+        :param url: The url of the content.
+        :type url: str
+
+        :param namespace: Namespace of the entry.
+        :type namespace: str
+        """
+        path = self._path(url, namespace)
+        with self._lock:
+            try:
+                with open(path + META_EXT) as meta_file:
+                    meta = json.load(meta_file)
+                meta['fetched_at'] = time.time()
+                with open(path + META_EXT, 'w') as meta_file:
+                    json.dump(meta, meta_file)
+            except (IOError, OSError, ValueError):
+                pass
+
+    def clear(self):
+        """Remove every cache entry."""
+        with self._lock:
+            for path, _, _ in self._content_files():
+                self._remove(path)
+            self._size = 0
+
+    def _remove(self, path):
+        """Remove the content file and sidecar of an entry."""
+        for file_path in (path, path + META_EXT):
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        """Remove least recently used entries until within the budget."""
+        content_files = sorted(self._content_files(), key=lambda f: f[1])
+        self._size = sum(size for _, _, size in content_files)
+        for path, _, size in content_files:
+            if self._size <= self.max_size:
+                break
+            self._remove(path)
+            self._size -= size
@@ -46,10 +46,44 @@ BRIDGE_URLS = {
 CLIENT_ID = 'mapproduct_api'
 CLIENT_SECRET = 'mapproduct_api.secret'
 GRANT_TYPE = 'password'
+REFRESH_GRANT_TYPE = 'refresh_token'
 SCOPE = 'openid offline_access'
-MAX_FEATURE_NUMBERS = 10
+# Seconds before the reported expiry at which an access token is renewed
+TOKEN_EXPIRY_MARGIN = 60
+MAX_FEATURE_NUMBERS = 200
+# Sample points sent with a sample map request
+MAX_SAMPLE_POINTS = 10
 DEFAULT_N_PLANNED = 0.01
 
+# HTTP connection pool
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 16
+DEFAULT_POOL_BLOCK = True
+
+# Concurrent requests of the coverage search
+DEFAULT_COVERAGE_WORKERS = 4
+DEFAULT_THUMBNAIL_WORKERS = 8
+
+# Maps created at the same time
+DEFAULT_MAP_CREATION_WORKERS = 4
+
+# Thumbnail cache
+THUMBNAIL_CACHE_SIZE = 100 * 1024 * 1024  # bytes
+THUMBNAIL_CACHE_MAX_AGE = 24 * 60 * 60  # seconds
+
+# Coverage response cache
+COVERAGE_CACHE_TTL = 15 * 60  # seconds
+
+# Preparation of the geometries sent to the coverage search, in degrees
+GEOMETRY_PRECISION = 6  # decimals, about 0.1 m
+GEOMETRY_SIMPLIFY_TOLERANCE = 0.0  # no simplification
+
+# GeoPackage of the vector outputs when they are not separate files
+SESSION_GEOPACKAGE = 'geosys_outputs.gpkg'
+
+# Store of created maps, disabled unless the map_store_size setting is set
+MAP_STORE_SIZE = 0  # bytes
+
 # Default parameters for map creation
 DEFAULT_AVE_YIELD = 1.0
 DEFAULT_MIN_YIELD = 1.0
@@ -117,6 +151,8 @@ PNG_EXT = '.png'
 TIFF_EXT = '.tif'
 SHP_EXT = '.shp'
 KMZ_EXT = '.kmz'
+ZIP_EXT = '.zip'
+GPKG_EXT = '.gpkg'
 LEGEND_EXT = '.legend.png'
 
 # API key
@@ -17,6 +17,7 @@ from geosys.bridge_api.definitions import (
     YGM,
     SAMPLE_MAP
 )
+from geosys.bridge_api.response_cache import request_fingerprint
 from geosys.bridge_api.utilities import get_definition
 
 __copyright__ = "Copyright 2019, Kartoza"
@@ -33,7 +34,13 @@ class FieldLevelMapsAPIClient(ApiClient):
     """
     VERSION = 4
 
-    def __init__(self, access_token, endpoint_url=BRIDGE_URLS['na']['prod']):
+    def __init__(
+            self,
+            access_token,
+            endpoint_url=BRIDGE_URLS['na']['prod'],
+            response_cache=None,
+            cache_namespace='',
+            token_renewer=None):
         """Implementation of field-level-maps API client.
 
         This API call requires access_token from identity server.
@@ -43,9 +50,23 @@ class FieldLevelMapsAPIClient(ApiClient):
 
         :param endpoint_url: The API base url.
         :type endpoint_url: str
+
+        :param response_cache: Cache of coverage responses. Coverage
+            requests are always sent to the server if not given.
+        :type response_cache: ResponseCache
+
+        :param cache_namespace: Namespace of the cache entries, e.g. the
+            account the responses belong to.
+        :type cache_namespace: str
+
+        :param token_renewer: Function renewing an access token rejected by
+            the server, see ApiClient.
+        :type token_renewer: function
         """
         super(FieldLevelMapsAPIClient, self).__init__(
-                access_token, endpoint_url)
+                access_token, endpoint_url, token_renewer=token_renewer)
+        self.response_cache = response_cache
+        self.cache_namespace = cache_namespace
 
     @property
     def base_url(self):
@@ -85,19 +106,8 @@ class FieldLevelMapsAPIClient(ApiClient):
             List of maps data specification based on given criteria.
         :rtype: list
         """
-        filters = filters if filters else {}
-        headers = {
-            'accept': 'application/json',
-            'content-type': 'application/json'
-        }
-
-        response = self.post(
-            self.full_url('coverage'),
-            headers=headers,
-            params=filters,
-            json=data)
-
-        return response.json()
+        return self._post_coverage_request(
+            self.full_url('coverage'), data, filters)
 
     def get_catalog_imagery(self, data, filters=None):
         """Get catalog-imagery based on given parameters.
@@ -128,20 +138,54 @@ class FieldLevelMapsAPIClient(ApiClient):
             List of maps data specification based on given criteria.
         :rtype: list
         """
+        return self._post_coverage_request(
+            self.full_url('catalog-imagery'), data, filters)
+
+    def _post_coverage_request(self, url, data, filters=None):
+        """Actual method to post a coverage request.
 
+        Successful responses are memoized in the response cache, keyed by
+        the fingerprint of the url, request body and filters.
+
+        :param url: Coverage endpoint url.
+        :type url: str
+
+        :param data: Data passed to the API to get specific coverage.
+        :type data: dict
+
+        :param filters: Filter coverage results.
+        :type filters: dict
+
+        :return: JSON response.
+            List of maps data specification based on given criteria.
+        :rtype: list
+        """
         filters = filters if filters else {}
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = request_fingerprint(
+                self.cache_namespace, url, data, filters)
+            cached_response = self.response_cache.get(cache_key)
+            if cached_response is not None:
+                return cached_response
+
         headers = {
             'accept': 'application/json',
             'content-type': 'application/json'
         }
 
         response = self.post(
-            self.full_url('catalog-imagery'),
+            url,
             headers=headers,
             params=filters,
             json=data)
 
-        return response.json()
+        response_json = response.json()
+        # Only coverage results are cached, error messages are dicts.
+        if cache_key and isinstance(response_json, list):
+            self.response_cache.put(cache_key, response_json)
+
+        return response_json
 
     def get_field_map(
             self,
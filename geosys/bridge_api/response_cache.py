@@ -0,0 +1,175 @@
+# coding=utf-8
+"""Time-limited cache of Bridge API JSON responses.
+
+Responses are keyed by a fingerprint of the canonical request (url, body
+and filters). Entries live in memory and, when a database path is set, in
+a SQLite table so they also survive a restart of QGIS.
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from geosys.bridge_api.default import COVERAGE_CACHE_TTL
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+LOGGER = logging.getLogger('geosys')
+
+
+def request_fingerprint(*args):
+    """Canonical hash of request elements.
+
+    Dictionaries are serialized with sorted keys, so two requests with the
+    same content always give the same fingerprint.
+
+    :param args: Request elements e.g. url, body and filters.
+    :type args: list
+
+    :return: Hex digest of the request.
+    :rtype: str
+    """
+    canonical = json.dumps(
+        args, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache(object):
+    """Memory and optional SQLite cache of JSON responses."""
+
+    def __init__(self, ttl, db_path=None):
+        """Memory and optional SQLite cache of JSON responses.
+
+        :param ttl: Seconds an entry is kept.
+        :type ttl: int
+
+        :param db_path: Path of the SQLite database. Only the memory tier is
+            used if not given.
+        :type db_path: str
+        """
+        self.ttl = ttl
+        self.db_path = None
+        self._memory = {}
+        self._lock = threading.Lock()
+        if db_path:
+            self.set_database(db_path)
+
+    def set_database(self, db_path):
+        """Set the SQLite database used as the persistent tier.
+
+        :param db_path: Path of the SQLite database, None to disable it.
+        :type db_path: str
+        """
+        with self._lock:
+            self.db_path = db_path
+            if not db_path:
+                return
+            try:
+                self._execute(
+                    'CREATE TABLE IF NOT EXISTS responses ('
+                    'key TEXT PRIMARY KEY, '
+                    'expires_at REAL NOT NULL, '
+                    'response TEXT NOT NULL)')
+                self._execute(
+                    'DELETE FROM responses WHERE expires_at < ?',
+                    (time.time(),))
+            except sqlite3.Error as e:
+                LOGGER.debug('Response cache database disabled: %s' % e)
+                self.db_path = None
+
+    def _execute(self, statement, parameters=()):
+        """Run a statement in its own transaction on the SQLite database.
+
+        :return: First row of the result.
+        :rtype: tuple
+        """
+        connection = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            with connection:
+                return connection.execute(statement, parameters).fetchone()
+        finally:
+            connection.close()
+
+    def get(self, key):
+        """Get a cached response.
+
+        A new object is returned on every call, so callers can modify it
+        without altering the cache.
+
+        :param key: Request fingerprint.
+        :type key: str
+
+        :return: The response or None if not cached or expired.
+        :rtype: dict, list
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and entry[0] < now:
+                del self._memory[key]
+                entry = None
+            if not entry and self.db_path:
+                try:
+                    row = self._execute(
+                        'SELECT expires_at, response FROM responses '
+                        'WHERE key = ? AND expires_at >= ?',
+                        (key, now))
+                except sqlite3.Error as e:
+                    LOGGER.debug('Response cache read failed: %s' % e)
+                    row = None
+                if row:
+                    entry = tuple(row)
+                    self._memory[key] = entry
+        if entry:
+            return json.loads(entry[1])
+        return None
+
+    def put(self, key, response):
+        """Store a response.
+
+        :param key: Request fingerprint.
+        :type key: str
+
+        :param response: JSON serializable response.
+        :type response: dict, list
+        """
+        entry = (time.time() + self.ttl, json.dumps(response))
+        with self._lock:
+            self._memory[key] = entry
+            if self.db_path:
+                try:
+                    self._execute(
+                        'INSERT OR REPLACE INTO responses '
+                        '(key, expires_at, response) VALUES (?, ?, ?)',
+                        (key,) + entry)
+                except sqlite3.Error as e:
+                    LOGGER.debug('Response cache write failed: %s' % e)
+
+    def invalidate(self, key=None):
+        """Remove cached responses.
+
+        :param key: Request fingerprint. Remove every response if not given.
+        :type key: str
+        """
+        with self._lock:
+            if key is None:
+                self._memory.clear()
+            else:
+                self._memory.pop(key, None)
+            if self.db_path:
+                try:
+                    if key is None:
+                        self._execute('DELETE FROM responses')
+                    else:
+                        self._execute(
+                            'DELETE FROM responses WHERE key = ?', (key,))
+                except sqlite3.Error as e:
+                    LOGGER.debug('Response cache invalidation failed: %s' % e)
+
+
+COVERAGE_CACHE = ResponseCache(ttl=COVERAGE_CACHE_TTL)
@@ -0,0 +1,96 @@
+# coding=utf-8
+"""Shared HTTP session used by the Bridge API clients.
+
+Every API client sends its requests through a single ``requests.Session``
+so that TCP and TLS connections to the identity and bridge servers are
+kept alive and reused instead of being re-established for every call.
+"""
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+from geosys.bridge_api.default import (
+    DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE, DEFAULT_POOL_BLOCK)
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+_lock = threading.Lock()
+_session = None
+_pool_options = {
+    'pool_connections': DEFAULT_POOL_CONNECTIONS,
+    'pool_maxsize': DEFAULT_POOL_MAXSIZE,
+    'pool_block': DEFAULT_POOL_BLOCK
+}
+
+
+def _create_session():
+    """Create a session with pooled adapters mounted.
+
+    :return: New HTTP session.
+    :rtype: requests.Session
+    """
+    session = Session()
+    # Clients authenticate with bearer tokens, so server cookies are not
+    # carried over between calls of different clients.
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(**_pool_options)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Get the shared HTTP session, creating it on first use.
+
+    :return: The shared HTTP session.
+    :rtype: requests.Session
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _create_session()
+        return _session
+
+
+def configure_session(
+        pool_connections=None, pool_maxsize=None, pool_block=None):
+    """Configure the connection pool of the shared session.
+
+    The current session is closed and a new one is created lazily with the
+    updated pool options.
+
+    :param pool_connections: Number of per-host connection pools to cache.
+    :type pool_connections: int
+
+    :param pool_maxsize: Maximum number of connections kept open per host.
+    :type pool_maxsize: int
+
+    :param pool_block: Whether requests wait for a free connection when the
+        per-host limit is reached instead of opening a throwaway one.
+    :type pool_block: bool
+    """
+    global _session
+    with _lock:
+        if pool_connections is not None:
+            _pool_options['pool_connections'] = pool_connections
+        if pool_maxsize is not None:
+            _pool_options['pool_maxsize'] = pool_maxsize
+        if pool_block is not None:
+            _pool_options['pool_block'] = pool_block
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def close_session():
+    """Close the shared session and release its pooled connections."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,160 @@
+# coding=utf-8
+"""Bridge API abstract client test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+import unittest
+from unittest import mock
+
+from requests import ConnectionError
+
+from geosys.bridge_api.api_abstract import ApiClient
+from geosys.bridge_api.token_store import TOKEN_STORE
+from geosys.bridge_api_wrapper import BridgeAPI
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+HEADERS = {'accept': 'application/json'}
+
+
+class FakeResponse(object):
+    """Response of the fake session."""
+
+    def __init__(self, status_code, json_data=None):
+        self.status_code = status_code
+        self.json_data = json_data
+        self.content = b''
+        self.headers = {}
+
+    def json(self):
+        return self.json_data
+
+
+class FakeSession(object):
+    """Session answering with the given status codes in turn."""
+
+    def __init__(self, status_codes):
+        self.status_codes = list(status_codes)
+        self.authorizations = []
+
+    def post(self, url, headers=None, **kwargs):
+        self.authorizations.append(headers['authorization'])
+        return FakeResponse(self.status_codes.pop(0), {})
+
+    get = post
+
+
+class ApiClientTokenRenewalTest(unittest.TestCase):
+    """Test rejected access tokens are renewed."""
+
+    def client(self, status_codes, token_renewer):
+        """API client sending its requests to a fake session."""
+        session = FakeSession(status_codes)
+        client = ApiClient('old', 'https://example.com', token_renewer)
+        patcher = mock.patch.object(
+            ApiClient, 'session', new_callable=mock.PropertyMock,
+            return_value=session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return client, session
+
+    def test_renew_rejected_token(self):
+        """Test a request rejected with 401 is sent again once renewed."""
+        renewer = mock.Mock(return_value='new')
+        client, session = self.client([401, 200], renewer)
+
+        response = client.post('https://example.com', headers=dict(HEADERS))
+        self.assertEqual(response.status_code, 200)
+        renewer.assert_called_once_with('old')
+        self.assertEqual(
+            session.authorizations, ['Bearer old', 'Bearer new'])
+        self.assertEqual(client.headers['authorization'], 'Bearer new')
+
+    def test_renewal_failed(self):
+        """Test the rejected response is returned when renewal fails."""
+        renewer = mock.Mock(return_value=None)
+        client, session = self.client([401], renewer)
+
+        response = client.get('https://example.com', headers=dict(HEADERS))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(session.authorizations, ['Bearer old'])
+
+    def test_accepted_token(self):
+        """Test the token is not renewed when the request is accepted."""
+        renewer = mock.Mock(return_value='new')
+        client, session = self.client([200], renewer)
+
+        client.post('https://example.com', headers=dict(HEADERS))
+        renewer.assert_not_called()
+
+
+class BridgeAPIAuthenticationTest(unittest.TestCase):
+    """Test the wrapper falls back to a password grant."""
+
+    def setUp(self):
+        """Runs before each test."""
+        TOKEN_STORE.invalidate()
+        patcher = mock.patch(
+            'geosys.bridge_api_wrapper.ConnectionAPIClient')
+        self.connection_client = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.addCleanup(TOKEN_STORE.invalidate)
+
+    def bridge_api(self):
+        """Bridge API wrapper of a test account."""
+        return BridgeAPI(
+            'user', 'password', 'na', 'mapproduct_api', 'secret')
+
+    def test_failed_refresh(self):
+        """Test a refresh token error falls back to the password grant."""
+        self.connection_client.get_access_token.return_value = {
+            'access_token': 'first',
+            'refresh_token': 'refresh',
+            'expires_in': 0
+        }
+        self.bridge_api()
+
+        self.connection_client.refresh_access_token.side_effect = (
+            ConnectionError('reset'))
+        self.connection_client.get_access_token.return_value = {
+            'access_token': 'second',
+            'expires_in': 3600
+        }
+        bridge_api = self.bridge_api()
+        self.assertEqual(bridge_api.access_token, 'second')
+        self.assertEqual(
+            self.connection_client.get_access_token.call_count, 2)
+
+    def test_renew_access_token(self):
+        """Test a rejected token is replaced by a new password grant."""
+        self.connection_client.get_access_token.return_value = {
+            'access_token': 'first',
+            'expires_in': 3600
+        }
+        bridge_api = self.bridge_api()
+
+        self.connection_client.get_access_token.return_value = {
+            'access_token': 'second',
+            'expires_in': 3600
+        }
+        self.assertEqual(bridge_api.renew_access_token('first'), 'second')
+        self.assertEqual(
+            bridge_api.headers['authorization'], 'Bearer second')
+
+        # A client rejected with the first token gets the renewed one.
+        self.assertEqual(bridge_api.renew_access_token('first'), 'second')
+        self.assertEqual(
+            self.connection_client.get_access_token.call_count, 2)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ApiClientTokenRenewalTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,87 @@
+# coding=utf-8
+"""Bridge API content cache test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from geosys.bridge_api.content_cache import ContentCache
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+
+class ContentCacheTest(unittest.TestCase):
+    """Test Bridge API content cache works."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def test_put_and_get(self):
+        """Test we can store and retrieve a content."""
+        cache = ContentCache(self.directory, max_size=1024, max_age=60)
+        cache.put('http://thumbnail/1.png', b'image', etag='"abc"')
+
+        entry = cache.get('http://thumbnail/1.png')
+        self.assertEqual(entry['content'], b'image')
+        self.assertEqual(entry['etag'], '"abc"')
+        self.assertTrue(cache.is_fresh(entry))
+        self.assertIsNone(cache.get('http://thumbnail/2.png'))
+
+        # Entries persist across cache instances.
+        cache = ContentCache(self.directory, max_size=1024, max_age=0)
+        entry = cache.get('http://thumbnail/1.png')
+        self.assertEqual(entry['content'], b'image')
+        self.assertFalse(cache.is_fresh(entry))
+
+    def test_namespaces(self):
+        """Test contents of other namespaces are not served."""
+        cache = ContentCache(self.directory, max_size=1024, max_age=60)
+        cache.put('http://thumbnail/1.png', b'first', namespace='na|user1')
+        cache.put('http://thumbnail/1.png', b'second', namespace='na|user2')
+
+        entry = cache.get('http://thumbnail/1.png', 'na|user1')
+        self.assertEqual(entry['content'], b'first')
+        entry = cache.get('http://thumbnail/1.png', 'na|user2')
+        self.assertEqual(entry['content'], b'second')
+        self.assertIsNone(cache.get('http://thumbnail/1.png'))
+
+    def test_lru_eviction(self):
+        """Test least recently used entries are evicted first."""
+        cache = ContentCache(self.directory, max_size=20, max_age=60)
+        cache.put('http://thumbnail/1.png', b'0123456789')
+        cache.put('http://thumbnail/2.png', b'0123456789')
+
+        # Make the first entry the most recently used one.
+        old_time = time.time() - 100
+        os.utime(
+            os.path.join(
+                self.directory, cache.key('http://thumbnail/2.png')),
+            (old_time, old_time))
+        self.assertIsNotNone(cache.get('http://thumbnail/1.png'))
+
+        cache.put('http://thumbnail/3.png', b'0123456789')
+        self.assertIsNotNone(cache.get('http://thumbnail/1.png'))
+        self.assertIsNone(cache.get('http://thumbnail/2.png'))
+        self.assertIsNotNone(cache.get('http://thumbnail/3.png'))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ContentCacheTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
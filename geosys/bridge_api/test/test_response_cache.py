@@ -0,0 +1,94 @@
+# coding=utf-8
+"""Bridge API response cache test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from geosys.bridge_api.response_cache import (
+    ResponseCache, request_fingerprint)
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+
+class ResponseCacheTest(unittest.TestCase):
+    """Test Bridge API response cache works."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def test_request_fingerprint(self):
+        """Test fingerprint does not depend on the order of the keys."""
+        first = request_fingerprint(
+            'url', {'Crop': {'Id': 'CORN'}, 'SowingDate': '2018-04-15'})
+        second = request_fingerprint(
+            'url', {'SowingDate': '2018-04-15', 'Crop': {'Id': 'CORN'}})
+        other = request_fingerprint(
+            'url', {'SowingDate': '2018-04-16', 'Crop': {'Id': 'CORN'}})
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+
+    def test_put_and_get(self):
+        """Test cached responses are returned as copies."""
+        cache = ResponseCache(ttl=60)
+        cache.put('key', [{'coverageType': 'CLEAR'}])
+
+        response = cache.get('key')
+        self.assertEqual(response, [{'coverageType': 'CLEAR'}])
+
+        response.append({})
+        self.assertEqual(len(cache.get('key')), 1)
+        self.assertIsNone(cache.get('unknown'))
+
+    def test_expiry(self):
+        """Test expired responses are not returned."""
+        cache = ResponseCache(ttl=-1)
+        cache.put('key', [])
+        self.assertIsNone(cache.get('key'))
+
+    def test_invalidate(self):
+        """Test responses can be invalidated."""
+        cache = ResponseCache(ttl=60)
+        cache.put('first', [])
+        cache.put('second', [])
+
+        cache.invalidate('first')
+        self.assertIsNone(cache.get('first'))
+        self.assertEqual(cache.get('second'), [])
+
+        cache.invalidate()
+        self.assertIsNone(cache.get('second'))
+
+    def test_database(self):
+        """Test responses survive in the database."""
+        db_path = os.path.join(self.directory, 'coverage.sqlite')
+        cache = ResponseCache(ttl=60, db_path=db_path)
+        cache.put('key', [{'Id': 'image'}])
+
+        new_cache = ResponseCache(ttl=60, db_path=db_path)
+        self.assertEqual(new_cache.get('key'), [{'Id': 'image'}])
+
+        new_cache.invalidate()
+        self.assertIsNone(
+            ResponseCache(ttl=60, db_path=db_path).get('key'))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ResponseCacheTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
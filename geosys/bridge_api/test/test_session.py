@@ -0,0 +1,57 @@
+# coding=utf-8
+"""Bridge API shared session test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+import unittest
+
+from geosys.bridge_api.connection import ConnectionAPIClient
+from geosys.bridge_api.default import (
+    DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE)
+from geosys.bridge_api.field_level_maps import FieldLevelMapsAPIClient
+from geosys.bridge_api.session import (
+    get_session, configure_session, close_session)
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+
+class BridgeAPISessionTest(unittest.TestCase):
+    """Test Bridge API clients share a pooled session."""
+
+    def tearDown(self):
+        """Runs after each test."""
+        configure_session(
+            pool_connections=DEFAULT_POOL_CONNECTIONS,
+            pool_maxsize=DEFAULT_POOL_MAXSIZE)
+        close_session()
+
+    def test_clients_share_session(self):
+        """Test every API client uses the same session."""
+        connection_client = ConnectionAPIClient()
+        maps_client = FieldLevelMapsAPIClient('token')
+        self.assertIs(connection_client.session, maps_client.session)
+        self.assertIs(maps_client.session, get_session())
+
+    def test_configure_session(self):
+        """Test pool options are applied to a new session."""
+        old_session = get_session()
+        configure_session(pool_connections=2, pool_maxsize=5)
+        session = get_session()
+        self.assertIsNot(old_session, session)
+
+        adapter = session.get_adapter('https://api.geosys-na.net')
+        self.assertEqual(adapter._pool_connections, 2)
+        self.assertEqual(adapter._pool_maxsize, 5)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(BridgeAPISessionTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,89 @@
+# coding=utf-8
+"""Bridge API token store test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+import unittest
+
+from geosys.bridge_api.token_store import TokenStore
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+
+class TokenStoreTest(unittest.TestCase):
+    """Test Bridge API token store works."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.store = TokenStore(expiry_margin=60)
+        self.key = TokenStore.key('na', 'user', 'mapproduct_api', True)
+        self.digest = TokenStore.credentials_digest('password', 'secret')
+
+    def test_reuse_valid_token(self):
+        """Test a valid access token is handed out again."""
+        self.store.store(self.key, self.digest, {
+            'access_token': 'access',
+            'refresh_token': 'refresh',
+            'expires_in': 3600
+        })
+        self.assertEqual(
+            self.store.access_token(self.key, self.digest), 'access')
+        self.assertEqual(
+            self.store.refresh_token(self.key, self.digest), 'refresh')
+
+    def test_expiring_token(self):
+        """Test an access token close to its expiry is not handed out."""
+        self.store.store(self.key, self.digest, {
+            'access_token': 'access',
+            'refresh_token': 'refresh',
+            'expires_in': 30
+        })
+        self.assertIsNone(self.store.access_token(self.key, self.digest))
+        self.assertEqual(
+            self.store.refresh_token(self.key, self.digest), 'refresh')
+
+    def test_changed_credentials(self):
+        """Test tokens are not handed out for other credentials."""
+        self.store.store(self.key, self.digest, {
+            'access_token': 'access',
+            'refresh_token': 'refresh',
+            'expires_in': 3600
+        })
+        digest = TokenStore.credentials_digest('new password', 'secret')
+        self.assertIsNone(self.store.access_token(self.key, digest))
+        self.assertIsNone(self.store.refresh_token(self.key, digest))
+
+        other_key = TokenStore.key('na', 'user', 'mapproduct_api', False)
+        self.assertIsNone(self.store.access_token(other_key, self.digest))
+
+    def test_keep_refresh_token(self):
+        """Test the refresh token is kept when it is not rotated."""
+        self.store.store(self.key, self.digest, {
+            'access_token': 'access',
+            'refresh_token': 'refresh',
+            'expires_in': 3600
+        })
+        self.store.store(self.key, self.digest, {
+            'access_token': 'renewed',
+            'expires_in': 3600
+        })
+        self.assertEqual(
+            self.store.access_token(self.key, self.digest), 'renewed')
+        self.assertEqual(
+            self.store.refresh_token(self.key, self.digest), 'refresh')
+
+        self.store.invalidate(self.key)
+        self.assertIsNone(self.store.refresh_token(self.key, self.digest))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TokenStoreTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,171 @@
+# coding=utf-8
+"""Process-wide store of Bridge API access tokens.
+
+Tokens returned by the identity server are kept per account so that new
+``BridgeAPI`` instances can reuse a still valid access token, or renew it
+with the ``offline_access`` refresh token, instead of running a password
+grant every time.
+"""
+import hashlib
+import threading
+import time
+
+from geosys.bridge_api.default import TOKEN_EXPIRY_MARGIN
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+
+class TokenStore(object):
+    """Thread-safe cache of identity server token responses."""
+
+    def __init__(self, expiry_margin=TOKEN_EXPIRY_MARGIN):
+        """Thread-safe cache of identity server token responses.
+
+        :param expiry_margin: Seconds before the reported expiry at which an
+            access token is no longer handed out.
+        :type expiry_margin: int
+        """
+        self.expiry_margin = expiry_margin
+        self._tokens = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(region, username, client_id, use_testing_service):
+        """Key identifying the account a token belongs to.
+
+        :param region: Region of fields.
+        :type region: str
+
+        :param username: Bridge API username.
+        :type username: str
+
+        :param client_id: Client ID
+        :type client_id: str
+
+        :param use_testing_service: Testing service flag.
+        :type use_testing_service: bool
+
+        :return: Token store key.
+        :rtype: tuple
+        """
+        return (
+            region, username, client_id,
+            'test' if use_testing_service else 'prod')
+
+    @staticmethod
+    def credentials_digest(password, client_secret):
+        """Digest of the secrets a token was granted for.
+
+        Only the digest is kept, so a token is not handed out again once the
+        password or client secret of the account has changed.
+
+        :param password: Bridge API password.
+        :type password: str
+
+        :param client_secret: Client Secret
+        :type client_secret: str
+
+        :return: Hex digest of the secrets.
+        :rtype: str
+        """
+        secrets = '{}\n{}'.format(password or '', client_secret or '')
+        return hashlib.sha256(secrets.encode('utf-8')).hexdigest()
+
+    def lock(self, key):
+        """Lock serializing authentication of a single account.
+
+        :param key: Token store key.
+        :type key: tuple
+
+        :return: The account lock.
+        :rtype: threading.Lock
+        """
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _entry(self, key, digest):
+        """Get the stored entry if it was granted for the same secrets."""
+        with self._lock:
+            entry = self._tokens.get(key)
+        if entry and entry['digest'] == digest:
+            return entry
+        return None
+
+    def access_token(self, key, digest):
+        """Get a stored access token which is not about to expire.
+
+        :param key: Token store key.
+        :type key: tuple
+
+        :param digest: Credentials digest, see credentials_digest.
+        :type digest: str
+
+        :return: The access token or None.
+        :rtype: str
+        """
+        entry = self._entry(key, digest)
+        if entry and entry['expires_at'] > time.time() + self.expiry_margin:
+            return entry['access_token']
+        return None
+
+    def refresh_token(self, key, digest):
+        """Get the stored refresh token of an account.
+
+        :param key: Token store key.
+        :type key: tuple
+
+        :param digest: Credentials digest, see credentials_digest.
+        :type digest: str
+
+        :return: The refresh token or None.
+        :rtype: str
+        """
+        entry = self._entry(key, digest)
+        return entry['refresh_token'] if entry else None
+
+    def store(self, key, digest, response):
+        """Store an identity server token response.
+
+        :param key: Token store key.
+        :type key: tuple
+
+        :param digest: Credentials digest, see credentials_digest.
+        :type digest: str
+
+        :param response: JSON response of the /connect/token endpoint.
+        :type response: dict
+        """
+        # A response without expires_in is used once and not reused.
+        expires_in = response.get('expires_in') or 0
+        with self._lock:
+            previous = self._tokens.get(key) or {}
+            if previous.get('digest') != digest:
+                previous = {}
+            self._tokens[key] = {
+                'digest': digest,
+                'access_token': response['access_token'],
+                # Identity servers may not rotate the refresh token.
+                'refresh_token': (
+                    response.get('refresh_token') or
+                    previous.get('refresh_token')),
+                'expires_at': time.time() + int(expires_in)
+            }
+
+    def invalidate(self, key=None):
+        """Remove stored tokens.
+
+        :param key: Token store key. Remove every token if not given.
+        :type key: tuple
+        """
+        with self._lock:
+            if key is None:
+                self._tokens.clear()
+            else:
+                self._tokens.pop(key, None)
+
+
+TOKEN_STORE = TokenStore()
@@ -1,11 +1,17 @@
 # coding=utf-8
 """Implementation of Bridge API Wrapper.
 """
+import logging
+
+from requests import RequestException
+
 from geosys.bridge_api.api_abstract import ApiClient
 from geosys.bridge_api.connection import ConnectionAPIClient
 from geosys.bridge_api.default import IDENTITY_URLS, BRIDGE_URLS, ALL_REGIONS
 from geosys.bridge_api.definitions import CROPS, SAMZ
 from geosys.bridge_api.field_level_maps import FieldLevelMapsAPIClient
+from geosys.bridge_api.response_cache import COVERAGE_CACHE
+from geosys.bridge_api.token_store import TOKEN_STORE
 from geosys.bridge_api.utilities import get_definition
 
 from geosys.bridge_api.definitions import SAMPLE_MAP
@@ -15,6 +21,8 @@ __license__ = "GPL version 3"
 __email__ = "rohmat@kartoza.com"
 __revision__ = "$Format:%H$"
 
+LOGGER = logging.getLogger('geosys')
+
 
 class AuthenticationError(BaseException):
     """Error when oauth token is missing for an authenticated request.
@@ -149,33 +157,118 @@ class BridgeAPI(ApiClient):
             regions.append((region['key'], region['description']))
         return regions
 
+    @property
+    def cache_namespace(self):
+        """Namespace of the cached responses of this account.
+
+        :return: The cache namespace.
+        :rtype: str
+        """
+        return '|'.join(str(part) for part in TOKEN_STORE.key(
+            self.region, self.username, self.client_id,
+            self.use_testing_service))
+
     def authenticate(self):
         """Authenticate user using given credentials.
 
+        A valid access token of the same account is reused from the token
+        store. An expired one is renewed with its refresh token, and only
+        when that fails a new password grant is requested.
+
         :return: Authentication status and message.
         :rtype: tuple
         """
         try:
             api_client = ConnectionAPIClient(self.identity_server)
-            response = api_client.get_access_token(
-                self.username,
-                self.password,
-                self.client_id,
-                self.client_secret)
-            if response.get('access_token'):
-                self.access_token = response['access_token']
-                message = 'Authentication succeeded.'
-                return True, message
-            else:
-                message = (
-                    'Ensure your username, password, client id, and client '
-                    'secret are valid for the selected region service and then'
-                    'try again.')
-                return False, message
+            key = TOKEN_STORE.key(
+                self.region, self.username, self.client_id,
+                self.use_testing_service)
+            digest = TOKEN_STORE.credentials_digest(
+                self.password, self.client_secret)
+
+            with TOKEN_STORE.lock(key):
+                access_token = TOKEN_STORE.access_token(key, digest)
+                if access_token:
+                    self.access_token = access_token
+                    message = 'Authentication succeeded.'
+                    return True, message
+
+                response = {}
+                refresh_token = TOKEN_STORE.refresh_token(key, digest)
+                if refresh_token:
+                    try:
+                        response = api_client.refresh_access_token(
+                            refresh_token, self.client_id,
+                            self.client_secret)
+                    except (KeyError, ValueError, RequestException) as e:
+                        # Fall back to the password grant
+                        LOGGER.debug(
+                            'Unable to refresh the access token: %s' % e)
+                        response = {}
+                if not response.get('access_token'):
+                    response = api_client.get_access_token(
+                        self.username,
+                        self.password,
+                        self.client_id,
+                        self.client_secret)
+
+                if response.get('access_token'):
+                    TOKEN_STORE.store(key, digest, response)
+                    self.access_token = response['access_token']
+                    message = 'Authentication succeeded.'
+                    return True, message
+                else:
+                    TOKEN_STORE.invalidate(key)
+                    message = (
+                        'Ensure your username, password, client id, and '
+                        'client secret are valid for the selected region '
+                        'service and then try again.')
+                    return False, message
         except KeyError:
             message = 'Please enter a correct region (NA or EU)'
             return False, message
 
+    def renew_access_token(self, rejected_token=None):
+        """Renew an access token rejected by the server.
+
+        The rejected token is dropped from the token store and the user is
+        authenticated again. Clients rejected with the same token at the
+        same time share the token of the first renewal.
+
+        :param rejected_token: The access token answered with 401.
+        :type rejected_token: str
+
+        :return: The new access token, None if the authentication failed.
+        :rtype: str
+        """
+        key = TOKEN_STORE.key(
+            self.region, self.username, self.client_id,
+            self.use_testing_service)
+        digest = TOKEN_STORE.credentials_digest(
+            self.password, self.client_secret)
+        with TOKEN_STORE.lock(key):
+            stored_token = TOKEN_STORE.access_token(key, digest)
+            if stored_token is None or stored_token == rejected_token:
+                TOKEN_STORE.invalidate(key)
+
+        if not self.refresh_authentication():
+            return None
+        return self.access_token
+
+    def refresh_authentication(self):
+        """Make sure the access token is not about to expire.
+
+        Clients shared by long running jobs call it before each job. The
+        stored token is kept while it is valid, an expiring one is renewed.
+
+        :return: Whether the user is authenticated.
+        :rtype: bool
+        """
+        self.authenticated, self.authentication_message = self.authenticate()
+        if self.authenticated:
+            self.set_access_token(self.access_token)
+        return self.authenticated
+
     def get_coverage(self, geometry, crop, sowing_date, filters=None):
         """Get fields coverage for given parameters.
 
@@ -209,7 +302,10 @@ class BridgeAPI(ApiClient):
         }
 
         api_client = FieldLevelMapsAPIClient(
-            self.access_token, self.bridge_server)
+            self.access_token, self.bridge_server,
+            response_cache=COVERAGE_CACHE,
+            cache_namespace=self.cache_namespace,
+            token_renewer=self.renew_access_token)
         coverages_json = api_client.get_coverage(request_data, filters=filters)
 
         return coverages_json
@@ -248,7 +344,10 @@ class BridgeAPI(ApiClient):
         }
 
         api_client = FieldLevelMapsAPIClient(
-            self.access_token, self.bridge_server)
+            self.access_token, self.bridge_server,
+            response_cache=COVERAGE_CACHE,
+            cache_namespace=self.cache_namespace,
+            token_renewer=self.renew_access_token)
         coverages_json = api_client.get_catalog_imagery(request_data, filters=filters)
 
         return coverages_json
@@ -283,7 +382,8 @@ class BridgeAPI(ApiClient):
         :rtype: dict
         """
         api_client = FieldLevelMapsAPIClient(
-            self.access_token, self.bridge_server)
+            self.access_token, self.bridge_server,
+            token_renewer=self.renew_access_token)
         field_map_json = api_client.get_field_map(
             map_type_key,
             request_data,
@@ -304,7 +404,8 @@ class BridgeAPI(ApiClient):
         :rtype: dict
         """
         api_client = FieldLevelMapsAPIClient(
-            self.access_token, self.bridge_server)
+            self.access_token, self.bridge_server,
+            token_renewer=self.renew_access_token)
         map_json = api_client.get_hotspot(
             url)
 
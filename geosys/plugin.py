@@ -36,6 +36,7 @@ from PyQt5.QtWidgets import QAction
 
 from qgis.core import QgsApplication
 
+from geosys.bridge_api.session import close_session
 from geosys.processing.geosys_processing_provider import (
     GeosysProcessingProvider
 )
@@ -199,6 +200,12 @@ class GeosysPlugin:
         # Add custom processing tools
         self.initProcessing()
 
+        # import here only so that it is AFTER i18n set up
+        from geosys.ui.widgets.geosys_coverage_downloader import (
+            setup_coverage_cache, setup_http_session)
+        setup_http_session()
+        setup_coverage_cache()
+
     # ---------------------------------------------------------------------
 
     def onClosePlugin(self):
@@ -230,6 +237,13 @@ class GeosysPlugin:
         # remove the toolbar
         del self.toolbar
 
+        # stop the background map creation
+        if self.dock_widget is not None:
+            self.dock_widget.map_creation_queue.cancel()
+
+        # release pooled Bridge API connections
+        close_session()
+
     # ---------------------------------------------------------------------
 
     def run(self):
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+
+"""
+/***************************************************************************
+ GeosysProcessingProvider
+                                 A QGIS plugin
+ GeosysProcessingProvider
+ Generated by Plugin Builder: http://g-sherman.github.io/Qgis-Plugin-Builder/
+                              -------------------
+        begin                : 2019-03-30
+        copyright            : (C) 2019 by Kartoza Pty. Ltd
+        email                : rohmat@kartoza.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from PyQt5.QtCore import QVariant
+from qgis.core import (
+    QgsFeature,
+    QgsFeatureSink,
+    QgsField,
+    QgsFields,
+    QgsProcessingException,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterField,
+    QgsProcessingParameterFolderDestination,
+    QgsCoordinateReferenceSystem,
+    QgsWkbTypes)
+
+from geosys.bridge_api.default import TIFF_EXT
+from geosys.bridge_api_wrapper import BridgeAPI
+from geosys.processing.geosys_processing_algorithm import (
+    MapCoverageDownloader)
+from geosys.ui.widgets.geosys_coverage_downloader import (
+    credentials_parameters_from_settings)
+from geosys.utilities.gui_utilities import (
+    prepare_geometry, reprojected_features)
+from geosys.utilities.qgis_settings import QGISSettings
+from geosys.utilities.run_manifest import RunManifest
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+# Status of a field in the summary table
+STATUS_DOWNLOADED = 'downloaded'
+STATUS_NO_COVERAGE = 'no coverage'
+STATUS_INVALID = 'invalid geometry'
+STATUS_FAILED = 'failed'
+
+
+class BatchMapCoverageDownloader(MapCoverageDownloader):
+    """Processing algorithm downloading a map for every input feature.
+
+    Each feature is a field of its own: the coverage searches and map
+    downloads of the fields run concurrently and every field gets its own
+    output, listed in a summary table. The fields are recorded in the run
+    manifest of the output directory, so a run started again skips the
+    fields already downloaded.
+    """
+
+    FIELD_ID = 'FIELD_ID'
+    OUTPUT_DIRECTORY = 'OUTPUT_DIRECTORY'
+    SUMMARY = 'SUMMARY'
+
+    def createInstance(self):
+        """BatchMapCoverageDownloader instance."""
+        return BatchMapCoverageDownloader()
+
+    def name(self):
+        """Unique name of the algorithm.
+
+        Returns the algorithm name, used for identifying the algorithm. This
+        string should be fixed for the algorithm, and must not be localised.
+        The name should be unique within each provider. Names should contain
+        lowercase alphanumeric characters only and no spaces or other
+        formatting characters.
+        """
+        return 'geosys_get_field_level_map_per_feature'
+
+    def displayName(self):
+        """Display name of the algorithm.
+
+        Returns the translated algorithm name, which should be used for any
+        user-visible display of the algorithm name.
+        """
+        return self.tr('Get field level map per feature')
+
+    def initAlgorithm(self, config=None):
+        """Algorithm initialisation.
+
+        Here we define the inputs and output of the algorithm, along
+        with some other properties.
+        """
+        self.init_coverage_parameters()
+
+        # Attribute used to name the output of every field.
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.FIELD_ID,
+                self.tr('Field identifier'),
+                parentLayerParameterName=self.INPUT,
+                optional=True
+            )
+        )
+
+        # Directory where the map of every field will be placed.
+        self.addParameter(
+            QgsProcessingParameterFolderDestination(
+                self.OUTPUT_DIRECTORY,
+                self.tr('Output directory')
+            )
+        )
+
+        # Table with the outcome of every field.
+        self.addParameter(
+            QgsProcessingParameterFeatureSink(
+                self.SUMMARY,
+                self.tr('Summary')
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        """Here is where the processing itself takes place.
+        """
+        # Retrieve the feature source.
+        source = self.parameterAsSource(parameters, self.INPUT, context)
+        field_id = self.parameterAsString(parameters, self.FIELD_ID, context)
+
+        filters = self.coverage_filters(parameters, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
+        output_directory = self.parameterAsString(
+            parameters, self.OUTPUT_DIRECTORY, context)
+        if not os.path.exists(output_directory):
+            os.makedirs(output_directory)
+
+        fields = QgsFields()
+        for name in ['feature_id', 'status', 'image_date', 'output',
+                     'message']:
+            fields.append(QgsField(name, QVariant.String))
+        (sink, summary_id) = self.parameterAsSink(
+            parameters, self.SUMMARY, context, fields,
+            QgsWkbTypes.NoGeometry, source.sourceCrs())
+        if sink is None:
+            raise QgsProcessingException(
+                self.invalidSinkError(parameters, self.SUMMARY))
+
+        # Every request shares the authenticated client.
+        bridge_api = BridgeAPI(
+            *credentials_parameters_from_settings(),
+            proxies=QGISSettings.get_qgis_proxy())
+
+        manifest = RunManifest(output_directory)
+        total = source.featureCount()
+        executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        futures = {}
+        output_names = set()
+        try:
+            # Features are reprojected to EPSG:4326 as they are read
+            for feature in reprojected_features(
+                    source, QgsCoordinateReferenceSystem('EPSG:4326')):
+                if feedback.isCanceled():
+                    break
+                feature_id = (
+                    feature[field_id] if field_id else feature.id())
+                if not feature.hasGeometry() or not (
+                        feature.geometry().isGeosValid()):
+                    self.add_summary(
+                        sink, feature_id, STATUS_INVALID)
+                    continue
+                output_name = self.output_name(
+                    feature_id, feature.id(), output_names)
+                output_path = os.path.join(output_directory, output_name)
+                geometry_wkt = prepare_geometry(feature.geometry())
+                key = RunManifest.key(
+                    geometry_wkt, filters, self.crop_type, self.sowing_date,
+                    output_name)
+                if manifest.is_done(key):
+                    item = manifest.get(key)
+                    feedback.pushInfo('{}: {} already downloaded.'.format(
+                        feature_id, output_path))
+                    self.add_summary(
+                        sink, feature_id, STATUS_DOWNLOADED,
+                        item['details'].get('image_date'), output_path,
+                        item['message'])
+                    continue
+                manifest.start(
+                    key, {'feature_id': str(feature_id)}, [output_name])
+                future = executor.submit(
+                    self.process_field, geometry_wkt, filters,
+                    output_path, bridge_api, self.job_feedback(feedback))
+                futures[future] = (feature_id, key)
+
+            skipped = total - len(futures)
+            for done, future in enumerate(as_completed(futures), skipped):
+                feature_id, key = futures[future]
+                try:
+                    status, image_date, output_path, message = \
+                        future.result()
+                except Exception as e:
+                    status, image_date, output_path, message = (
+                        STATUS_FAILED, None, None, str(e))
+                    feedback.reportError(
+                        '{}: {}'.format(feature_id, message))
+                else:
+                    if status == STATUS_FAILED:
+                        feedback.reportError(
+                            '{}: {}'.format(feature_id, message))
+                    else:
+                        feedback.pushInfo('{}: {}'.format(
+                            feature_id, output_path or status))
+                if status == STATUS_DOWNLOADED:
+                    manifest.complete(key, details={'image_date': image_date})
+                else:
+                    # Fields without a map are searched again next run.
+                    manifest.fail(key, message)
+                self.add_summary(
+                    sink, feature_id, status, image_date, output_path,
+                    message)
+
+                feedback.setProgressText(
+                    'Processed {} of {} fields...'.format(done + 1, total))
+                if total:
+                    feedback.setProgress(int(100.0 * (done + 1) / total))
+
+                # Stop the algorithm if cancel button has been clicked
+                if feedback.isCanceled():
+                    break
+        finally:
+            # Fields not started yet are skipped when canceled.
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+        return {
+            self.OUTPUT_DIRECTORY: output_directory,
+            self.SUMMARY: summary_id
+        }
+
+    @staticmethod
+    def output_name(feature_id, fid, output_names):
+        """File name of the map of a field.
+
+        :param feature_id: Identifier of the field.
+        :type feature_id: str
+
+        :param fid: Feature id, used to tell apart duplicated identifiers.
+        :type fid: int
+
+        :param output_names: Names already used by other fields.
+        :type output_names: set
+
+        :return: The file name.
+        :rtype: str
+        """
+        name = re.sub(r'[^\w\-]+', '_', str(feature_id)).strip('_')
+        name = name or str(fid)
+        if name in output_names:
+            name = '{}_{}'.format(name, fid)
+        output_names.add(name)
+        return name + TIFF_EXT
+
+    def process_field(
+            self, geometry_wkt, filters, output_path, bridge_api,
+            feedback=None):
+        """Search the coverage of a field and download its map.
+
+        :param geometry_wkt: Geometry of the field in WKT format.
+        :type geometry_wkt: str
+
+        :param filters: Coverage search filters.
+        :type filters: dict
+
+        :param output_path: Output path of the map.
+        :type output_path: str
+
+        :param bridge_api: Authenticated Bridge API client.
+        :type bridge_api: BridgeAPI
+
+        :param feedback: Feedback canceling the download, see job_feedback.
+        :type feedback: QgsFeedback
+
+        :return: Tuple of (status, image date, output path, message).
+        :rtype: tuple
+        """
+        results = bridge_api.get_coverage(
+            geometry_wkt, self.crop_type, self.sowing_date,
+            filters=filters)
+
+        if isinstance(results, dict) and results.get('message'):
+            return STATUS_FAILED, None, None, results['message']
+        if not results:
+            return STATUS_NO_COVERAGE, None, None, self.tr(
+                'No coverage result available based on given parameters')
+
+        # Only the most recent map is requested.
+        result = results[0]
+        image_date = result['image']['date']
+        try:
+            output_path, message = self.download_map(
+                result, output_path, bridge_api, feedback=feedback)
+        except Exception as e:
+            return STATUS_FAILED, image_date, None, str(e)
+        return STATUS_DOWNLOADED, image_date, output_path, message
+
+    @staticmethod
+    def add_summary(
+            sink, feature_id, status, image_date=None, output_path=None,
+            message=None):
+        """Add the outcome of a field to the summary table.
+
+        :param sink: Summary sink.
+        :type sink: QgsFeatureSink
+
+        :param feature_id: Identifier of the field.
+        :type feature_id: str
+
+        :param status: Status of the field.
+        :type status: str
+
+        :param image_date: Date of the downloaded map.
+        :type image_date: str
+
+        :param output_path: Path of the downloaded map.
+        :type output_path: str
+
+        :param message: Outcome message.
+        :type message: str
+        """
+        feature = QgsFeature()
+        feature.setAttributes([
+            str(feature_id), status, image_date, output_path, message])
+        sink.addFeature(feature, QgsFeatureSink.FastInsert)
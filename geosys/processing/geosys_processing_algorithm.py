@@ -22,7 +22,7 @@
  ***************************************************************************/
 """
 import os
-import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from PyQt5.QtCore import QCoreApplication, QDate, QSettings
 from PyQt5.QtWidgets import QDateEdit
@@ -30,7 +30,9 @@ from processing.gui.wrappers import WidgetWrapper
 from qgis.core import (
     QgsProcessing,
     QgsFeatureSink,
+    QgsFeedback,
     QgsProcessingAlgorithm,
+    QgsProcessingParameterDefinition,
     QgsProcessingParameterFeatureSource,
     QgsProcessingParameterFeatureSink,
     QgsProcessingParameterRasterDestination,
@@ -42,15 +44,18 @@ from qgis.core import (
 from geosys.bridge_api.default import (
     ZIPPED_TIFF_KEY, TIFF_EXT, MAPS_TYPE, IMAGE_SENSOR, IMAGE_DATE, MAP_LIMIT,
     ZIPPED_TIFF, YIELD_AVERAGE, YIELD_MINIMUM, YIELD_MAXIMUM, ORGANIC_AVERAGE,
-    SAMZ_ZONE)
+    SAMZ_ZONE, DEFAULT_N_PLANNED, DEFAULT_MAP_CREATION_WORKERS)
 from geosys.bridge_api.definitions import ARCHIVE_MAP_PRODUCTS, SENSORS, \
     ALL_SENSORS
 from geosys.bridge_api_wrapper import BridgeAPI
 from geosys.ui.widgets.geosys_coverage_downloader import (
-    credentials_parameters_from_settings, create_map)
+    credentials_parameters_from_settings, create_map, optimize_rasters)
 from geosys.utilities.downloader import fetch_data, extract_zip
-from geosys.utilities.gui_utilities import reproject
+from geosys.utilities.gui_utilities import (
+    merge_geometries, prepare_geometry, reprojected_features)
 from geosys.utilities.qgis_settings import QGISSettings
+from geosys.utilities.raster import convert_to_cog
+from geosys.utilities.run_manifest import RunManifest
 from geosys.utilities.settings import setting
 
 __copyright__ = "Copyright 2019, Kartoza"
@@ -99,6 +104,8 @@ class MapCoverageDownloader(QgsProcessingAlgorithm):
     COVERAGE_DATE = 'COVERAGE_DATE'
     MAP_PRODUCT = 'MAP_PRODUCT'
     SENSOR = 'SENSOR'
+    WORKERS = 'WORKERS'
+    MAX_MAPS = 'MAX_MAPS'
     OUTPUT = 'OUTPUT'
 
     SENSOR_OPTIONS = [ALL_SENSORS] + SENSORS
@@ -136,6 +143,33 @@ class MapCoverageDownloader(QgsProcessingAlgorithm):
         Here we define the inputs and output of the algorithm, along
         with some other properties.
         """
+        self.init_coverage_parameters()
+
+        # Number of most recent maps downloaded, the first one is written to
+        # the output layer and the next ones next to it.
+        max_maps_param = QgsProcessingParameterNumber(
+            self.MAX_MAPS,
+            self.tr('Maximum number of maps'),
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=1,
+            minValue=1
+        )
+        max_maps_param.setFlags(
+            max_maps_param.flags() |
+            QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(max_maps_param)
+
+        # Output directory where the map product of the coverage search will be
+        # placed.
+        self.addParameter(
+            QgsProcessingParameterRasterDestination(
+                self.OUTPUT,
+                self.tr('Output layer')
+            ), createOutput=True
+        )
+
+    def init_coverage_parameters(self):
+        """Define the inputs of the coverage search and map downloads."""
         # Coverage parameters from settings
         settings = QSettings()
         self.crop_type = setting(
@@ -191,14 +225,18 @@ class MapCoverageDownloader(QgsProcessingAlgorithm):
             )
         )
 
-        # Output directory where the map product of the coverage search will be
-        # placed.
-        self.addParameter(
-            QgsProcessingParameterRasterDestination(
-                self.OUTPUT,
-                self.tr('Output layer')
-            ), createOutput=True
+        # Number of maps downloaded at the same time.
+        workers_param = QgsProcessingParameterNumber(
+            self.WORKERS,
+            self.tr('Concurrent downloads'),
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=DEFAULT_MAP_CREATION_WORKERS,
+            minValue=1
         )
+        workers_param.setFlags(
+            workers_param.flags() |
+            QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(workers_param)
 
     def processAlgorithm(self, parameters, context, feedback):
         """Here is where the processing itself takes place.
@@ -206,30 +244,71 @@ class MapCoverageDownloader(QgsProcessingAlgorithm):
         # Retrieve the feature source.
         source = self.parameterAsSource(parameters, self.INPUT, context)
 
-        # Reproject layer to EPSG:4326
-        if source.sourceCrs().authid() != 'EPSG:4326':
-            source = reproject(
-                source, QgsCoordinateReferenceSystem('EPSG:4326'))
-
-        # Handle multi features
+        # Handle multi features, reprojected to EPSG:4326
         # Merge features into multi-part polygon
-        # TODO use Collect Geometries processing algorithm
-        geom = None
-        for index, feature in enumerate(source.getFeatures()):
-            if not feature.hasGeometry() or not (
-                    feature.geometry().isGeosValid()):
-                continue
-            if not geom:
-                geom = feature.geometry()
-            else:
-                geom = geom.combine(feature.geometry())
+        features = reprojected_features(
+            source, QgsCoordinateReferenceSystem('EPSG:4326'))
+        geom = merge_geometries([
+            feature.geometry() for feature in features
+            if feature.hasGeometry() and feature.geometry().isGeosValid()])
 
         if geom:
-            geom_wkt = geom.asWkt()
+            geom_wkt = prepare_geometry(geom)
         else:
             # geometry is not valid
             return False, 'Geometry is not valid.'
 
+        map_limit = self.parameterAsInt(parameters, self.MAX_MAPS, context)
+        filters = self.coverage_filters(
+            parameters, context, map_limit=map_limit)
+
+        # Retrieve the number of concurrent downloads.
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
+
+        # Retrieve output layer destination.
+        self.output_destination = self.parameterAsOutputLayer(
+            parameters, self.OUTPUT, context)
+
+        # Start coverage search
+        bridge_api = BridgeAPI(
+            *credentials_parameters_from_settings(),
+            proxies=QGISSettings.get_qgis_proxy())
+        results = bridge_api.get_coverage(
+            geom_wkt, self.crop_type, self.sowing_date,
+            filters=filters)
+
+        if isinstance(results, dict) and results.get('message'):
+            # TODO handle model_validation_error
+            raise Exception(results['message'])
+
+        if len(results) > 0:
+            # Every download shares the authenticated client.
+            message = self.download_maps(
+                results, bridge_api, workers, feedback)
+        else:
+            message = self.tr(
+                'No coverage result available based on given parameters')
+
+        return {
+            self.OUTPUT: self.output_destination,
+            'message': message
+        }
+
+    def coverage_filters(self, parameters, context, map_limit=1):
+        """Coverage search filters from the algorithm parameters.
+
+        :param parameters: Parameters of the algorithm.
+        :type parameters: dict
+
+        :param context: Processing context.
+        :type context: QgsProcessingContext
+
+        :param map_limit: Number of most recent maps searched.
+        :type map_limit: int
+
+        :return: Filters of the most recent maps prior to the coverage date.
+        :rtype: dict
+        """
         # Retrieve the coverage date.
         coverage_date = self.parameterAsString(
             parameters, self.COVERAGE_DATE, context)
@@ -245,59 +324,127 @@ class MapCoverageDownloader(QgsProcessingAlgorithm):
         if sensor_type == ALL_SENSORS['key']:
             sensor_type = None
 
-        # Retrieve output layer destination.
-        self.output_destination = self.parameterAsOutputLayer(
-            parameters, self.OUTPUT, context)
-
         filters = {
             MAPS_TYPE: map_product,
             IMAGE_DATE: '$lte:{}'.format(coverage_date),
-            MAP_LIMIT: 1  # only get the recent one
+            MAP_LIMIT: map_limit  # only get the most recent ones
         }
         sensor_type and filters.update({
             IMAGE_SENSOR: sensor_type
         })
 
-        # Start coverage search
-        bridge_api = BridgeAPI(
-            *credentials_parameters_from_settings(),
-            proxies=QGISSettings.get_qgis_proxy())
-        results = bridge_api.get_coverage(
-            geom_wkt, self.crop_type, self.sowing_date,
-            filters=filters)
+        return filters
 
-        if isinstance(results, dict) and results.get('message'):
-            # TODO handle model_validation_error
-            raise Exception(results['message'])
+    def output_path(self, index):
+        """Output path of a downloaded map.
 
-        if len(results) > 0:
-            # Compute the number of steps to display within the progress bar
-            total = 100.0 / len(results)
+        The first map is written to the output layer destination, the next
+        ones get the index of the coverage result as suffix.
+
+        :param index: Index of the coverage result.
+        :type index: int
+
+        :return: The output path.
+        :rtype: str
+        """
+        if index == 0:
+            return self.output_destination
+        base_path, extension = os.path.splitext(self.output_destination)
+        return '{}_{}{}'.format(base_path, index, extension)
+
+    def download_maps(self, results, bridge_api, workers, feedback):
+        """Download the maps of the coverage results concurrently.
+
+        The maps are recorded in the run manifest of the output directory,
+        maps already downloaded by a previous run are skipped.
+
+        :param results: Coverage search results.
+        :type results: list
+
+        :param bridge_api: Authenticated Bridge API client.
+        :type bridge_api: BridgeAPI
+
+        :param workers: Number of maps downloaded at the same time.
+        :type workers: int
+
+        :param feedback: Feedback of the algorithm.
+        :type feedback: QgsProcessingFeedback
+
+        :return: Message of the last downloaded map.
+        :rtype: str
+        """
+        message = ''
+        # Compute the number of steps to display within the progress bar
+        total = 100.0 / len(results)
+        manifest = RunManifest(os.path.dirname(self.output_destination))
+        executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        futures = {}
+        try:
             for index, result in enumerate(results):
+                output_path = self.output_path(index)
+                key = RunManifest.key(
+                    result['seasonField']['id'], result['image'],
+                    result['maps'][0]['type'],
+                    os.path.basename(output_path))
+                if manifest.is_done(key):
+                    feedback.pushInfo(
+                        self.tr('{} already downloaded.').format(
+                            output_path))
+                    continue
+                manifest.start(
+                    key, {'map': result['maps'][0]['type']},
+                    [os.path.basename(output_path)])
+                future = executor.submit(
+                    self.download_map, result, output_path, bridge_api,
+                    self.job_feedback(feedback))
+                futures[future] = key
+
+            skipped = len(results) - len(futures)
+            for done, future in enumerate(as_completed(futures), skipped):
+                # Update the progress bar
+                feedback.setProgressText(
+                    'Downloaded {} of {} maps...'.format(
+                        done + 1, len(results)))
+                try:
+                    downloaded_path, message = future.result()
+                    manifest.complete(futures[future])
+                    feedback.pushInfo(downloaded_path)
+                except Exception as e:
+                    message = self.tr('Error creating map. {}').format(e)
+                    manifest.fail(futures[future], message)
+                    feedback.reportError(message)
+                feedback.setProgress(int((done + 1) * total))
+
                 # Stop the algorithm if cancel button has been clicked
                 if feedback.isCanceled():
                     break
+        finally:
+            # Maps not started yet are skipped when canceled.
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+        return message
 
-                # Update the progress bar
-                progress_text = (
-                    'Downloading {} of {} maps...'.format(
-                        index+1, len(results)))
-                feedback.setProgressText(progress_text)
+    @staticmethod
+    def job_feedback(feedback):
+        """Feedback of a single map download, canceled with the algorithm.
 
-                downloaded_path, message = self.download_map(result)
+        The progress of a download is not reported, the progress bar of the
+        algorithm counts the downloaded maps.
 
-                feedback.pushInfo(downloaded_path)
-                feedback.setProgress(int((index+1) * total))
-        else:
-            message = self.tr(
-                'No coverage result available based on given parameters')
+        :param feedback: Feedback of the algorithm.
+        :type feedback: QgsProcessingFeedback
 
-        return {
-            self.OUTPUT: self.output_destination,
-            'message': message
-        }
+        :return: Feedback of the download.
+        :rtype: QgsFeedback
+        """
+        job_feedback = QgsFeedback()
+        feedback.canceled.connect(job_feedback.cancel)
+        return job_feedback
 
-    def download_map(self, coverage_map_json):
+    def download_map(
+            self, coverage_map_json, output_destination=None,
+            bridge_api=None, feedback=None):
         """Download map directly from the coverage search result.
 
         :param coverage_map_json: Result of single map coverage.
@@ -330,10 +477,32 @@ class MapCoverageDownloader(QgsProcessingAlgorithm):
                 "coverageType": "CLEAR"
             }
         :type coverage_map_json: dict
+
+        :param output_destination: Output path of the map, the output layer
+            destination if not given.
+        :type output_destination: str
+
+        :param bridge_api: Authenticated Bridge API client, one is created
+            from the settings if not given.
+        :type bridge_api: BridgeAPI
+
+        :param feedback: Feedback canceling the download, see job_feedback.
+        :type feedback: QgsFeedback
+
+        :return: Tuple of (output path, message).
+        :rtype: tuple
+
+        :raises: Exception - when the map could not be created
         """
-        bridge_api = BridgeAPI(
-            *credentials_parameters_from_settings(),
-            proxies=QGISSettings.get_qgis_proxy())
+        output_destination = output_destination or self.output_destination
+        if bridge_api is None:
+            bridge_api = BridgeAPI(
+                *credentials_parameters_from_settings(),
+                proxies=QGISSettings.get_qgis_proxy())
+        else:
+            # A client shared by a long run renews its token before it
+            # expires, the downloads send it as well.
+            bridge_api.refresh_authentication()
 
         # Get the requested map format. For now, use Raster (.tiff)
         map_format = ZIPPED_TIFF_KEY
@@ -346,11 +515,20 @@ class MapCoverageDownloader(QgsProcessingAlgorithm):
             'Please check your output directory for the result.')
 
         if url:
-            # Download zipped map and extract it in requested format.
-            zip_path = tempfile.mktemp('{}.zip'.format(map_extension))
-
-            fetch_data(url, zip_path, headers=bridge_api.headers)
-            extract_zip(zip_path, self.output_destination)
+            # Download zipped map and extract it in requested format. The
+            # archive sits next to the output, so an interrupted download is
+            # resumed when the algorithm runs again.
+            zip_path = '{}{}.zip'.format(output_destination, map_extension)
+
+            fetch_data(
+                url, zip_path, headers=bridge_api.headers,
+                feedback=feedback)
+            if feedback and feedback.isCanceled():
+                raise Exception(self.tr('Download canceled.'))
+            extract_zip(zip_path, output_destination)
+            os.remove(zip_path)
+            if optimize_rasters():
+                convert_to_cog(output_destination)
         else:
             # download map using get field map request
             settings = QSettings()
@@ -367,12 +545,21 @@ class MapCoverageDownloader(QgsProcessingAlgorithm):
                 SAMZ_ZONE: setting(
                     SAMZ_ZONE, expected_type=int, qsettings=settings),
             }
-            is_success, message = create_map(
+            is_success, message, _ = create_map(
                 coverage_map_json,
-                os.path.dirname(self.output_destination),
-                os.path.basename(self.output_destination),
-                ZIPPED_TIFF, data)
+                os.path.dirname(output_destination),
+                os.path.basename(output_destination),
+                ZIPPED_TIFF,
+                n_planned_value=DEFAULT_N_PLANNED,
+                yield_val=data[YIELD_AVERAGE],
+                min_yield_val=data[YIELD_MINIMUM],
+                max_yield_val=data[YIELD_MAXIMUM],
+                data=data,
+                bridge_api=bridge_api,
+                feedback=feedback,
+                # The output layer is the extracted GeoTIFF
+                keep_archive=False)
             if not is_success:
-                message = self.tr('Error creating map. {}').format(message)
+                raise Exception(message)
 
-        return self.output_destination, message
+        return output_destination, message
@@ -23,6 +23,8 @@
 """
 from PyQt5.QtGui import QIcon
 from qgis.core import QgsProcessingProvider
+from geosys.processing.geosys_batch_processing_algorithm import (
+    BatchMapCoverageDownloader)
 from geosys.processing.geosys_processing_algorithm import MapCoverageDownloader
 from geosys.utilities.resources import resources_path
 
@@ -52,6 +54,7 @@ class GeosysProcessingProvider(QgsProcessingProvider):
         Loads all algorithms belonging to this provider.
         """
         self.addAlgorithm(MapCoverageDownloader())
+        self.addAlgorithm(BatchMapCoverageDownloader())
 
     def id(self):
         """
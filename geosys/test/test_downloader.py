@@ -0,0 +1,209 @@
+# coding=utf-8
+"""Downloader test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from geosys.test.utilities import get_qgis_app
+from geosys.utilities.downloader import (
+    FileDownloader, PARTIAL_EXTENSION, PARTIAL_STATE_EXTENSION,
+    has_partial_downloads)
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+QGIS_APP = get_qgis_app()
+
+CONTENT = bytes(range(256)) * 64
+ETAG = '"map-v1"'
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serve CONTENT, honouring Range and If-Range like a file server.
+
+    The status of the next responses can be forced through the
+    server.forced_status list.
+    """
+
+    def log_message(self, *args):
+        """Keep the test output quiet."""
+        pass
+
+    def send_body(self, status, body, headers=None):
+        """Send a response."""
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        """Serve the content."""
+        self.server.requests.append(dict(self.headers))
+        if self.server.forced_status:
+            status = self.server.forced_status.pop(0)
+            self.send_body(status, b'<html>Server error</html>')
+            return
+
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if range_header and (if_range is None or if_range == ETAG):
+            start = int(range_header.split('=')[1].split('-')[0])
+            if start >= len(CONTENT):
+                self.send_body(416, b'', {
+                    'Content-Range': 'bytes */%s' % len(CONTENT)})
+                return
+            self.send_body(206, CONTENT[start:], {
+                'ETag': ETAG,
+                'Content-Range': 'bytes %s-%s/%s' % (
+                    start, len(CONTENT) - 1, len(CONTENT))})
+            return
+        self.send_body(200, CONTENT, {'ETag': ETAG})
+
+
+class FileDownloaderTest(unittest.TestCase):
+    """Test the resumable downloads of FileDownloader."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start the local HTTP server."""
+        cls.server = HTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+        cls.server.requests = []
+        cls.server.forced_status = []
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.url = 'http://127.0.0.1:%s/map.zip' % cls.server.server_port
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the local HTTP server."""
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.output_path = os.path.join(self.directory, 'map.zip')
+        self.partial_path = self.output_path + PARTIAL_EXTENSION
+        self.state_path = self.partial_path + PARTIAL_STATE_EXTENSION
+        self.server.requests[:] = []
+        self.server.forced_status[:] = []
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def create_partial(self, size, validator=ETAG):
+        """Leave a partial file as an interrupted download would."""
+        with open(self.partial_path, 'wb') as partial_file:
+            partial_file.write(CONTENT[:size])
+        with open(self.state_path, 'w') as state_file:
+            json.dump({'url': self.url, 'validator': validator}, state_file)
+
+    def download(self, retries=0):
+        """Download the url to the output path."""
+        downloader = FileDownloader(
+            self.url, self.output_path, retries=retries)
+        return downloader.download()
+
+    def read_output(self, path=None):
+        """Read a downloaded file."""
+        with open(path or self.output_path, 'rb') as output_file:
+            return output_file.read()
+
+    def test_download(self):
+        """Test a complete download leaves no partial file."""
+        self.assertEqual(self.download(), (True, None))
+        self.assertEqual(self.read_output(), CONTENT)
+        self.assertFalse(os.path.exists(self.partial_path))
+        self.assertFalse(os.path.exists(self.state_path))
+        self.assertNotIn('Range', self.server.requests[0])
+
+    def test_resume(self):
+        """Test a partial file is resumed with a Range request."""
+        self.create_partial(1000)
+        self.assertEqual(self.download(), (True, None))
+        self.assertEqual(self.read_output(), CONTENT)
+        request = self.server.requests[0]
+        self.assertEqual(request['Range'], 'bytes=1000-')
+        self.assertEqual(request['If-Range'], ETAG)
+        self.assertFalse(os.path.exists(self.partial_path))
+
+    def test_changed_file_is_downloaded_again(self):
+        """Test the whole file replaces a partial file of an old version."""
+        self.create_partial(1000, validator='"map-v0"')
+        self.assertEqual(self.download(), (True, None))
+        self.assertEqual(self.read_output(), CONTENT)
+
+    def test_server_error_keeps_partial_file(self):
+        """Test an error page does not corrupt the partial file."""
+        self.create_partial(1000)
+        self.server.forced_status.append(503)
+        success, _ = self.download()
+        self.assertFalse(success)
+        self.assertEqual(self.read_output(self.partial_path), CONTENT[:1000])
+        self.assertTrue(os.path.exists(self.state_path))
+
+        # The next download resumes the partial file.
+        self.assertEqual(self.download(), (True, None))
+        self.assertEqual(self.read_output(), CONTENT)
+
+    def test_server_error_is_retried(self):
+        """Test a download is resumed after a server error."""
+        self.create_partial(1000)
+        self.server.forced_status.append(503)
+        self.assertEqual(self.download(retries=1), (True, None))
+        self.assertEqual(self.read_output(), CONTENT)
+        self.assertEqual(self.server.requests[1]['Range'], 'bytes=1000-')
+
+    def test_client_error_keeps_partial_file(self):
+        """Test a refused range does not truncate the partial file."""
+        self.create_partial(1000)
+        self.server.forced_status.append(416)
+        success, _ = self.download()
+        self.assertFalse(success)
+        self.assertFalse(os.path.exists(self.output_path))
+        self.assertEqual(self.read_output(self.partial_path), CONTENT[:1000])
+
+    def test_unwritable_output(self):
+        """Test a partial file which can not be opened fails the download."""
+        self.output_path = os.path.join(self.directory, 'missing', 'map.zip')
+        success, message = self.download(retries=2)
+        self.assertFalse(success)
+        self.assertTrue(message)
+        self.assertFalse(os.path.exists(self.output_path))
+        # The failure is not retried.
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_has_partial_downloads(self):
+        """Test a partial file is found only with its download state."""
+        self.assertFalse(has_partial_downloads(self.directory))
+        self.server.forced_status.append(503)
+        self.download()
+        self.assertFalse(has_partial_downloads(self.directory))
+
+        self.create_partial(1000)
+        self.assertTrue(has_partial_downloads(self.directory))
+        self.assertFalse(has_partial_downloads(
+            os.path.join(self.directory, 'missing')))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(FileDownloaderTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
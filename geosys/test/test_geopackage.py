@@ -0,0 +1,84 @@
+# coding=utf-8
+"""GeoPackage layers test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from geosys.utilities.geopackage import (
+    layer_names, layer_uri, output_exists, split_layer_uri)
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+
+def create_geopackage(path, names):
+    """Create a GeoPackage contents table listing layers."""
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute(
+            'CREATE TABLE gpkg_contents ('
+            'table_name TEXT NOT NULL PRIMARY KEY, '
+            'data_type TEXT NOT NULL)')
+        connection.executemany(
+            'INSERT INTO gpkg_contents VALUES (?, ?)',
+            [(name, 'features') for name in names])
+        connection.commit()
+    finally:
+        connection.close()
+
+
+class GeoPackageTest(unittest.TestCase):
+    """Test layers of GeoPackages are found."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'outputs.gpkg')
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def test_layer_uri(self):
+        """Test layer uris are split back to their path and name."""
+        uri = layer_uri(self.path, 'map')
+        self.assertEqual(uri, self.path + '|layername=map')
+        self.assertEqual(split_layer_uri(uri), (self.path, 'map'))
+        self.assertEqual(split_layer_uri(self.path), (self.path, None))
+
+    def test_layer_names(self):
+        """Test the layers of a GeoPackage are listed."""
+        self.assertEqual(layer_names(self.path), set())
+        create_geopackage(self.path, ['map', 'map_1'])
+        self.assertEqual(layer_names(self.path), {'map', 'map_1'})
+
+    def test_unreadable_geopackage(self):
+        """Test an unreadable GeoPackage has no layer."""
+        with open(self.path, 'w') as geopackage_file:
+            geopackage_file.write('not a GeoPackage')
+        self.assertEqual(layer_names(self.path), set())
+
+    def test_output_exists(self):
+        """Test outputs are found as files or layers."""
+        self.assertFalse(output_exists(layer_uri(self.path, 'map')))
+        create_geopackage(self.path, ['map'])
+        self.assertTrue(output_exists(self.path))
+        self.assertTrue(output_exists(layer_uri(self.path, 'map')))
+        self.assertFalse(output_exists(layer_uri(self.path, 'other')))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(GeoPackageTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
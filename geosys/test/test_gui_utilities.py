@@ -0,0 +1,136 @@
+# coding=utf-8
+"""GUI utilities test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+import math
+import re
+import unittest
+from unittest import mock
+
+from qgis.core import QgsGeometry, QgsPointXY
+
+from geosys.test.utilities import get_qgis_app
+from geosys.utilities.gui_utilities import merge_geometries, prepare_geometry
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+QGIS_APP = get_qgis_app()
+
+
+def square(x, y, size=1.0):
+    """Square polygon with its lower left corner at x, y."""
+    return QgsGeometry.fromWkt(
+        'POLYGON (({x} {y}, {x1} {y}, {x1} {y1}, {x} {y1}, {x} {y}))'.format(
+            x=x, y=y, x1=x + size, y1=y + size))
+
+
+def circle(x, y, radius, vertices):
+    """Densely digitised circle polygon."""
+    points = [
+        QgsPointXY(
+            x + radius * math.cos(2 * math.pi * index / vertices),
+            y + radius * math.sin(2 * math.pi * index / vertices))
+        for index in range(vertices)]
+    return QgsGeometry.fromPolygonXY([points + [points[0]]])
+
+
+class PrepareGeometryTest(unittest.TestCase):
+    """Test geometries are prepared for Bridge API."""
+
+    def assertCovers(self, prepared_wkt, geometry):
+        """Assert the prepared geometry still covers the geometry."""
+        prepared = QgsGeometry.fromWkt(prepared_wkt)
+        uncovered = geometry.difference(prepared.buffer(1e-9, 1))
+        self.assertTrue(uncovered.isEmpty() or uncovered.area() == 0)
+
+    def test_snapping(self):
+        """Test coordinates are snapped to the precision."""
+        geometry = square(10.123456789, -5.987654321, 0.5)
+        wkt = prepare_geometry(geometry, precision=3, tolerance=0)
+        decimals = [
+            len(number.split('.')[1]) if '.' in number else 0
+            for number in re.findall(r'-?\d+(?:\.\d+)?', wkt)]
+        self.assertTrue(decimals)
+        self.assertLessEqual(max(decimals), 3)
+        self.assertLess(len(wkt), len(geometry.asWkt()))
+        self.assertCovers(wkt, geometry)
+
+    def test_collapsed_geometry(self):
+        """Test a geometry collapsed by the snapping is sent unchanged."""
+        geometry = square(0.1, 0.1, 0.3)
+        wkt = prepare_geometry(geometry, precision=0, tolerance=0)
+        self.assertEqual(wkt, geometry.asWkt())
+
+    def test_simplify(self):
+        """Test a densely digitised field is simplified and covered."""
+        geometry = circle(20.0, -30.0, 0.01, 1000)
+        wkt = prepare_geometry(geometry, precision=6, tolerance=0.0001)
+        prepared = QgsGeometry.fromWkt(wkt)
+        self.assertTrue(prepared.isGeosValid())
+        self.assertLess(
+            len(list(prepared.vertices())),
+            len(list(geometry.vertices())))
+        self.assertCovers(wkt, geometry)
+
+    def test_coverage_fallback(self):
+        """Test the geometry is sent unchanged if not covered anymore."""
+        geometry = square(0, 0, 10)
+        # The prepared geometry loses a corner of the field.
+        shrunk = square(0, 0, 9)
+        with mock.patch(
+                'geosys.utilities.gui_utilities.QgsGeometry',
+                return_value=shrunk):
+            wkt = prepare_geometry(geometry, precision=6, tolerance=0)
+        self.assertEqual(wkt, geometry.asWkt())
+
+        # The prepared geometry is sent when it covers the field.
+        wkt = prepare_geometry(square(0, 0, 9), precision=6, tolerance=0.5)
+        self.assertNotEqual(wkt, square(0, 0, 9).asWkt())
+
+
+class MergeGeometriesTest(unittest.TestCase):
+    """Test geometries are merged."""
+
+    def test_no_geometry(self):
+        """Test nothing is merged from no geometry."""
+        self.assertIsNone(merge_geometries([]))
+
+    def test_single_geometry(self):
+        """Test a single geometry is copied."""
+        geometry = square(0, 0)
+        merged = merge_geometries([geometry])
+        self.assertIsNot(merged, geometry)
+        self.assertTrue(merged.equals(geometry))
+
+    def test_many_geometries(self):
+        """Test many adjacent and overlapping polygons are dissolved."""
+        geometries = [
+            square(x, y) for x in range(20) for y in range(20)]
+        # Overlapping polygons are only counted once.
+        geometries.append(square(0.5, 0.5, 5))
+        merged = merge_geometries(geometries)
+        self.assertEqual(len(merged.asGeometryCollection()), 1)
+        self.assertAlmostEqual(merged.area(), 400.0)
+        self.assertTrue(merged.isGeosValid())
+
+    def test_disjoint_geometries(self):
+        """Test disjoint polygons are merged in a multi polygon."""
+        merged = merge_geometries([square(0, 0), square(5, 5)])
+        self.assertEqual(len(merged.asGeometryCollection()), 2)
+        self.assertAlmostEqual(merged.area(), 2.0)
+
+
+if __name__ == "__main__":
+    suite = unittest.TestSuite()
+    suite.addTests(unittest.makeSuite(PrepareGeometryTest))
+    suite.addTests(unittest.makeSuite(MergeGeometriesTest))
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,148 @@
+# coding=utf-8
+"""Job queue test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+import unittest
+
+from qgis.PyQt.QtCore import QObject, pyqtSignal
+
+from geosys.test.utilities import get_qgis_app
+from geosys.utilities.job_queue import (
+    JobQueue, RUNNING, SUCCEEDED, FAILED, CANCELED)
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+QGIS_APP = get_qgis_app()
+
+
+class StubTask(QObject):
+    """Task finished by the test instead of a task manager."""
+
+    taskCompleted = pyqtSignal()
+    taskTerminated = pyqtSignal()
+
+    def __init__(self, name):
+        super(StubTask, self).__init__()
+        self.name = name
+        self.message = ''
+        self.canceled = False
+        self.results = []
+
+    def description(self):
+        return self.name
+
+    def cancel(self):
+        self.canceled = True
+
+    def finished(self, result):
+        self.results.append(result)
+
+    def complete(self, is_success, message=''):
+        """Finish the task as the task manager would."""
+        self.message = message
+        self.finished(is_success)
+        if is_success:
+            self.taskCompleted.emit()
+        else:
+            self.taskTerminated.emit()
+
+
+class StubTaskManager(object):
+    """Task manager recording the tasks it is given."""
+
+    def __init__(self):
+        self.tasks = []
+
+    def addTask(self, task):
+        self.tasks.append(task)
+        return len(self.tasks)
+
+
+class JobQueueTest(unittest.TestCase):
+    """Test the job queue works."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.task_manager = StubTaskManager()
+        self.finished_count = 0
+
+    def queue(self, max_workers):
+        """Job queue running its tasks in the stub task manager."""
+        queue = JobQueue(
+            max_workers=max_workers, task_manager=self.task_manager)
+        queue.finished.connect(self.queue_finished)
+        return queue
+
+    def queue_finished(self):
+        """Count the finished signals of the queue."""
+        self.finished_count += 1
+
+    def test_max_workers(self):
+        """Test at most max_workers tasks run at the same time."""
+        queue = self.queue(max_workers=2)
+        tasks = [StubTask('task %s' % i) for i in range(3)]
+        jobs = [queue.submit(task) for task in tasks]
+        self.assertEqual(self.task_manager.tasks, tasks[:2])
+        self.assertEqual(len(queue.jobs_with_status(RUNNING)), 2)
+
+        tasks[0].complete(True)
+        self.assertEqual(self.task_manager.tasks, tasks)
+        self.assertEqual(jobs[0].status, SUCCEEDED)
+
+        queue.set_max_workers(0)
+        self.assertEqual(queue.max_workers, 1)
+
+    def test_failure_isolation(self):
+        """Test a failed job does not stop the queue."""
+        queue = self.queue(max_workers=1)
+        tasks = [StubTask('task %s' % i) for i in range(2)]
+        jobs = [queue.submit(task) for task in tasks]
+
+        tasks[0].complete(False, 'Server error')
+        self.assertEqual(jobs[0].status, FAILED)
+        self.assertEqual(jobs[0].message, 'Server error')
+        self.assertEqual(jobs[1].status, RUNNING)
+        self.assertEqual(self.finished_count, 0)
+
+        tasks[1].complete(True)
+        self.assertEqual(jobs[1].status, SUCCEEDED)
+        self.assertEqual(queue.jobs_with_status(FAILED), [jobs[0]])
+        self.assertFalse(queue.is_running())
+        self.assertEqual(self.finished_count, 1)
+
+    def test_cancel(self):
+        """Test canceled jobs finish their task, queued or running."""
+        queue = self.queue(max_workers=1)
+        tasks = [StubTask('task %s' % i) for i in range(2)]
+        jobs = [queue.submit(task, key='map %s' % i)
+                for i, task in enumerate(tasks)]
+        self.assertIs(queue.find_active_job('map 1'), jobs[1])
+
+        queue.cancel()
+        # The queued task is never run but its finished handler is called.
+        self.assertTrue(tasks[1].canceled)
+        self.assertEqual(tasks[1].results, [False])
+        self.assertEqual(jobs[1].status, CANCELED)
+        self.assertIsNone(queue.find_active_job('map 1'))
+        self.assertNotIn(tasks[1], self.task_manager.tasks)
+
+        # The running task is canceled and terminates.
+        self.assertTrue(tasks[0].canceled)
+        self.assertEqual(jobs[0].status, RUNNING)
+        tasks[0].complete(False)
+        self.assertEqual(jobs[0].status, CANCELED)
+        self.assertEqual(self.finished_count, 1)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(JobQueueTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
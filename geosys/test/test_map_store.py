@@ -0,0 +1,102 @@
+# coding=utf-8
+"""Map store test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from geosys.utilities.map_store import MapStore
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+
+class MapStoreTest(unittest.TestCase):
+    """Test map store works."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.store_directory = os.path.join(self.directory, 'store')
+        self.output_directory = os.path.join(self.directory, 'output')
+        os.makedirs(self.output_directory)
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def create_map(self, filename, content=b'0123456789'):
+        """Create the files of a PNG map in the output directory."""
+        base_path = os.path.join(self.output_directory, filename)
+        for extension in ('.png', '.pgw'):
+            with open(base_path + extension, 'wb') as map_file:
+                map_file.write(content)
+        return base_path
+
+    def test_put_and_get(self):
+        """Test we can store a map and get it back."""
+        store = MapStore(self.store_directory, max_size=1024)
+        key = MapStore.key('INSEASON_NDVI', {'id': 'abc'})
+        store.put(key, self.create_map('first'))
+
+        base_path = os.path.join(self.output_directory, 'second')
+        paths = store.get(key, base_path)
+        self.assertEqual(
+            sorted(paths), [base_path + '.pgw', base_path + '.png'])
+        with open(base_path + '.png', 'rb') as map_file:
+            self.assertEqual(map_file.read(), b'0123456789')
+
+        copy_base_path = os.path.join(self.output_directory, 'third')
+        self.assertEqual(
+            len(store.get(key, copy_base_path, hardlink=False)), 2)
+        self.assertIsNone(store.get(
+            MapStore.key('INSEASON_NDVI', {'id': 'def'}), base_path))
+
+    def test_store_keeps_its_copy(self):
+        """Test editing the stored map does not change the store."""
+        store = MapStore(self.store_directory, max_size=1024)
+        key = MapStore.key('map')
+        base_path = self.create_map('first')
+        store.put(key, base_path)
+        with open(base_path + '.png', 'wb') as map_file:
+            map_file.write(b'edited')
+
+        copy_base_path = os.path.join(self.output_directory, 'second')
+        store.get(key, copy_base_path)
+        with open(copy_base_path + '.png', 'rb') as map_file:
+            self.assertEqual(map_file.read(), b'0123456789')
+
+    def test_lru_eviction(self):
+        """Test least recently used maps are evicted first."""
+        store = MapStore(self.store_directory, max_size=50)
+        first_key = MapStore.key('first')
+        second_key = MapStore.key('second')
+        store.put(first_key, self.create_map('first'))
+        store.put(second_key, self.create_map('second'))
+
+        # Make the second map the least recently used one.
+        old_time = time.time() - 100
+        os.utime(
+            os.path.join(self.store_directory, second_key),
+            (old_time, old_time))
+        store.put(MapStore.key('third'), self.create_map('third'))
+
+        base_path = os.path.join(self.output_directory, 'copy')
+        self.assertIsNone(store.get(second_key, base_path))
+        self.assertIsNotNone(store.get(first_key, base_path))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(MapStoreTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
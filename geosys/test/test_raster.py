@@ -0,0 +1,65 @@
+# coding=utf-8
+"""Raster post-processing test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from osgeo import gdal
+
+from geosys.utilities.raster import convert_to_cog
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+
+class ConvertToCogTest(unittest.TestCase):
+    """Test GeoTIFF maps are converted to COG."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def test_convert(self):
+        """Test a GeoTIFF is replaced by its tiled conversion."""
+        raster_path = os.path.join(self.directory, 'map.tif')
+        shutil.copy2(
+            os.path.join(os.path.dirname(__file__), 'tenbytenraster.tif'),
+            raster_path)
+        self.assertTrue(convert_to_cog(raster_path))
+        self.assertEqual(os.listdir(self.directory), ['map.tif'])
+        self.assertIsNotNone(gdal.Open(raster_path))
+
+    def test_invalid_raster(self):
+        """Test a failed conversion leaves the file and raises nothing."""
+        raster_path = os.path.join(self.directory, 'map.tif')
+        with open(raster_path, 'wb') as raster_file:
+            raster_file.write(b'<html>Server error</html>')
+
+        use_exceptions = gdal.GetUseExceptions()
+        gdal.UseExceptions()
+        try:
+            self.assertFalse(convert_to_cog(raster_path))
+        finally:
+            if not use_exceptions:
+                gdal.DontUseExceptions()
+        self.assertEqual(os.listdir(self.directory), ['map.tif'])
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(ConvertToCogTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,152 @@
+# coding=utf-8
+"""Run manifest test.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from geosys.utilities.geopackage import layer_uri
+from geosys.utilities.run_manifest import (
+    RunManifest, DONE, FAILED, PENDING)
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+
+class RunManifestTest(unittest.TestCase):
+    """Test run manifest works."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.directory = tempfile.mkdtemp()
+        self.manifest = RunManifest(self.directory)
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.directory)
+
+    def create_output(self, filename):
+        """Create an output file in the output directory."""
+        with open(os.path.join(self.directory, filename), 'w') as output:
+            output.write('map')
+
+    def test_key(self):
+        """Test key does not depend on the order of the parameters keys."""
+        first = RunManifest.key(
+            'NDVI', {'id': 'abc', 'date': '2018-10-18'}, 'map.tif')
+        second = RunManifest.key(
+            'NDVI', {'date': '2018-10-18', 'id': 'abc'}, 'map.tif')
+        self.assertEqual(first, second)
+        self.assertNotEqual(
+            first, RunManifest.key('NDVI', {'id': 'abc'}, 'map.tif'))
+
+    def test_complete(self):
+        """Test a completed map is done while its outputs exist."""
+        key = RunManifest.key('map')
+        self.assertIsNone(self.manifest.get(key))
+
+        self.manifest.start(key, {'map': 'NDVI'}, ['map.tif'])
+        self.assertEqual(self.manifest.get(key)['state'], PENDING)
+        self.assertFalse(self.manifest.is_done(key))
+
+        self.create_output('map.tif')
+        self.manifest.complete(key, details={'image_date': '2018-10-18'})
+        item = self.manifest.get(key)
+        self.assertEqual(item['state'], DONE)
+        self.assertEqual(item['outputs'], ['map.tif'])
+        self.assertEqual(item['details'], {'image_date': '2018-10-18'})
+        self.assertTrue(self.manifest.is_done(key))
+
+        # The map is created again if its output was removed.
+        os.remove(os.path.join(self.directory, 'map.tif'))
+        self.assertFalse(self.manifest.is_done(key))
+
+    def test_geopackage_layer_output(self):
+        """Test a map in a GeoPackage is done while its layer exists."""
+        key = RunManifest.key('map')
+        self.manifest.start(key, {}, [layer_uri('outputs.gpkg', 'map')])
+        self.manifest.complete(key)
+        self.assertFalse(self.manifest.is_done(key))
+
+        connection = sqlite3.connect(
+            os.path.join(self.directory, 'outputs.gpkg'))
+        connection.execute(
+            'CREATE TABLE gpkg_contents (table_name TEXT PRIMARY KEY)')
+        connection.execute("INSERT INTO gpkg_contents VALUES ('map')")
+        connection.commit()
+        connection.close()
+        self.assertTrue(self.manifest.is_done(key))
+
+    def test_fail(self):
+        """Test a failed map is not done."""
+        key = RunManifest.key('map')
+        self.manifest.start(key, {}, ['map.tif'])
+        self.create_output('map.tif')
+        self.manifest.fail(key, 'Server error')
+
+        item = self.manifest.get(key)
+        self.assertEqual(item['state'], FAILED)
+        self.assertEqual(item['message'], 'Server error')
+        self.assertFalse(self.manifest.is_done(key))
+
+    def test_persistence(self):
+        """Test the manifest is read again by a new run."""
+        key = RunManifest.key('map')
+        self.manifest.start(key, {'map': 'NDVI'}, ['map.tif'])
+        self.create_output('map.tif')
+        self.manifest.complete(key)
+
+        manifest = RunManifest(self.directory)
+        self.assertTrue(manifest.is_done(key))
+        self.assertEqual(manifest.get(key)['parameters'], {'map': 'NDVI'})
+
+    def test_concurrent_manifests(self):
+        """Test two manifests of a directory keep each other's records."""
+        other_manifest = RunManifest(self.directory)
+        first_key = RunManifest.key('first')
+        second_key = RunManifest.key('second')
+        self.manifest.start(first_key, {}, ['first.tif'])
+        other_manifest.start(second_key, {}, ['second.tif'])
+        self.create_output('first.tif')
+        self.manifest.complete(first_key)
+
+        manifest = RunManifest(self.directory)
+        self.assertTrue(manifest.is_done(first_key))
+        self.assertEqual(manifest.get(second_key)['state'], PENDING)
+        self.assertFalse(os.path.exists(manifest.path + '.lock'))
+
+    def test_stale_lock(self):
+        """Test the lock file left by a crashed run is removed."""
+        lock_path = self.manifest.path + '.lock'
+        open(lock_path, 'w').close()
+        os.utime(lock_path, (0, 0))
+
+        key = RunManifest.key('map')
+        self.manifest.start(key, {}, ['map.tif'])
+        self.assertEqual(
+            RunManifest(self.directory).get(key)['state'], PENDING)
+        self.assertFalse(os.path.exists(lock_path))
+
+    def test_unreadable_manifest(self):
+        """Test an unreadable manifest is ignored."""
+        with open(self.manifest.path, 'w') as manifest_file:
+            manifest_file.write('{not json')
+
+        manifest = RunManifest(self.directory)
+        self.assertEqual(manifest.items, {})
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(RunManifestTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -58,4 +58,54 @@ def content():
         'occur.'
     )))
 
+    message.add(m.Paragraph(
+        m.ImportantText(tr('Advanced settings')).to_html()))
+    message.add(m.Paragraph(tr(
+        'The following settings are not shown in the dialog. They are '
+        'changed in the advanced settings editor of QGIS, Settings > '
+        'Options > Advanced, under the geosys group.'
+    )))
+    advanced_settings = [
+        ('http_pool_maxsize', tr(
+            'Number of connections kept open to each Bridge API server, '
+            '16 by default. With http_pool_block on (default), requests '
+            'wait for a free connection when they are all in use.')),
+        ('map_store_size', tr(
+            'Size budget in bytes of the local store of created maps. A map '
+            'requested again is taken from the store instead of being '
+            'created and downloaded again. The store is disabled with the '
+            'default of 0.')),
+        ('map_store_directory', tr(
+            'Directory of the map store, e.g. on a drive shared with other '
+            'users. The store is in the GEOSYS folder of the user profile '
+            'if empty.')),
+        ('keep_zipped_maps', tr(
+            'Keep ZIPPED_TIFF and ZIPPED_SHP maps as downloaded and load '
+            'them from the zip file instead of extracting them.')),
+        ('optimize_rasters', tr(
+            'Convert downloaded GeoTIFF maps to tiled and compressed '
+            'Cloud-Optimized GeoTIFFs with overviews, which render faster '
+            'when they are large.')),
+        ('geometry_precision', tr(
+            'Number of decimals the coordinates of the geometries sent to '
+            'the coverage search are snapped to, 6 by default.')),
+        ('geometry_simplify_tolerance', tr(
+            'Tolerance in degrees the polygons sent to the coverage search '
+            'are simplified with, without shrinking them. They are not '
+            'simplified with the default of 0.')),
+        ('hotspot_layer_format', tr(
+            'Format of the hotspot and segment layers, shp for shapefiles '
+            '(default) or gpkg for GeoPackages, which are faster to write '
+            'and load when there are many segments.')),
+        ('vector_output_mode', tr(
+            'With geopackage, vector maps, hotspots and segments are written '
+            'as layers of a single GeoPackage of the output directory, '
+            'instead of separate files with the default of files.')),
+    ]
+    bullets = m.BulletedList()
+    for key, description in advanced_settings:
+        bullets.add(m.Text('{} - {}'.format(
+            m.ImportantText(key).to_html(), description)))
+    message.add(bullets)
+
     return message
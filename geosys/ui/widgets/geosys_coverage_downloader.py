@@ -1,11 +1,14 @@
 # coding=utf-8
 """Implementation of custom GEOSYS coverage downloader.
 """
+import logging
 import os
+import shutil
 import sys
-import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from PyQt5.QtCore import QThread, pyqtSignal, QByteArray, QSettings, QDate
+from qgis.core import QgsVectorLayer
 
 from geosys.bridge_api.default import (
     MAPS_TYPE,
@@ -13,12 +16,15 @@ from geosys.bridge_api.default import (
     IMAGE_DATE,
     IMAGE_WEATHER,
     ZIPPED_FORMAT,
+    ZIPPED_TIFF,
+    ZIPPED_SHP,
     PNG,
     PNG_KMZ,
     PGW,
     PGW2,
     LEGEND,
     SHP_EXT,
+    TIFF_EXT,
     BRIDGE_URLS,
     NDVI_THUMBNAIL_URL,
     NITROGEN_THUMBNAIL_URL,
@@ -27,7 +33,17 @@ from geosys.bridge_api.default import (
     YGM_THUMBNAIL_URL,
     YPM_THUMBNAIL_URL,
     SAMZ_THUMBNAIL_URL,
-    SAMPLEMAP_THUMBNAIL_URL
+    SAMPLEMAP_THUMBNAIL_URL,
+    DEFAULT_COVERAGE_WORKERS,
+    DEFAULT_THUMBNAIL_WORKERS,
+    THUMBNAIL_CACHE_SIZE,
+    THUMBNAIL_CACHE_MAX_AGE,
+    COVERAGE_CACHE_TTL,
+    MAP_STORE_SIZE,
+    DEFAULT_POOL_CONNECTIONS,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_POOL_BLOCK,
+    ZIP_EXT
 )
 from geosys.bridge_api.definitions import (
     SAMZ,
@@ -46,18 +62,32 @@ from geosys.bridge_api.definitions import (
     YVM,
     SAMPLE_MAP
 )
+from geosys.bridge_api.content_cache import ContentCache
+from geosys.bridge_api.response_cache import COVERAGE_CACHE
+from geosys.bridge_api.session import configure_session
 from geosys.bridge_api_wrapper import BridgeAPI
-from geosys.utilities.downloader import fetch_data, extract_zip
+from geosys.utilities.downloader import (
+    download_file, extract_zip, has_partial_downloads, wait_for_downloads)
+from geosys.utilities.map_store import MapStore
+from geosys.utilities.raster import convert_to_cog
+from geosys.utilities.qgis import geosys_profile_path
 from geosys.utilities.qgis_settings import QGISSettings
 from geosys.utilities.settings import setting
-from geosys.utilities.gui_utilities import create_hotspot_layer
-from geosys.utilities.utilities import check_if_file_exists
+from geosys.utilities.gui_utilities import (
+    create_hotspot_layer,
+    hotspot_layer_format,
+    vector_output_geopackage,
+    vector_output_name,
+    write_to_geopackage
+)
 
 __copyright__ = "Copyright 2019, Kartoza"
 __license__ = "GPL version 3"
 __email__ = "rohmat@kartoza.com"
 __revision__ = "$Format:%H$"
 
+LOGGER = logging.getLogger('geosys')
+
 settings = QSettings()
 
 
@@ -66,7 +96,9 @@ class CoverageSearchThread(QThread):
 
     search_started = pyqtSignal()
     search_finished = pyqtSignal()
-    data_downloaded = pyqtSignal(object, QByteArray)
+    # Result, thumbnail and (geometry index, result index) order of the
+    # result, results are emitted as soon as their thumbnail arrives.
+    data_downloaded = pyqtSignal(object, QByteArray, object)
     error_occurred = pyqtSignal(object)
 
     def __init__(
@@ -205,12 +237,39 @@ class CoverageSearchThread(QThread):
 
         self.settings = QSettings()
 
+        # Number of geometries searched concurrently
+        self.coverage_workers = setting(
+            'coverage_workers', DEFAULT_COVERAGE_WORKERS,
+            expected_type=int, qsettings=self.settings)
+
+        # Size of the worker pool fetching the result thumbnails
+        self.thumbnail_workers = setting(
+            'thumbnail_workers', DEFAULT_THUMBNAIL_WORKERS,
+            expected_type=int, qsettings=self.settings)
+
+        # Thumbnails are deterministic per url, keep them across searches
+        self.thumbnail_cache = ContentCache(
+            geosys_profile_path('cache', 'thumbnails'),
+            max_size=setting(
+                'thumbnail_cache_size', THUMBNAIL_CACHE_SIZE,
+                expected_type=int, qsettings=self.settings),
+            max_age=setting(
+                'thumbnail_cache_max_age', THUMBNAIL_CACHE_MAX_AGE,
+                expected_type=int, qsettings=self.settings))
+
         self.need_stop = False
 
     def run(self):
         """Start thread job."""
         self.search_started.emit()
 
+        search_executor = ThreadPoolExecutor(
+            max_workers=max(1, self.coverage_workers))
+        search_futures = []
+        thumbnail_executor = ThreadPoolExecutor(
+            max_workers=max(1, self.thumbnail_workers))
+        thumbnail_futures = []
+
         # search
         try:
             self.mutex.lock()
@@ -233,26 +292,36 @@ class CoverageSearchThread(QThread):
                 SAMPLE_MAP['key']
             ]
 
-            collected_results = []
-            for geometry in self.geometries:
-                # Determines the approach required to do the coverage check
-                if self.map_product in catalog_imagery_api:
-                    results = searcher_client.get_catalog_imagery(
-                        geometry, self.crop_type, self.sowing_date,
-                        filters=self.filters
-                    )
-                else:
-                    # Makes use of the 'coverage' API calls
-                    results = searcher_client.get_coverage(
-                        geometry, self.crop_type, self.sowing_date,
-                        filters=self.filters)
+            # Determines the approach required to do the coverage check
+            if self.map_product in catalog_imagery_api:
+                search = searcher_client.get_catalog_imagery
+            else:
+                # Makes use of the 'coverage' API calls
+                search = searcher_client.get_coverage
+
+            # Coverage of every geometry is requested concurrently, results
+            # are handled as soon as their search is complete.
+            geometry_indexes = {}
+            for geometry_index, geometry in enumerate(self.geometries):
+                search_future = search_executor.submit(
+                    search, geometry, self.crop_type, self.sowing_date,
+                    filters=self.filters)
+                geometry_indexes[search_future] = geometry_index
+                search_futures.append(search_future)
+
+            for search_future in as_completed(search_futures):
+                if self.need_stop:
+                    break
+                results = search_future.result()
+                geometry_index = geometry_indexes[search_future]
 
                 if isinstance(results, dict) and results.get('message'):
                     # TODO handle model_validation_error
                     raise Exception(results['message'])
 
                 sample_map_ids = []
-                for result in results:
+                result_orders = {}
+                for result_index, result in enumerate(results):
                     # Get thumbnail content
                     if self.need_stop:
                         break
@@ -346,138 +415,32 @@ class CoverageSearchThread(QThread):
                     if not requested_map and self.map_product != SAMPLE_MAP['key']:
                         continue
 
-                    nitrogen_products = [
-                        INSEASONFIELD_AVERAGE_NDVI['key'],
-                        INSEASONFIELD_AVERAGE_LAI['key'],
-                        INSEASONFIELD_AVERAGE_REVERSE_NDVI['key'],
-                        INSEASONFIELD_AVERAGE_REVERSE_LAI['key']
-                    ]
-
-                    thumbnail_url = None
-                    if self.map_product == REFLECTANCE['key']:
-                        # Reflectance map type should make use of the INSEASON_NDVI thumbnail
-                        # This is a work-around provided by GeoSys
-                        thumbnail_url = (
-                                NDVI_THUMBNAIL_URL.format(
-                                    bridge_url=searcher_client.bridge_server,
-                                    id=result['seasonField']['id'],
-                                    date=result['image']['date']
-                                ))
-                    elif self.map_product == INSEASON_CVIN['key']:
-                        thumbnail_url = (
-                                CVIN_THUMBNAIL_URL.format(
-                                    bridge_url=searcher_client.bridge_server,
-                                    id=result['seasonField']['id'],
-                                    image=result['image']['id']
-                                ))
-                    elif self.map_product == INSEASON_S2REP['key']:
-                        thumbnail_url = (
-                            S2REP_THUMBNAIL_URL.format(
-                                bridge_url=searcher_client.bridge_server,
-                                id=result['seasonField']['id'],
-                                image=result['image']['id']
-                            ))
-                    elif self.map_product in nitrogen_products:
-                        # Nitrogen map type
-                        if self.map_product == INSEASONFIELD_AVERAGE_NDVI['key']:
-                            # INSEASON AVERAGE NDVI
-                            thumbnail_url = (
-                                NITROGEN_THUMBNAIL_URL.format(
-                                    bridge_url=searcher_client.bridge_server,
-                                    id=result['seasonField']['id'],
-                                    image=result['image']['id'],
-                                    nitrogen_map_type=INSEASONFIELD_AVERAGE_NDVI['key'],
-                                    n_value=str(self.n_planned_value)
-                                ))
-                        elif self.map_product == INSEASONFIELD_AVERAGE_LAI['key']:
-                            # INSEASON AVERAGE LAI
-                            thumbnail_url = (
-                                NITROGEN_THUMBNAIL_URL.format(
-                                    bridge_url=searcher_client.bridge_server,
-                                    id=result['seasonField']['id'],
-                                    image=result['image']['id'],
-                                    nitrogen_map_type=INSEASONFIELD_AVERAGE_LAI['key'],
-                                    n_value=str(self.n_planned_value)
-                                ))
-                        elif self.map_product == INSEASONFIELD_AVERAGE_REVERSE_NDVI['key']:
-                            # INSEASON AVERAGE REVERSE NDVI
-                            thumbnail_url = (
-                                NITROGEN_THUMBNAIL_URL.format(
-                                    bridge_url=searcher_client.bridge_server,
-                                    id=result['seasonField']['id'],
-                                    image=result['image']['id'],
-                                    nitrogen_map_type=INSEASONFIELD_AVERAGE_REVERSE_NDVI['key'],
-                                    n_value=str(self.n_planned_value)
-                                ))
-                        elif self.map_product == INSEASONFIELD_AVERAGE_REVERSE_LAI['key']:
-                            # INSEASON AVERAGE REVERSE LAI
-                            thumbnail_url = (
-                                NITROGEN_THUMBNAIL_URL.format(
-                                    bridge_url=searcher_client.bridge_server,
-                                    id=result['seasonField']['id'],
-                                    image=result['image']['id'],
-                                    nitrogen_map_type=INSEASONFIELD_AVERAGE_REVERSE_LAI['key'],
-                                    n_value=str(self.n_planned_value)
-                                ))
-                    elif self.map_product == YGM['key'] or self.map_product == YVM['key']:
-                        if self.map_product == YGM['key']:
-                            thumbnail_url = (
-                                YGM_THUMBNAIL_URL.format(
-                                    bridge_url=searcher_client.bridge_server,
-                                    id=result['seasonField']['id'],
-                                    image=result['image']['id']
-                                ))
-                        else:
-                            thumbnail_url = (
-                                YPM_THUMBNAIL_URL.format(
-                                    bridge_url=searcher_client.bridge_server,
-                                    id=result['seasonField']['id'],
-                                    image=result['image']['id']
-                                ))
-                    elif self.map_product == SAMZ['key']:
-                        thumbnail_url = (
-                            NDVI_THUMBNAIL_URL.format(
-                                bridge_url=searcher_client.bridge_server,
-                                id=result['seasonField']['id'],
-                                date=result['image']['date']
-                            ))
-                    elif self.map_product == SAMPLE_MAP['key']:
-                        # Sample maps
-                        thumbnail_url = (
-                            SAMPLEMAP_THUMBNAIL_URL.format(
-                                bridge_url=searcher_client.bridge_server,
-                                id=json_id
-                            ))
-                    else:  # All other map types
-                        thumbnail_url = (
-                            requested_map['_links'].get('thumbnail') or (
-                                NDVI_THUMBNAIL_URL.format(
-                                    bridge_url=searcher_client.bridge_server,
-                                    id=result['seasonField']['id'],
-                                    date=result['image']['date']
-                                )))
-
-                    if thumbnail_url:
-                        thumbnail_content = searcher_client.get_content(
-                            thumbnail_url)
-                        thumbnail_ba = QByteArray(thumbnail_content)
-                    else:
-                        thumbnail_ba = bytes('', 'utf-8')
+                    thumbnail_url = self.thumbnail_url(
+                        result, requested_map, json_id,
+                        searcher_client.bridge_server)
 
-                    collected_results.append({
-                        'data': result,
-                        'thumbnail': thumbnail_ba
-                    })
+                    # Thumbnails are fetched by the worker pool while the
+                    # remaining results are prepared.
+                    future = thumbnail_executor.submit(
+                        self.fetch_thumbnail,
+                        searcher_client, result, thumbnail_url,
+                        self.thumbnail_cache)
+                    result_orders[future] = (geometry_index, result_index)
+                    thumbnail_futures.append(future)
 
                     if self.map_product == SAMPLE_MAP['key']:
                         # Only one sample needs to be shown
                         # One set created from the points
                         break
 
-            # Using this trick, rendering each list item will not be delayed
-            # by thumbnail request.
-            for result in collected_results:
-                self.data_downloaded.emit(result['data'], result['thumbnail'])
+                # The results of a geometry are rendered as soon as their
+                # thumbnails arrive, the result list keeps them in order.
+                for future in as_completed(result_orders):
+                    if self.need_stop:
+                        break
+                    result, thumbnail_ba = future.result()
+                    self.data_downloaded.emit(
+                        result, thumbnail_ba, result_orders[future])
 
             self.search_finished.emit()
         except:
@@ -487,8 +450,171 @@ class CoverageSearchThread(QThread):
                     sys.exc_info()[1]))
             self.error_occurred.emit(error_text)
         finally:
+            for future in search_futures + thumbnail_futures:
+                future.cancel()
+            search_executor.shutdown(wait=True)
+            thumbnail_executor.shutdown(wait=True)
             self.mutex.unlock()
 
+    @staticmethod
+    def fetch_thumbnail(searcher_client, result, thumbnail_url, cache):
+        """Fetch the thumbnail of a single coverage result.
+
+        :param searcher_client: Authenticated Bridge API client.
+        :type searcher_client: BridgeAPI
+
+        :param result: Result of single map coverage.
+        :type result: dict
+
+        :param thumbnail_url: The thumbnail url.
+        :type thumbnail_url: str
+
+        :param cache: Thumbnail content cache.
+        :type cache: ContentCache
+
+        :return: The coverage result and its thumbnail data.
+        :rtype: tuple
+        """
+        if thumbnail_url:
+            thumbnail_content = searcher_client.get_cached_content(
+                thumbnail_url, cache,
+                namespace=searcher_client.cache_namespace)
+            thumbnail_ba = QByteArray(thumbnail_content)
+        else:
+            thumbnail_ba = bytes('', 'utf-8')
+        return result, thumbnail_ba
+
+    def thumbnail_url(self, result, requested_map, json_id, bridge_server):
+        """Get the thumbnail url of a single coverage result.
+
+        :param result: Result of single map coverage.
+        :type result: dict
+
+        :param requested_map: Map of the result matching the map product.
+        :type requested_map: dict
+
+        :param json_id: ID of the created sample map.
+        :type json_id: str
+
+        :param bridge_server: Bridge API server url.
+        :type bridge_server: str
+
+        :return: The thumbnail url or None.
+        :rtype: str
+        """
+        nitrogen_products = [
+            INSEASONFIELD_AVERAGE_NDVI['key'],
+            INSEASONFIELD_AVERAGE_LAI['key'],
+            INSEASONFIELD_AVERAGE_REVERSE_NDVI['key'],
+            INSEASONFIELD_AVERAGE_REVERSE_LAI['key']
+        ]
+
+        thumbnail_url = None
+        if self.map_product == REFLECTANCE['key']:
+            # Reflectance map type should make use of the INSEASON_NDVI thumbnail
+            # This is a work-around provided by GeoSys
+            thumbnail_url = (
+                    NDVI_THUMBNAIL_URL.format(
+                        bridge_url=bridge_server,
+                        id=result['seasonField']['id'],
+                        date=result['image']['date']
+                    ))
+        elif self.map_product == INSEASON_CVIN['key']:
+            thumbnail_url = (
+                    CVIN_THUMBNAIL_URL.format(
+                        bridge_url=bridge_server,
+                        id=result['seasonField']['id'],
+                        image=result['image']['id']
+                    ))
+        elif self.map_product == INSEASON_S2REP['key']:
+            thumbnail_url = (
+                S2REP_THUMBNAIL_URL.format(
+                    bridge_url=bridge_server,
+                    id=result['seasonField']['id'],
+                    image=result['image']['id']
+                ))
+        elif self.map_product in nitrogen_products:
+            # Nitrogen map type
+            if self.map_product == INSEASONFIELD_AVERAGE_NDVI['key']:
+                # INSEASON AVERAGE NDVI
+                thumbnail_url = (
+                    NITROGEN_THUMBNAIL_URL.format(
+                        bridge_url=bridge_server,
+                        id=result['seasonField']['id'],
+                        image=result['image']['id'],
+                        nitrogen_map_type=INSEASONFIELD_AVERAGE_NDVI['key'],
+                        n_value=str(self.n_planned_value)
+                    ))
+            elif self.map_product == INSEASONFIELD_AVERAGE_LAI['key']:
+                # INSEASON AVERAGE LAI
+                thumbnail_url = (
+                    NITROGEN_THUMBNAIL_URL.format(
+                        bridge_url=bridge_server,
+                        id=result['seasonField']['id'],
+                        image=result['image']['id'],
+                        nitrogen_map_type=INSEASONFIELD_AVERAGE_LAI['key'],
+                        n_value=str(self.n_planned_value)
+                    ))
+            elif self.map_product == INSEASONFIELD_AVERAGE_REVERSE_NDVI['key']:
+                # INSEASON AVERAGE REVERSE NDVI
+                thumbnail_url = (
+                    NITROGEN_THUMBNAIL_URL.format(
+                        bridge_url=bridge_server,
+                        id=result['seasonField']['id'],
+                        image=result['image']['id'],
+                        nitrogen_map_type=INSEASONFIELD_AVERAGE_REVERSE_NDVI['key'],
+                        n_value=str(self.n_planned_value)
+                    ))
+            elif self.map_product == INSEASONFIELD_AVERAGE_REVERSE_LAI['key']:
+                # INSEASON AVERAGE REVERSE LAI
+                thumbnail_url = (
+                    NITROGEN_THUMBNAIL_URL.format(
+                        bridge_url=bridge_server,
+                        id=result['seasonField']['id'],
+                        image=result['image']['id'],
+                        nitrogen_map_type=INSEASONFIELD_AVERAGE_REVERSE_LAI['key'],
+                        n_value=str(self.n_planned_value)
+                    ))
+        elif self.map_product == YGM['key'] or self.map_product == YVM['key']:
+            if self.map_product == YGM['key']:
+                thumbnail_url = (
+                    YGM_THUMBNAIL_URL.format(
+                        bridge_url=bridge_server,
+                        id=result['seasonField']['id'],
+                        image=result['image']['id']
+                    ))
+            else:
+                thumbnail_url = (
+                    YPM_THUMBNAIL_URL.format(
+                        bridge_url=bridge_server,
+                        id=result['seasonField']['id'],
+                        image=result['image']['id']
+                    ))
+        elif self.map_product == SAMZ['key']:
+            thumbnail_url = (
+                NDVI_THUMBNAIL_URL.format(
+                    bridge_url=bridge_server,
+                    id=result['seasonField']['id'],
+                    date=result['image']['date']
+                ))
+        elif self.map_product == SAMPLE_MAP['key']:
+            # Sample maps
+            thumbnail_url = (
+                SAMPLEMAP_THUMBNAIL_URL.format(
+                    bridge_url=bridge_server,
+                    id=json_id
+                ))
+        else:  # All other map types
+            thumbnail_url = (
+                requested_map['_links'].get('thumbnail') or (
+                    NDVI_THUMBNAIL_URL.format(
+                        bridge_url=bridge_server,
+                        id=result['seasonField']['id'],
+                        date=result['image']['date']
+                    )))
+
+        return thumbnail_url
+
     def stop(self):
         """Stop thread job."""
         self.need_stop = True
@@ -505,7 +631,10 @@ def create_map(
         max_yield_val,
         sample_map_id=None,
         data=None,
-        params=None):
+        params=None,
+        feedback=None,
+        bridge_api=None,
+        keep_archive=None):
     """Create map based on given parameters.
 
     :param map_specification: Result of single map coverage specifications.
@@ -569,7 +698,51 @@ def create_map(
     
     :param params: Map creation parameters.
     :type params: dict
+
+    :param feedback: Object reporting progress and cancellation e.g.
+        QgsFeedback or QgsTask.
+    :type feedback: QgsFeedback
+
+    :param bridge_api: Authenticated Bridge API client, one is created
+        from the settings if not given.
+    :type bridge_api: BridgeAPI
+
+    :param keep_archive: Whether zipped maps are kept as downloaded, see
+        download_field_map.
+    :type keep_archive: bool
+
+    :return: Tuple of (is_success, message, layers), see
+        download_field_map.
+    :rtype: tuple
     """""
+    return download_field_map(
+        feedback=feedback,
+        keep_archive=keep_archive,
+        **request_map(
+            map_specification, output_dir, filename, output_map_format,
+            n_planned_value, yield_val, min_yield_val, max_yield_val,
+            sample_map_id=sample_map_id, data=data, params=params,
+            bridge_api=bridge_api))
+
+
+def request_map(
+        map_specification,
+        output_dir,
+        filename,
+        output_map_format,
+        n_planned_value,
+        yield_val,
+        min_yield_val,
+        max_yield_val,
+        sample_map_id=None,
+        data=None,
+        params=None,
+        bridge_api=None):
+    """Request the creation of a map, see create_map.
+
+    :return: Keyword arguments of download_field_map.
+    :rtype: dict
+    """
     # Construct map creation parameters
     map_specification.update(map_specification['maps'][0])
     map_type_key = map_specification['type']
@@ -581,9 +754,10 @@ def create_map(
     params = params if params else {}
     data.update({'params': params})
 
-    bridge_api = BridgeAPI(
-        *credentials_parameters_from_settings(),
-        proxies=QGISSettings.get_qgis_proxy())
+    if bridge_api is None:
+        bridge_api = BridgeAPI(
+            *credentials_parameters_from_settings(),
+            proxies=QGISSettings.get_qgis_proxy())
     field_map_json = bridge_api.get_field_map(
         map_type_key,
         season_field_id,
@@ -599,7 +773,7 @@ def create_map(
     if map_type_key == SAMPLE_MAP['key']:
         field_map_json = map_specification
 
-    return download_field_map(
+    return dict(
         field_map_json=field_map_json,
         map_type_key=map_type_key,
         destination_base_path=destination_base_path,
@@ -616,7 +790,8 @@ def create_difference_map(
         filename,
         output_map_format,
         data=None,
-        params=None):
+        params=None,
+        feedback=None):
     """Create map based on given parameters.
 
     :param map_specifications: List of map coverage specification.
@@ -665,7 +840,34 @@ def create_difference_map(
 
     :param params: Map creation parameters.
     :type params: dict
+
+    :param feedback: Object reporting progress and cancellation e.g.
+        QgsFeedback or QgsTask.
+    :type feedback: QgsFeedback
+
+    :return: Tuple of (is_success, message, layers), see
+        download_field_map.
+    :rtype: tuple
     """""
+    return download_field_map(
+        feedback=feedback,
+        **request_difference_map(
+            map_specifications, output_dir, filename, output_map_format,
+            data=data, params=params))
+
+
+def request_difference_map(
+        map_specifications,
+        output_dir,
+        filename,
+        output_map_format,
+        data=None,
+        params=None):
+    """Request the creation of a difference map, see create_difference_map.
+
+    :return: Keyword arguments of download_field_map.
+    :rtype: dict
+    """
     # Difference map only created from 2 map specifications.
     # Map type and season field id should always be the same between two map.
     for map_specification in map_specifications:
@@ -693,7 +895,7 @@ def create_difference_map(
         map_type_key, season_field_id,
         earliest_image_date, latest_image_date, **data)
 
-    return download_field_map(
+    return dict(
         field_map_json=difference_map_json,
         map_type_key=map_type_key,
         destination_base_path=destination_base_path,
@@ -710,7 +912,8 @@ def create_samz_map(
         filename,
         output_map_format,
         data=None,
-        params=None):
+        params=None,
+        feedback=None):
     """Create map based on given parameters.
 
     :param season_field_id: ID of the season field.
@@ -742,7 +945,37 @@ def create_samz_map(
 
     :param params: Map creation parameters.
     :type params: dict
+
+    :param feedback: Object reporting progress and cancellation e.g.
+        QgsFeedback or QgsTask.
+    :type feedback: QgsFeedback
+
+    :return: Tuple of (is_success, message, layers), see
+        download_field_map.
+    :rtype: tuple
     """""
+    return download_field_map(
+        feedback=feedback,
+        **request_samz_map(
+            season_field_id, list_of_image_ids, list_of_image_date,
+            output_dir, filename, output_map_format,
+            data=data, params=params))
+
+
+def request_samz_map(
+        season_field_id,
+        list_of_image_ids,
+        list_of_image_date,
+        output_dir,
+        filename,
+        output_map_format,
+        data=None,
+        params=None):
+    """Request the creation of a SAMZ map, see create_samz_map.
+
+    :return: Keyword arguments of download_field_map.
+    :rtype: dict
+    """
     map_type_key = SAMZ['key']
     destination_base_path = os.path.join(output_dir, filename)
     data = data if data else {}
@@ -759,7 +992,7 @@ def create_samz_map(
         **data
     )
 
-    return download_field_map(
+    return dict(
         field_map_json=samz_map_json,
         map_type_key=map_type_key,
         destination_base_path=destination_base_path,
@@ -770,7 +1003,8 @@ def create_samz_map(
 
 def download_field_map(
         field_map_json, map_type_key, destination_base_path,
-        output_map_format, headers, map_specification=None, data=None, image_id=''):
+        output_map_format, headers, map_specification=None, data=None, image_id='',
+        feedback=None, keep_archive=None):
     """Download field map from requested field map json.
 
     :param field_map_json: JSON response from Bridge API field map request.
@@ -821,14 +1055,30 @@ def download_field_map(
 
     :param image_id: Image ID used for the catalog-image requests
     :type image_id: str
+
+    :param feedback: Object reporting progress and cancellation e.g.
+        QgsFeedback or QgsTask.
+    :type feedback: QgsFeedback
+
+    :param keep_archive: Whether zipped maps are kept as downloaded instead
+        of being extracted, see keep_zipped_maps. Read from the
+        keep_zipped_maps setting if not given.
+    :type keep_archive: bool
+
+    :return: Tuple of (is_success, message, layers). Layers is the list of
+        (uri, name) of the hotspot and segment layers written with the map,
+        they are loaded by the caller on the main thread.
+    :rtype: tuple
     """
+    if keep_archive is None:
+        keep_archive = keep_zipped_maps()
     message = '{} map successfully created.'.format(map_type_key)
     if not field_map_json.get('seasonField'):
         # field map request error
         message = '{} map request failed.'.format(map_type_key)
         if field_map_json.get('message'):
             message = '{} {}'.format(message, field_map_json['message'])
-        return False, message
+        return False, message, []
     # If request succeeded, download zipped map and extract it
     # in requested format.
     map_extension = output_map_format['extension']
@@ -870,17 +1120,33 @@ def download_field_map(
             '{} format not found. '
             'Please select another output format.'.format(
                 output_map_format['api_key']))
-        return False, message
-
+        return False, message, []
+
+    # Every asset is downloaded to a staging directory next to the output,
+    # the outputs are only written once all of them succeeded. The staging
+    # directory is kept when a failed or canceled download left a partial
+    # file, so that downloading the map again to the same path resumes it.
+    staging_dir = os.path.join(
+        os.path.dirname(destination_base_path),
+        '.staging_{}'.format(os.path.basename(destination_base_path)))
+    if not os.path.exists(staging_dir):
+        os.makedirs(staging_dir)
+    hotspot_executor = None
+    downloads = []
+    layers = []
     try:
         if output_map_format in ZIPPED_FORMAT:
-            zip_path = tempfile.mktemp('{}.zip'.format(map_extension))
-            fetch_data(url, zip_path, headers=headers)
-            extract_zip(zip_path, destination_base_path)
+            zip_path = os.path.join(
+                staging_dir, 'map{}.zip'.format(map_extension))
+            downloads.append(download_file(url, zip_path, headers=headers))
         else:
             destination_filename = (
                     destination_base_path + output_map_format['extension'])
-            fetch_data(url, destination_filename, headers=headers)
+            downloads.append(download_file(
+                url,
+                os.path.join(
+                    staging_dir, os.path.basename(destination_filename)),
+                headers=headers))
             if output_map_format == PNG or output_map_format == PNG_KMZ:
                 # Download associated legend and world-file for geo-referencing
                 # the PNG file.
@@ -911,12 +1177,17 @@ def download_field_map(
 
                     destination_filename = '{}{}'.format(
                         destination_base_path, item['extension'])
-                    fetch_data(url, destination_filename, headers=headers)
-        # Get hotspots for zones if they have been requested by user.
-        bridge_api = BridgeAPI(
-            *credentials_parameters_from_settings(),
-            proxies=QGISSettings.get_qgis_proxy())
+                    downloads.append(download_file(
+                        url,
+                        os.path.join(
+                            staging_dir,
+                            os.path.basename(destination_filename)),
+                        headers=headers))
 
+        # Get hotspots for zones if they have been requested by user.
+        # The Bridge API request runs in a thread while the assets are
+        # being downloaded.
+        hotspot_future = None
         if data.get('zoning') and data.get('hotspot'):
             hotspot_per_part = False
             if data.get('zoningSegmentation'):
@@ -936,9 +1207,63 @@ def download_field_map(
             hotspot_url = '{}&hotSpotFilter={}'.format(hotspot_url, data.get('filter')) \
                 if data.get('filter') else hotspot_url
 
-            map_json = bridge_api.get_hotspot(hotspot_url)
-
+            hotspot_executor = ThreadPoolExecutor(max_workers=1)
+            hotspot_future = hotspot_executor.submit(
+                get_hotspot,
+                hotspot_url,
+                credentials_parameters_from_settings(),
+                QGISSettings.get_qgis_proxy())
+
+        wait_for_downloads(downloads, feedback=feedback)
+        if feedback and feedback.isCanceled():
+            return False, 'Map creation canceled.', []
+        for download in downloads:
+            # Raises the error of the first failed download
+            download.result()
+        map_json = hotspot_future.result() if hotspot_future else None
+
+        # Commit the output set
+        geopackage_path = vector_output_geopackage(
+            os.path.dirname(destination_base_path))
+        if output_map_format in ZIPPED_FORMAT and keep_archive:
+            os.replace(
+                downloads[0].result(), destination_base_path + ZIP_EXT)
+        elif output_map_format == ZIPPED_SHP and geopackage_path:
+            # The shapefile is extracted in the staging directory and only
+            # its layer is kept, in the session GeoPackage.
+            layer_name = os.path.basename(destination_base_path)
+            staged_base_path = os.path.join(staging_dir, layer_name)
+            extract_zip(downloads[0].result(), staged_base_path)
+            staged_layer = QgsVectorLayer(
+                staged_base_path + SHP_EXT, layer_name, 'ogr')
+            uri = write_to_geopackage(
+                staged_layer, geopackage_path, layer_name)
+            # Release the shapefile before the staging directory is removed
+            del staged_layer
+            if not uri:
+                return (
+                    False, 'Failed to write the map to the GeoPackage.', [])
+        elif output_map_format in ZIPPED_FORMAT:
+            extract_zip(downloads[0].result(), destination_base_path)
+            if output_map_format == ZIPPED_TIFF and optimize_rasters():
+                # extract_zip keeps the extension of a destination having one
+                raster_path = destination_base_path
+                if not os.path.splitext(raster_path)[1]:
+                    raster_path += TIFF_EXT
+                convert_to_cog(raster_path)
+        else:
+            for download in downloads:
+                staged_path = download.result()
+                destination_filename = os.path.join(
+                    os.path.dirname(destination_base_path),
+                    os.path.basename(staged_path))
+                if os.path.exists(destination_filename):
+                    os.remove(destination_filename)
+                os.rename(staged_path, destination_filename)
+
+        if map_json is not None:
             output_dir = setting('output_directory', expected_type=str)
+            _, layer_extension = hotspot_layer_format()
 
             if map_json.get('hotSpots'):
                 if map_specification:
@@ -947,18 +1272,22 @@ def download_field_map(
                             map_specification['seasonField']['id'],
                             map_specification['image']['date']
                         )
-                        hotspot_filename = check_if_file_exists(output_dir, hotspot_filename, SHP_EXT)
+                        hotspot_filename = vector_output_name(
+                            output_dir, hotspot_filename, layer_extension)
                     else:
                         hotspot_filename = 'HotspotsPerPolygon_{}_{}'.format(
                             map_specification['seasonField']['id'],
                             map_specification['image']['date']
                         )
-                        hotspot_filename = check_if_file_exists(output_dir, hotspot_filename, SHP_EXT)
-                create_hotspot_layer(
+                        hotspot_filename = vector_output_name(
+                            output_dir, hotspot_filename, layer_extension)
+                hotspot_uri = create_hotspot_layer(
                     map_json.get('hotSpots'),
                     'hotspots',
                     hotspot_filename
                 )
+                if hotspot_uri:
+                    layers.append((hotspot_uri, hotspot_filename))
 
             if map_json.get('zones'):
                 if map_specification:
@@ -967,58 +1296,188 @@ def download_field_map(
                             map_specification['seasonField']['id'],
                             map_specification['image']['date']
                         )
-                        segment_filename = check_if_file_exists(output_dir, segment_filename, SHP_EXT)
+                        segment_filename = vector_output_name(
+                            output_dir, segment_filename, layer_extension)
                     else:
                         segment_filename = 'SegmentsPerPolygon_{}_{}'.format(
                             map_specification['seasonField']['id'],
                             map_specification['image']['date']
                         )
-                        segment_filename = check_if_file_exists(output_dir, segment_filename, SHP_EXT)
-                create_hotspot_layer(
+                        segment_filename = vector_output_name(
+                            output_dir, segment_filename, layer_extension)
+                segment_uri = create_hotspot_layer(
                     map_json.get('zones'),
                     'segments',
                     segment_filename
                 )
+                if segment_uri:
+                    layers.append((segment_uri, segment_filename))
     except:
         # zip extraction error
         message = 'Failed to download file.'
-        return False, message
-    return True, message
+        return False, message, []
+    finally:
+        for download in downloads:
+            download.cancel()
+        if hotspot_executor:
+            hotspot_executor.shutdown(wait=True)
+        if not has_partial_downloads(staging_dir):
+            shutil.rmtree(staging_dir, ignore_errors=True)
+    return True, message, layers
+
+
+def get_hotspot(hotspot_url, credentials, proxies=None):
+    """Get zone hotspots.
+
+    :param hotspot_url: Url of the map with the hotspot parameters.
+    :type hotspot_url: str
+
+    :param credentials: Credentials parameters for Bridge API, see
+        credentials_parameters_from_settings.
+    :type credentials: tuple
+
+    :param proxies: Proxies used by the requests.
+    :type proxies: dict
+
+    :return: JSON response with the hotSpots and zones.
+    :rtype: dict
+    """
+    bridge_api = BridgeAPI(*credentials, proxies=proxies)
+    return bridge_api.get_hotspot(hotspot_url)
 
 
 def credentials_parameters_from_settings():
     """Credentials parameters for Bridge API
 
+    Maps are created on worker threads, so a QSettings object is created
+    for each call instead of sharing the module one between threads.
+
     :return: Credentials parameters.
     :rtype: tuple
     """
+    qsettings = QSettings()
+
     # Retrieve user's settings credentials.
     username = setting(
         'bridge_api_username',
-        expected_type=str, qsettings=settings)
+        expected_type=str, qsettings=qsettings)
     password = setting(
         'bridge_api_password',
-        expected_type=str, qsettings=settings)
+        expected_type=str, qsettings=qsettings)
     client_id = setting(
         'bridge_api_client_id',
-        expected_type=str, qsettings=settings)
+        expected_type=str, qsettings=qsettings)
     client_secret = setting(
         'bridge_api_client_secret',
-        expected_type=str, qsettings=settings)
+        expected_type=str, qsettings=qsettings)
 
     # define geosys region
     is_region_eu = setting(
         'geosys_region_eu',
-        expected_type=bool, qsettings=settings)
+        expected_type=bool, qsettings=qsettings)
     region = 'eu' if is_region_eu else 'na'
 
     # define prod or testing service
     use_testing_service = setting(
         'use_testing_service',
-        expected_type=bool, qsettings=settings)
+        expected_type=bool, qsettings=qsettings)
 
     # RETURNED VALUES ORDER FOLLOWS BRIDGE API WRAPPER CLASS PARAMETERS ORDER
     return (
         username, password, region, client_id, client_secret,
         use_testing_service
     )
+
+
+def setup_coverage_cache():
+    """Configure the coverage response cache from the settings.
+
+    The persistent SQLite tier is stored in the GEOSYS folder of the user
+    profile and only used when the coverage_cache_persistent setting is on.
+    """
+    COVERAGE_CACHE.ttl = setting(
+        'coverage_cache_ttl', COVERAGE_CACHE_TTL,
+        expected_type=int, qsettings=settings)
+    use_database = setting(
+        'coverage_cache_persistent', False,
+        expected_type=bool, qsettings=settings)
+    db_path = None
+    if use_database:
+        db_path = os.path.join(
+            geosys_profile_path('cache'), 'coverage.sqlite')
+    COVERAGE_CACHE.set_database(db_path)
+
+
+def setup_http_session():
+    """Configure the connection pool of the shared HTTP session.
+
+    The http_pool_connections, http_pool_maxsize and http_pool_block
+    settings set the number of cached per-host pools, the connections kept
+    open per host and whether requests wait for a free connection.
+    """
+    configure_session(
+        pool_connections=setting(
+            'http_pool_connections', DEFAULT_POOL_CONNECTIONS,
+            expected_type=int, qsettings=settings),
+        pool_maxsize=setting(
+            'http_pool_maxsize', DEFAULT_POOL_MAXSIZE,
+            expected_type=int, qsettings=settings),
+        pool_block=setting(
+            'http_pool_block', DEFAULT_POOL_BLOCK,
+            expected_type=bool, qsettings=settings))
+
+
+def map_store_from_settings():
+    """Store of created maps configured from the settings.
+
+    The store is disabled unless the map_store_size setting gives its size
+    budget in bytes. It is in the GEOSYS folder of the user profile unless
+    the map_store_directory setting points elsewhere, e.g. to a shared
+    drive.
+
+    :return: The map store, None if disabled.
+    :rtype: MapStore
+    """
+    qsettings = QSettings()
+    max_size = setting(
+        'map_store_size', MAP_STORE_SIZE,
+        expected_type=int, qsettings=qsettings)
+    if max_size <= 0:
+        return None
+    directory = setting(
+        'map_store_directory', '',
+        expected_type=str, qsettings=qsettings)
+    try:
+        return MapStore(
+            directory or geosys_profile_path('maps'), max_size)
+    except OSError as e:
+        LOGGER.debug('Unable to open the map store: %s' % e)
+        return None
+
+
+def keep_zipped_maps():
+    """Whether zipped maps are kept as downloaded.
+
+    With the keep_zipped_maps setting on, ZIPPED_TIFF and ZIPPED_SHP maps
+    are saved as their zip file and loaded through GDAL /vsizip/ paths,
+    which saves writing and reading the extracted map again.
+
+    :rtype: bool
+    """
+    return setting(
+        'keep_zipped_maps', False,
+        expected_type=bool, qsettings=QSettings())
+
+
+def optimize_rasters():
+    """Whether downloaded GeoTIFF maps are converted to COG.
+
+    With the optimize_rasters setting on, extracted GeoTIFF maps are
+    converted to tiled and compressed Cloud-Optimized GeoTIFFs with internal
+    overviews, which QGIS renders interactively even when they are large.
+
+    :rtype: bool
+    """
+    return setting(
+        'optimize_rasters', False,
+        expected_type=bool, qsettings=QSettings())
@@ -22,15 +22,19 @@
  *                                                                         *
  ***************************************************************************/
 """
+import copy
 import os
 import sys
+from functools import partial
 
 from PyQt5 import QtGui, QtWidgets
 from PyQt5.QtCore import pyqtSignal, QSettings, QMutex, QDate
 from PyQt5.QtGui import QCursor
-from PyQt5.QtWidgets import QLabel, QListWidgetItem, QMessageBox, QApplication
+from PyQt5.QtWidgets import (
+    QLabel, QListWidgetItem, QMessageBox, QApplication, QPushButton)
 
 from qgis.core import (
+    Qgis,
     QgsProject,
     QgsFeatureRequest,
     QgsVectorLayer,
@@ -43,9 +47,10 @@ from geosys.bridge_api.default import (
     VECTOR_FORMAT, PNG, PNG_KMZ, ZIPPED_TIFF, ZIPPED_SHP, KMZ,
     VALID_QGIS_FORMAT, YIELD_AVERAGE, YIELD_MINIMUM, YIELD_MAXIMUM,
     ORGANIC_AVERAGE, POSITION, FILTER, SAMZ_ZONE, SAMZ_ZONING, HOTSPOT,
-    ZONING_SEGMENTATION, MAX_FEATURE_NUMBERS, DEFAULT_ZONE_COUNT, GAIN,
-    OFFSET, DEFAULT_N_PLANNED, DEFAULT_AVE_YIELD, DEFAULT_MIN_YIELD,
-    DEFAULT_MAX_YIELD, DEFAULT_ORGANIC_AVE, DEFAULT_GAIN, DEFAULT_OFFSET
+    ZONING_SEGMENTATION, MAX_FEATURE_NUMBERS, MAX_SAMPLE_POINTS,
+    DEFAULT_ZONE_COUNT, GAIN, OFFSET, DEFAULT_N_PLANNED, DEFAULT_AVE_YIELD,
+    DEFAULT_MIN_YIELD, DEFAULT_MAX_YIELD, DEFAULT_ORGANIC_AVE, DEFAULT_GAIN,
+    DEFAULT_OFFSET, DEFAULT_MAP_CREATION_WORKERS, ZIPPED_FORMAT, ZIP_EXT
 )
 from geosys.bridge_api.definitions import (
     ARCHIVE_MAP_PRODUCTS, ALL_SENSORS, SENSORS, INSEASON_NDVI, INSEASON_EVI,
@@ -58,21 +63,36 @@ from geosys.bridge_api.definitions import (
 from geosys.bridge_api.utilities import get_definition
 from geosys.ui.help.help_dialog import HelpDialog
 from geosys.ui.widgets.geosys_coverage_downloader import (
-    CoverageSearchThread, create_map, create_difference_map, create_samz_map
+    CoverageSearchThread, request_map, request_difference_map,
+    request_samz_map, map_store_from_settings, keep_zipped_maps,
+    credentials_parameters_from_settings
 )
 from geosys.ui.widgets.geosys_itemwidget import CoverageSearchResultItemWidget
+from geosys.ui.widgets.map_creation_task import MapCreationTask
+from geosys.utilities.downloader import zip_member_path
 from geosys.utilities.gui_utilities import (
     add_ordered_combo_item, layer_icon, is_polygon_layer, layer_from_combo,
-    add_layer_to_canvas, reproject, item_data_from_combo,
+    add_layer_to_canvas, reprojected_features, item_data_from_combo,
     wkt_geometries_from_feature_iterator, item_text_from_combo,
-    is_point_layer, attribute_from_feature_iterator
+    is_point_layer, attribute_from_feature_iterator,
+    geopackage_layer_uri, vector_output_geopackage, write_to_geopackage
 )
+from geosys.utilities.geopackage import (
+    layer_names, layer_uri, split_layer_uri)
+from geosys.utilities.job_queue import JobQueue, FAILED
+from geosys.utilities.run_manifest import RunManifest
 from geosys.utilities.resources import get_ui_class
 from geosys.utilities.settings import setting, set_setting
-from geosys.utilities.utilities import check_if_file_exists
+from geosys.utilities.utilities import (
+    check_if_file_exists,
+    copy_map_outputs
+)
 
 FORM_CLASS = get_ui_class('geosys_dockwidget_base.ui')
 
+# Item data role of the order of a coverage result
+COVERAGE_ORDER_ROLE = Qt.UserRole + 1
+
 
 class GeosysPluginDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
     closingPlugin = pyqtSignal()
@@ -93,6 +113,21 @@ class GeosysPluginDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
         self.settings = QSettings()
         self.one_process_work = QMutex()
         self.search_threads = None
+
+        # Map creation jobs run in the background
+        self.map_creation_queue = JobQueue(
+            max_workers=setting(
+                'map_creation_workers', DEFAULT_MAP_CREATION_WORKERS,
+                expected_type=int, qsettings=self.settings),
+            parent=self)
+        self.map_creation_queue.job_status_changed.connect(
+            self.map_creation_job_changed)
+        self.map_creation_queue.finished.connect(self.map_creation_finished)
+        self.map_creation_message = None
+        # Output names of the queued maps
+        self.reserved_filenames = set()
+        # Copies of the maps being created, by map request key
+        self.coalesced_maps = {}
         self.max_stacked_widget_index = self.stacked_widget.count() - 1
         self.current_stacked_widget_index = 0
 
@@ -529,24 +564,121 @@ class GeosysPluginDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
             if wd['widget'].isChecked():
                 return wd['data']
 
-    def load_layer(self, base_path):
+    def load_layer(self, base_path, output_map_format=None):
         """Load layer into QGIS map canvas.
 
         :param base_path: Base path of the layer.
         :type base_path: str
+
+        :param output_map_format: Format of the layer, the selected output
+            format if not given.
+        :type output_map_format: dict
         """
-        if self.output_map_format in VALID_QGIS_FORMAT:
+        output_map_format = output_map_format or self.output_map_format
+        if output_map_format in VALID_QGIS_FORMAT:
             filename = os.path.basename(base_path)
-            if self.output_map_format in VECTOR_FORMAT:
-                map_layer = QgsVectorLayer(
-                    base_path + self.output_map_format['extension'],
-                    filename)
+            layer_path = base_path + output_map_format['extension']
+            archive_path = base_path + ZIP_EXT
+            if output_map_format in ZIPPED_FORMAT and \
+                    not os.path.exists(layer_path) and \
+                    os.path.exists(archive_path):
+                # The map was kept zipped, it is read from the archive.
+                layer_path = zip_member_path(
+                    archive_path,
+                    output_map_format['extension']) or layer_path
+            geopackage_path = vector_output_geopackage(
+                os.path.dirname(base_path))
+            if output_map_format == ZIPPED_SHP and geopackage_path and \
+                    not os.path.exists(layer_path):
+                # The map is a layer of the session GeoPackage.
+                layer_path = geopackage_layer_uri(geopackage_path, filename)
+            if output_map_format in VECTOR_FORMAT:
+                map_layer = QgsVectorLayer(layer_path, filename)
             else:
-                map_layer = QgsRasterLayer(
-                    base_path + self.output_map_format['extension'],
-                    filename)
+                map_layer = QgsRasterLayer(layer_path, filename)
             add_layer_to_canvas(map_layer, filename)
 
+    def output_extension(self):
+        """Extension of the output file of the selected map format.
+
+        :return: The extension, the zip one when zipped maps are kept.
+        :rtype: str
+        """
+        if self.output_map_format in ZIPPED_FORMAT and keep_zipped_maps():
+            return ZIP_EXT
+        return self.output_map_format['extension']
+
+    def output_geopackage(self, output_map_format=None):
+        """Session GeoPackage a map is written to, see download_field_map.
+
+        :param output_map_format: Format of the map, the selected output
+            format if not given.
+        :type output_map_format: dict
+
+        :return: Path of the GeoPackage, None if the map is written as files.
+        :rtype: str
+        """
+        output_map_format = output_map_format or self.output_map_format
+        if output_map_format != ZIPPED_SHP or keep_zipped_maps():
+            return None
+        return vector_output_geopackage(self.output_directory)
+
+    def map_output(self, filename):
+        """Output of a map, relative to the output directory.
+
+        :param filename: Output name of the map.
+        :type filename: str
+
+        :return: The output file, or the uri of the layer when the map is a
+            layer of the session GeoPackage.
+        :rtype: str
+        """
+        geopackage_path = self.output_geopackage()
+        if geopackage_path:
+            return layer_uri(os.path.basename(geopackage_path), filename)
+        return filename + self.output_extension()
+
+    def output_filename(self, output):
+        """Output name of a map from its output, see map_output.
+
+        :param output: The output of the map.
+        :type output: str
+
+        :return: The output name, None if the output was not written in the
+            selected output format.
+        :rtype: str
+        """
+        _, filename = split_layer_uri(output)
+        if filename is None:
+            extension = self.output_extension()
+            if not output.endswith(extension):
+                return None
+            filename = output[:-len(extension)]
+        if self.map_output(filename) != output:
+            return None
+        return filename
+
+    def unique_filename(self, filename):
+        """Output name of a map not clashing with the existing outputs.
+
+        The name is reserved until the map is written.
+
+        :param filename: The preferred output name.
+        :type filename: str
+
+        :return: The output name.
+        :rtype: str
+        """
+        geopackage_path = self.output_geopackage()
+        return check_if_file_exists(
+            self.output_directory,
+            filename,
+            self.output_extension(),
+            reserved=self.reserved_filenames,
+            # Layers of the GeoPackage with the same name would be replaced
+            taken=layer_names(geopackage_path) if geopackage_path else None
+        )
+
     def save_parameter_values_as_setting(self):
         """Save parameter values as qsettings."""
         for key, form in self.map_creation_parameters_settings.items():
@@ -641,16 +773,13 @@ class GeosysPluginDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
                 layer.selectedFeatureCount() > 0))
         use_single_geometry = self.single_geometry_checkbox.isChecked()
 
-        # Reproject layer to EPSG:4326
-        if layer.crs().authid() != 'EPSG:4326':
-            layer = reproject(
-                layer, QgsCoordinateReferenceSystem('EPSG:4326'))
-
-        feature_iterator = layer.getFeatures()
+        request = QgsFeatureRequest()
         if use_selected_features:
-            request = QgsFeatureRequest()
             request.setFilterFids(layer.selectedFeatureIds())
-            feature_iterator = layer.getFeatures(request)
+
+        # Reproject features to EPSG:4326
+        feature_iterator = reprojected_features(
+            layer, QgsCoordinateReferenceSystem('EPSG:4326'), request)
 
         # Handle multi features
         # Merge features into multi-part polygon
@@ -698,7 +827,7 @@ class GeosysPluginDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
                 feature_points_iterator2 = layer_points.getFeatures(request)
 
             self.wkt_point_geometries = wkt_geometries_from_feature_iterator(
-                feature_points_iterator, MAX_FEATURE_NUMBERS, use_single_geometry)
+                feature_points_iterator, MAX_SAMPLE_POINTS, use_single_geometry)
 
             self.attributes = attribute_from_feature_iterator(feature_points_iterator2, self.sample_map_field)
 
@@ -808,6 +937,21 @@ class GeosysPluginDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
                     )
 
         zone_cnt = self.samz_zone_form.value()
+        # Maps already created in the output directory by a previous run
+        # are loaded instead of being requested again.
+        manifest = RunManifest(self.output_directory)
+        # Hotspot and segment layers are written next to the map under names
+        # of their own and are not kept with it, so maps with hotspots are
+        # always created rather than reused, restored or shared.
+        reuse_maps = not (data.get(SAMZ_ZONING) and data.get(HOTSPOT))
+        # Maps created before, maybe by other users, are taken from the
+        # store. It holds map files, not layers of the session GeoPackage.
+        store = None
+        if reuse_maps and not self.output_geopackage():
+            store = map_store_from_settings()
+        # Maps of different Bridge API services are not interchangeable
+        _, _, region, _, _, use_testing_service = (
+            credentials_parameters_from_settings())
         if map_product_definition == SAMZ:
             image_dates = []
             image_ids = []
@@ -826,25 +970,31 @@ class GeosysPluginDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
 
             filename = '{}_{}_zones_{}_{}'.format(
                 SAMZ['key'], str(zone_cnt), season_field_id, samz_mode)
-            filename = check_if_file_exists(
-                self.output_directory,
-                filename,
-                self.output_map_format['extension']
-            )
-
-            is_success, message = create_samz_map(
-                season_field_id, image_ids, image_dates, self.output_directory, filename,
-                output_map_format=self.output_map_format, params=data)
-
-            if not is_success:
-                QMessageBox.critical(
-                    self,
-                    'Map Creation Status',
-                    'Error creating map. {}'.format(message))
+            key = RunManifest.key(
+                SAMZ['key'], season_field_id, image_ids, image_dates, data,
+                self.output_map_format['api_key'], region,
+                use_testing_service)
+            if reuse_maps and self.coalesce_map(key, filename):
+                return
+            filename = self.manifest_filename(
+                manifest, key, filename, reuse=reuse_maps)
+            if filename is None or self.restore_stored_map(
+                    store, manifest, key, filename):
                 return
 
-            # Add map to qgis canvas
-            self.load_layer(os.path.join(self.output_directory, filename))
+            self.map_creation_queue.submit(MapCreationTask(
+                filename,
+                request_samz_map,
+                season_field_id, image_ids, image_dates,
+                self.output_directory, filename,
+                output_map_format=self.output_map_format, params=data,
+                on_success=partial(
+                    self.map_created, manifest, key,
+                    os.path.join(self.output_directory, filename),
+                    self.output_map_format),
+                on_failure=partial(self.map_failed, manifest, key),
+                map_store=store, map_store_key=key),
+                key=key)
         else:
             for map_specification in map_specifications:
                 filename = '{}_{}_zones_{}_{}'.format(
@@ -853,34 +1003,247 @@ class GeosysPluginDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
                     map_specification['seasonField']['id'],
                     map_specification['image']['date']
                 )
-                filename = check_if_file_exists(
-                    self.output_directory,
-                    filename,
-                    self.output_map_format['extension']
-                )
-
                 sample_map_id = None
                 if self.map_product == SAMPLE_MAP['key']:
                     sample_map_id = map_specification['id']
 
-                is_success, message = create_map(
-                    map_specification, self.output_directory, filename,
-                    data=data, output_map_format=self.output_map_format,
+                key = RunManifest.key(
+                    self.map_product,
+                    map_specification['seasonField']['id'],
+                    map_specification['image'],
+                    data,
+                    self.output_map_format['api_key'],
+                    self.n_planned_value,
+                    self.yield_average_form.value(),
+                    self.yield_minimum_form.value(),
+                    self.yield_maximum_form.value(),
+                    sample_map_id,
+                    region,
+                    use_testing_service)
+                if reuse_maps and self.coalesce_map(key, filename):
+                    continue
+                filename = self.manifest_filename(
+                    manifest, key, filename, reuse=reuse_maps)
+                if filename is None or self.restore_stored_map(
+                        store, manifest, key, filename):
+                    continue
+
+                # Jobs run concurrently and request_map updates its
+                # arguments, so each job gets its own copy.
+                self.map_creation_queue.submit(MapCreationTask(
+                    filename,
+                    request_map,
+                    copy.deepcopy(map_specification),
+                    self.output_directory, filename,
+                    data=copy.deepcopy(data),
+                    output_map_format=self.output_map_format,
                     n_planned_value=self.n_planned_value,
                     yield_val=self.yield_average_form.value(),
                     min_yield_val=self.yield_minimum_form.value(),
                     max_yield_val=self.yield_maximum_form.value(),
-                    sample_map_id=sample_map_id
-                )
-                if not is_success:
-                    QMessageBox.critical(
-                        self,
-                        'Map Creation Status',
-                        'Error creating map. {}'.format(message))
-                    return
+                    sample_map_id=sample_map_id,
+                    on_success=partial(
+                        self.map_created, manifest, key,
+                        os.path.join(self.output_directory, filename),
+                        self.output_map_format),
+                    on_failure=partial(self.map_failed, manifest, key),
+                    map_store=store, map_store_key=key
+                ), key=key)
+
+    def coalesce_map(self, key, filename):
+        """Share the creation of an identical map already in progress.
+
+        Overlapping selections may request the same map several times. The
+        map is then only requested and downloaded once, its outputs are
+        copied to the output name of every duplicate once created.
+
+        :param key: Key of the map request.
+        :type key: str
+
+        :param filename: Output name of the map.
+        :type filename: str
+
+        :return: True if an identical map is being created.
+        :rtype: bool
+        """
+        if self.map_creation_queue.find_active_job(key) is None:
+            return False
+        filename = self.unique_filename(filename)
+        self.coalesced_maps.setdefault(key, []).append((
+            os.path.join(self.output_directory, filename),
+            self.output_map_format))
+        return True
 
-                # Add map to qgis canvas
-                self.load_layer(os.path.join(self.output_directory, filename))
+    def manifest_filename(self, manifest, key, filename, reuse=True):
+        """Output name of a map of the batch, based on the run manifest.
+
+        A map created by a previous run is loaded again, unless it must not
+        be reused. A map whose creation did not finish keeps its output
+        name, so its partial download is resumed.
+
+        :param manifest: Run manifest of the output directory.
+        :type manifest: RunManifest
+
+        :param key: Key of the map request.
+        :type key: str
+
+        :param filename: Output name of the map if not in the manifest.
+        :type filename: str
+
+        :param reuse: Whether a map created by a previous run is reused.
+            It is created again under a new name otherwise.
+        :type reuse: bool
+
+        :return: Output name of the map, None if it was already created.
+        :rtype: str
+        """
+        item = manifest.get(key)
+        recorded_filename = None
+        if item and item['outputs']:
+            recorded_filename = self.output_filename(item['outputs'][0])
+        if recorded_filename:
+            if manifest.is_done(key):
+                if reuse:
+                    self.load_layer(
+                        os.path.join(
+                            self.output_directory, recorded_filename),
+                        self.output_map_format)
+                    return None
+            elif recorded_filename not in self.reserved_filenames:
+                self.reserved_filenames.add(recorded_filename)
+                manifest.start(key, item['parameters'], item['outputs'])
+                return recorded_filename
+
+        filename = self.unique_filename(filename)
+        manifest.start(
+            key, {'filename': filename}, [self.map_output(filename)])
+        return filename
+
+    def restore_stored_map(self, store, manifest, key, filename):
+        """Take a map created before out of the map store.
+
+        :param store: Store of created maps, None if disabled.
+        :type store: MapStore
+
+        :param manifest: Run manifest of the output directory.
+        :type manifest: RunManifest
+
+        :param key: Key of the map request.
+        :type key: str
+
+        :param filename: Output name of the map.
+        :type filename: str
+
+        :return: True if the map was in the store.
+        :rtype: bool
+        """
+        if store is None:
+            return False
+        base_path = os.path.join(self.output_directory, filename)
+        # Vector maps may be edited in place, they get their own copy.
+        if not store.get(
+                key, base_path,
+                hardlink=self.output_map_format not in VECTOR_FORMAT):
+            return False
+        manifest.complete(key)
+        self.reserved_filenames.discard(filename)
+        self.load_layer(base_path, self.output_map_format)
+        return True
+
+    def map_created(self, manifest, key, base_path, output_map_format):
+        """Record a created map in the run manifest and load it.
+
+        The outputs of the map are copied to the duplicates of the map.
+
+        :param manifest: Run manifest of the output directory.
+        :type manifest: RunManifest
+
+        :param key: Key of the map request.
+        :type key: str
+
+        :param base_path: Base path of the map.
+        :type base_path: str
+
+        :param output_map_format: Format of the map.
+        :type output_map_format: dict
+        """
+        manifest.complete(key)
+        self.load_layer(base_path, output_map_format)
+        geopackage_path = self.output_geopackage(output_map_format)
+        for copy_base_path, copy_format in self.coalesced_maps.pop(key, []):
+            if geopackage_path:
+                # The layer is read in memory before being written to the
+                # GeoPackage it is read from.
+                layer = QgsVectorLayer(geopackage_layer_uri(
+                    geopackage_path, os.path.basename(base_path)))
+                write_to_geopackage(
+                    layer.materialize(QgsFeatureRequest()), geopackage_path,
+                    os.path.basename(copy_base_path))
+            else:
+                copy_map_outputs(base_path, copy_base_path)
+            self.load_layer(copy_base_path, copy_format)
+
+    def map_failed(self, manifest, key, message):
+        """Record a failed map in the run manifest.
+
+        :param manifest: Run manifest of the output directory.
+        :type manifest: RunManifest
+
+        :param key: Key of the map request.
+        :type key: str
+
+        :param message: Error message.
+        :type message: str
+        """
+        manifest.fail(key, message)
+        # The duplicates of the map are not created either.
+        self.coalesced_maps.pop(key, None)
+
+    def map_creation_job_changed(self, job):
+        """Show the progress of the map creation jobs.
+
+        :param job: The job whose status changed.
+        :type job: Job
+        """
+        jobs = self.map_creation_queue.jobs
+        done = len([j for j in jobs if j.is_done])
+        failed = len(self.map_creation_queue.jobs_with_status(FAILED))
+        text = self.tr('{} of {} maps created').format(done - failed, len(jobs))
+        if failed:
+            text = self.tr('{}, {} failed').format(text, failed)
+
+        if self.iface is None:
+            return
+        if self.map_creation_message is None:
+            self.map_creation_message = self.iface.messageBar().createMessage(
+                self.tr('Map Creation'), text)
+            cancel_button = QPushButton(self.tr('Cancel'))
+            cancel_button.clicked.connect(self.cancel_map_creation)
+            self.map_creation_message.layout().addWidget(cancel_button)
+            self.iface.messageBar().pushWidget(
+                self.map_creation_message, Qgis.Info)
+        else:
+            self.map_creation_message.setText(text)
+
+    def map_creation_finished(self):
+        """Report the outcome once every map creation job has finished."""
+        self.reserved_filenames.clear()
+        if self.iface is not None and self.map_creation_message is not None:
+            self.iface.messageBar().popWidget(self.map_creation_message)
+        self.map_creation_message = None
+
+        failed_jobs = self.map_creation_queue.jobs_with_status(FAILED)
+        if failed_jobs:
+            QMessageBox.critical(
+                self,
+                'Map Creation Status',
+                'Error creating map. {}'.format('\n'.join(
+                    '{}: {}'.format(job.description, job.message)
+                    for job in failed_jobs)))
+
+    def cancel_map_creation(self):
+        """Cancel the map creation jobs which are not finished."""
+        self.map_creation_queue.cancel()
 
     def start_map_creation(self):
         """Map creation starts here."""
@@ -931,20 +1294,17 @@ class GeosysPluginDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
                 map_specifications[1]['image']['date']
             )
 
-            # Run difference map creation
-            is_success, message = create_difference_map(
-                map_specifications, self.output_directory,
-                filename, output_map_format=self.output_map_format)
-
-            if not is_success:
-                QMessageBox.critical(
-                    self,
-                    'Map Creation Status',
-                    'Error creating map. {}'.format(message))
-                return
-
-            # Add map to qgis canvas
-            self.load_layer(os.path.join(self.output_directory, filename))
+            # Run difference map creation, the map is added to qgis canvas
+            # once created.
+            self.map_creation_queue.submit(MapCreationTask(
+                filename,
+                request_difference_map,
+                copy.deepcopy(map_specifications), self.output_directory,
+                filename, output_map_format=self.output_map_format,
+                on_success=partial(
+                    self.load_layer,
+                    os.path.join(self.output_directory, filename),
+                    self.output_map_format)))
         except:
             error_text = "{0}: {1}".format(
                 unicode(sys.exc_info()[0].__name__),
@@ -1030,7 +1390,8 @@ class GeosysPluginDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
             if self.map_product == ELEVATION['key'] or self.map_product == SOIL['key']:
                 self.show_next_page()
 
-    def show_coverage_result(self, coverage_map_json, thumbnail_ba):
+    def show_coverage_result(
+            self, coverage_map_json, thumbnail_ba, order=None):
         """Translate coverage map result into widget item.
 
         :param coverage_map_json: Result of single map coverage.
@@ -1066,14 +1427,21 @@ class GeosysPluginDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
 
         :param thumbnail_ba: Thumbnail image data in byte array format.
         :type thumbnail_ba: QByteArray
+
+        :param order: Order of the result in the search results. Results
+            arrive in any order and are inserted before the ones coming
+            after them.
+        :type order: tuple
         """
         if coverage_map_json:
             custom_widget = CoverageSearchResultItemWidget(
                 coverage_map_json, thumbnail_ba, self.map_product)
-            new_item = QListWidgetItem(self.coverage_result_list)
+            new_item = QListWidgetItem()
             new_item.setSizeHint(custom_widget.sizeHint())
             new_item.setData(Qt.UserRole, coverage_map_json)
-            self.coverage_result_list.addItem(new_item)
+            new_item.setData(COVERAGE_ORDER_ROLE, order)
+            self.coverage_result_list.insertItem(
+                self.coverage_result_row(order), new_item)
             self.coverage_result_list.setItemWidget(new_item, custom_widget)
         else:
             new_item = QListWidgetItem()
@@ -1082,6 +1450,25 @@ class GeosysPluginDockWidget(QtWidgets.QDockWidget, FORM_CLASS):
             self.coverage_result_list.addItem(new_item)
         self.coverage_result_list.update()
 
+    def coverage_result_row(self, order):
+        """Row where a coverage result is inserted to keep results sorted.
+
+        :param order: Order of the result in the search results.
+        :type order: tuple
+
+        :return: The row of the first result coming after it.
+        :rtype: int
+        """
+        count = self.coverage_result_list.count()
+        if order is None:
+            return count
+        for row in range(count):
+            row_order = self.coverage_result_list.item(row).data(
+                COVERAGE_ORDER_ROLE)
+            if row_order is not None and tuple(row_order) > tuple(order):
+                return row
+        return count
+
     def show_error(self, error_message):
         """Show error message as widget item.
 
@@ -0,0 +1,193 @@
+# coding=utf-8
+"""QGIS tasks creating GEOSYS maps in the background.
+
+A map creation is split into a request sub-task, asking Bridge API to
+create the map, and a download sub-task, downloading and extracting the map
+assets. The parent task loads the map and its hotspot layers once both
+succeeded, so the work runs off the main thread and shows in the QGIS task
+manager. Layers are only added to the project from the main thread.
+"""
+import logging
+
+from qgis.core import QgsTask, QgsVectorLayer
+
+from geosys.ui.widgets.geosys_coverage_downloader import download_field_map
+from geosys.utilities.gui_utilities import add_layer_to_canvas
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+LOGGER = logging.getLogger('geosys')
+
+
+class FieldMapRequestTask(QgsTask):
+    """Task requesting the creation of a map to Bridge API."""
+
+    def __init__(self, description, request_function, args, kwargs):
+        """Task requesting the creation of a map to Bridge API.
+
+        :param description: Task description.
+        :type description: str
+
+        :param request_function: Function requesting the map and returning
+            the keyword arguments of download_field_map e.g. request_map.
+        :type request_function: function
+
+        :param args: Positional arguments of the request function.
+        :type args: tuple
+
+        :param kwargs: Keyword arguments of the request function.
+        :type kwargs: dict
+        """
+        super(FieldMapRequestTask, self).__init__(
+            description, QgsTask.CanCancel)
+        self.request_function = request_function
+        self.args = args
+        self.kwargs = kwargs
+        self.download_parameters = None
+        self.message = ''
+
+    def run(self):
+        """Request the map.
+
+        :return: True if the request succeeded.
+        :rtype: bool
+        """
+        try:
+            self.download_parameters = self.request_function(
+                *self.args, **self.kwargs)
+        except Exception as e:
+            LOGGER.exception('{} failed.'.format(self.description()))
+            self.message = '{}: {}'.format(e.__class__.__name__, e)
+            return False
+        self.setProgress(100)
+        return not self.isCanceled()
+
+
+class FieldMapDownloadTask(QgsTask):
+    """Task downloading and extracting the assets of a requested map."""
+
+    def __init__(
+            self, description, request_task, map_store=None,
+            map_store_key=None):
+        """Task downloading and extracting the assets of a requested map.
+
+        :param description: Task description.
+        :type description: str
+
+        :param request_task: The task requesting the map.
+        :type request_task: FieldMapRequestTask
+
+        :param map_store: Store the downloaded map is added to, if any.
+        :type map_store: MapStore
+
+        :param map_store_key: Key of the map in the store.
+        :type map_store_key: str
+        """
+        super(FieldMapDownloadTask, self).__init__(
+            description, QgsTask.CanCancel)
+        self.request_task = request_task
+        self.map_store = map_store
+        self.map_store_key = map_store_key
+        self.message = ''
+        # (uri, name) of the hotspot and segment layers written with the map
+        self.layers = []
+
+    def run(self):
+        """Download the map assets.
+
+        :return: True if every asset was downloaded.
+        :rtype: bool
+        """
+        try:
+            is_success, self.message, self.layers = download_field_map(
+                feedback=self,
+                **self.request_task.download_parameters)
+        except Exception as e:
+            LOGGER.exception('{} failed.'.format(self.description()))
+            is_success = False
+            self.message = '{}: {}'.format(e.__class__.__name__, e)
+        if is_success and self.map_store is not None:
+            # Copying to the store may be slow, e.g. on a shared drive.
+            self.map_store.put(
+                self.map_store_key,
+                self.request_task.download_parameters[
+                    'destination_base_path'])
+        return is_success and not self.isCanceled()
+
+
+class MapCreationTask(QgsTask):
+    """Task creating a map, from its request to its loading."""
+
+    def __init__(
+            self, description, request_function, *args, on_success=None,
+            on_failure=None, map_store=None, map_store_key=None, **kwargs):
+        """Task creating a map, from its request to its loading.
+
+        :param description: Task description.
+        :type description: str
+
+        :param request_function: Function requesting the map and returning
+            the keyword arguments of download_field_map e.g. request_map.
+        :type request_function: function
+
+        :param on_success: Function called without argument on the main
+            thread once the map is created, e.g. to load the map layer.
+        :type on_success: function
+
+        :param on_failure: Function called with the error message on the
+            main thread when the map creation failed or was canceled.
+        :type on_failure: function
+
+        :param map_store: Store the created map is added to, if any.
+        :type map_store: MapStore
+
+        :param map_store_key: Key of the map in the store.
+        :type map_store_key: str
+        """
+        super(MapCreationTask, self).__init__(description, QgsTask.CanCancel)
+        self.on_success = on_success
+        self.on_failure = on_failure
+        self.message = ''
+        self.request_task = FieldMapRequestTask(
+            self.tr('Requesting {}').format(description),
+            request_function, args, kwargs)
+        self.download_task = FieldMapDownloadTask(
+            self.tr('Downloading {}').format(description), self.request_task,
+            map_store=map_store, map_store_key=map_store_key)
+        self.addSubTask(
+            self.request_task, [], QgsTask.ParentDependsOnSubTask)
+        self.addSubTask(
+            self.download_task, [self.request_task],
+            QgsTask.ParentDependsOnSubTask)
+
+    def run(self):
+        """The map is created by the sub-tasks.
+
+        :return: True if the map was created.
+        :rtype: bool
+        """
+        return not self.isCanceled()
+
+    def finished(self, result):
+        """Load the map and its hotspot layers, called on the main thread.
+
+        :param result: Whether the task succeeded.
+        :type result: bool
+        """
+        if result:
+            self.message = self.download_task.message
+            if self.on_success:
+                self.on_success()
+            for uri, name in self.download_task.layers:
+                add_layer_to_canvas(QgsVectorLayer(uri, name, 'ogr'), name)
+            return
+
+        self.message = (
+            self.request_task.message or self.download_task.message or
+            self.tr('Map creation canceled.'))
+        LOGGER.debug('{}: {}'.format(self.description(), self.message))
+        if self.on_failure:
+            self.on_failure(self.message)
@@ -9,7 +9,10 @@ from PyQt5.QtCore import QDate
 from PyQt5.QtWidgets import QMessageBox, QFileDialog, QDialogButtonBox
 from qgis.PyQt.QtCore import QSettings
 
+from geosys.bridge_api.response_cache import COVERAGE_CACHE
 from geosys.bridge_api_wrapper import BridgeAPI
+from geosys.ui.widgets.geosys_coverage_downloader import (
+    setup_coverage_cache, setup_http_session)
 from geosys.ui.help.options_help import options_help
 from geosys.ui.about.options_about import options_about
 from geosys.ui.help.help_dialog import HelpDialog
@@ -311,4 +314,10 @@ class GeosysOptionsDialog(QtWidgets.QDialog, FORM_CLASS):
     def accept(self):
         """Method invoked when OK button is clicked."""
         self.save_settings()
+
+        # Coverage responses may belong to the previous account or defaults
+        COVERAGE_CACHE.invalidate()
+        setup_coverage_cache()
+        setup_http_session()
+
         super(GeosysOptionsDialog, self).accept()
@@ -1,12 +1,17 @@
 # coding=utf-8
 """Helpers for QGIS related functionality."""
+import base64
+import hashlib
+import json
 import logging
 import os
+import re
+import shutil
 import zipfile
 
-from qgis.core import QgsApplication, QgsNetworkAccessManager
+from qgis.core import QgsNetworkAccessManager
 # noinspection PyPackageRequirements
-from qgis.PyQt.QtCore import QByteArray, QFile, QUrl
+from qgis.PyQt.QtCore import QEventLoop, QFile, QTimer, QUrl
 # noinspection PyPackageRequirements
 from qgis.PyQt.QtNetwork import QNetworkReply, QNetworkRequest
 
@@ -17,10 +22,45 @@ __revision__ = "$Format:%H$"
 
 LOGGER = logging.getLogger('geosys')
 
+# Size of the chunks written to disk, it also bounds the data the network
+# reply keeps in memory before it stops reading from the socket.
+DOWNLOAD_BUFFER_SIZE = 256 * 1024
 
-def fetch_data(url, output_path, headers=None, progress_dialog=None):
+# Milliseconds between two checks of the cancellation of downloads.
+CANCEL_POLL_INTERVAL = 200
+
+# Number of times an interrupted download is resumed.
+DOWNLOAD_RETRIES = 3
+
+# Extension of the file a download is written to until it is verified.
+PARTIAL_EXTENSION = '.part'
+
+# Extension of the file recording what a partial file was downloaded from,
+# so that a later download of the same url resumes it.
+PARTIAL_STATE_EXTENSION = '.json'
+
+# Errors after which resuming the download may succeed.
+RETRYABLE_ERRORS = [
+    QNetworkReply.RemoteHostClosedError,
+    QNetworkReply.TimeoutError,
+    QNetworkReply.TemporaryNetworkFailureError,
+    QNetworkReply.NetworkSessionFailedError,
+    QNetworkReply.UnknownNetworkError,
+    QNetworkReply.ProxyTimeoutError,
+    QNetworkReply.InternalServerError,
+    QNetworkReply.ServiceUnavailableError,
+    QNetworkReply.UnknownServerError
+]
+
+
+def fetch_data(
+        url, output_path, headers=None, progress_dialog=None,
+        checksum=None, feedback=None):
     """Download data from url and write to output_path.
 
+    An interrupted download is resumed from the bytes already received,
+    up to DOWNLOAD_RETRIES times.
+
     :param url: URL of the zip bundle.
     :type url: str
 
@@ -33,12 +73,16 @@ def fetch_data(url, output_path, headers=None, progress_dialog=None):
     :param progress_dialog: A progress dialog.
     :type progress_dialog: QProgressDialog
 
-    :raises: ImportDialogError - when network error occurred
-    """
+    :param checksum: Expected checksum of the file as
+        'algorithm:hexdigest', e.g. 'sha256:9f86d0...'.
+    :type checksum: str
 
-    LOGGER.debug('Downloading file from URL: %s' % url)
-    LOGGER.debug('Downloading to: %s' % output_path)
+    :param feedback: Object reporting progress and cancellation e.g.
+        QgsFeedback. The download is aborted once it is canceled.
+    :type feedback: QgsFeedback
 
+    :raises: ImportDialogError - when network error occurred
+    """
     if progress_dialog:
         progress_dialog.show()
 
@@ -51,16 +95,114 @@ def fetch_data(url, output_path, headers=None, progress_dialog=None):
         label_text = ('Fetching %s' % url)
         progress_dialog.setLabelText(label_text)
 
-    # Download Process
-    downloader = FileDownloader(url, output_path, headers, progress_dialog)
-    try:
-        result = downloader.download()
-    except IOError as ex:
-        raise IOError(ex)
+    future = download_file(
+        url, output_path, headers, progress_dialog, checksum)
+    wait_for_downloads([future], feedback=feedback)
+    future.result()
+
 
-    if result[0] is not True:
-        _, error_message = result
-        raise Exception(error_message)
+def download_file(
+        url, output_path, headers=None, progress_dialog=None,
+        checksum=None):
+    """Start downloading data from url to output_path.
+
+    The download runs on the event loop of the calling thread, several
+    downloads started one after another are transferred concurrently.
+
+    :param url: URL of the file.
+    :type url: str
+
+    :param output_path: Path of output file,
+    :type output_path: str
+
+    :param headers: Request headers.
+    :type headers: dict
+
+    :param progress_dialog: A progress dialog.
+    :type progress_dialog: QProgressDialog
+
+    :param checksum: Expected checksum of the file as
+        'algorithm:hexdigest'.
+    :type checksum: str
+
+    :return: Future of the download, its result is output_path.
+    :rtype: DownloadFuture
+    """
+    LOGGER.debug('Downloading file from URL: %s' % url)
+    LOGGER.debug('Downloading to: %s' % output_path)
+
+    downloader = FileDownloader(
+        url, output_path, headers, progress_dialog, checksum)
+    return downloader.start()
+
+
+def wait_for_downloads(futures, feedback=None):
+    """Wait until every download is finished.
+
+    The event loop of the calling thread keeps running while waiting, so
+    the downloads progress without busy waiting.
+
+    :param futures: Futures returned by download_file.
+    :type futures: list
+
+    :param feedback: Object reporting progress and cancellation e.g.
+        QgsFeedback or QgsTask. The downloads are aborted once it is
+        canceled.
+    :type feedback: QgsFeedback
+
+    :return: The futures.
+    :rtype: list
+    """
+    pending = [future for future in futures if not future.done()]
+    if not pending:
+        return futures
+
+    loop = QEventLoop()
+
+    def download_done(future):
+        """Stop waiting once the last download is done."""
+        pending.remove(future)
+        if feedback:
+            feedback.setProgress(
+                100.0 * (len(futures) - len(pending)) / len(futures))
+        if not pending:
+            loop.quit()
+
+    def check_canceled():
+        """Abort the downloads when the feedback is canceled."""
+        if feedback.isCanceled():
+            for future in list(pending):
+                future.cancel()
+
+    # The feedback may be canceled from another thread, it is polled so
+    # that the replies are only aborted from the thread owning them.
+    timer = QTimer()
+    if feedback:
+        timer.timeout.connect(check_canceled)
+        timer.start(CANCEL_POLL_INTERVAL)
+
+    for future in list(pending):
+        future.add_done_callback(download_done)
+    if pending:
+        loop.exec_()
+    timer.stop()
+    return futures
+
+
+def has_partial_downloads(directory):
+    """Whether a directory holds partial files a later download resumes.
+
+    :param directory: The directory.
+    :type directory: str
+
+    :return: True if a partial file was left with its download state.
+    :rtype: bool
+    """
+    if not os.path.isdir(directory):
+        return False
+    state_extension = PARTIAL_EXTENSION + PARTIAL_STATE_EXTENSION
+    return any(
+        name.endswith(state_extension) for name in os.listdir(directory))
 
 
 def extract_zip(zip_path, destination_base_path):
@@ -76,6 +218,10 @@ def extract_zip(zip_path, destination_base_path):
     If two files in the zip with the same extension, only one will be
     copied.
 
+    The members are streamed by chunks to a partial file next to their
+    destination and renamed once complete, so large maps are extracted in
+    constant memory and a failed extraction leaves no truncated file.
+
     :param zip_path: The path of the .zip file
     :type zip_path: str
 
@@ -86,26 +232,164 @@ def extract_zip(zip_path, destination_base_path):
     :raises: IOError - when not able to open path or output_dir does not
         exist.
     """
-    handle = open(zip_path, 'rb')
-    zip_file = zipfile.ZipFile(handle)
-    for name in zip_file.namelist():
-        extension = os.path.splitext(name)[1]
-        _, requested_extension = os.path.splitext(destination_base_path)
-        if requested_extension:
-            output_final_path = destination_base_path
+    _, requested_extension = os.path.splitext(destination_base_path)
+    with zipfile.ZipFile(zip_path) as zip_file:
+        for member in zip_file.infolist():
+            if member.filename.endswith('/'):
+                continue
+            if requested_extension:
+                output_final_path = destination_base_path
+            else:
+                extension = os.path.splitext(member.filename)[1]
+                output_final_path = '%s%s' % (
+                    destination_base_path, extension)
+            temporary_path = output_final_path + PARTIAL_EXTENSION
+            try:
+                with zip_file.open(member) as member_file, \
+                        open(temporary_path, 'wb') as output_file:
+                    shutil.copyfileobj(
+                        member_file, output_file, DOWNLOAD_BUFFER_SIZE)
+                os.replace(temporary_path, output_final_path)
+            except Exception:
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+                raise
+
+
+def zip_member_path(zip_path, extension):
+    """GDAL virtual path of a member of a zip file.
+
+    GDAL and OGR read the member through /vsizip/ without extracting it.
+
+    :param zip_path: The path of the .zip file
+    :type zip_path: str
+
+    :param extension: Extension of the member e.g. '.tif'.
+    :type extension: str
+
+    :return: The /vsizip/ path of the first member with the extension, None
+        if the zip file has no such member.
+    :rtype: str
+    """
+    with zipfile.ZipFile(zip_path) as zip_file:
+        for name in zip_file.namelist():
+            if name.lower().endswith(extension.lower()):
+                return '/vsizip/{}/{}'.format(zip_path, name)
+    return None
+
+
+class DownloadFuture(object):
+    """Pending result of a download, see download_file.
+
+    Callbacks are called, and result waits, on the thread which started the
+    download.
+    """
+
+    def __init__(self, downloader):
+        """Pending result of a download.
+
+        :param downloader: The downloader of the file.
+        :type downloader: FileDownloader
+        """
+        self.downloader = downloader
+        self._done = False
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._loops = []
+
+    def done(self):
+        """Whether the download is finished.
+
+        :rtype: bool
+        """
+        return self._done
+
+    def cancel(self):
+        """Abort the download."""
+        if not self._done:
+            self.downloader.cancel()
+
+    def add_done_callback(self, callback):
+        """Call callback with the future once the download is finished.
+
+        :param callback: Function taking the future as argument.
+        :type callback: function
+        """
+        if self._done:
+            callback(self)
         else:
-            output_final_path = '%s%s' % (destination_base_path, extension)
-        output_file = open(output_final_path, 'wb')
-        output_file.write(zip_file.read(name))
-        output_file.close()
+            self._callbacks.append(callback)
+
+    def set_result(self, result):
+        """Finish the future with a result."""
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exception):
+        """Finish the future with an exception."""
+        self._exception = exception
+        self._finish()
+
+    def _finish(self):
+        """Mark the future as done and notify waiters."""
+        self._done = True
+        for loop in self._loops:
+            loop.quit()
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                LOGGER.exception('Download callback failed.')
+
+    def wait(self):
+        """Wait until the download is finished."""
+        if self._done:
+            return
+        loop = QEventLoop()
+        self._loops.append(loop)
+        try:
+            loop.exec_()
+        finally:
+            self._loops.remove(loop)
 
-    handle.close()
+    def exception(self):
+        """Wait and get the error of the download.
+
+        :return: The error or None when the download succeeded.
+        :rtype: Exception
+        """
+        self.wait()
+        return self._exception
+
+    def result(self):
+        """Wait and get the result of the download.
+
+        :return: Path of the downloaded file.
+        :rtype: str
+
+        :raises: Exception - when the download failed
+        """
+        self.wait()
+        if self._exception is not None:
+            raise self._exception
+        return self._result
 
 
 class FileDownloader:
-    """The blueprint for downloading file from url."""
+    """The blueprint for downloading file from url.
+
+    The download is driven by the signals of the network reply, no event
+    processing loop is run. The data is written to a partial file next to
+    output_path which is only renamed to output_path once its length and
+    checksum are verified. An interrupted download is resumed with a Range
+    request from the bytes already received.
+    """
 
-    def __init__(self, url, output_path, headers=None, progress_dialog=None):
+    def __init__(
+            self, url, output_path, headers=None, progress_dialog=None,
+            checksum=None, retries=DOWNLOAD_RETRIES):
         """Constructor of the class.
 
         :param url: URL of file.
@@ -116,35 +400,127 @@ class FileDownloader:
 
         :param progress_dialog: Progress dialog widget.
         :type progress_dialog: QWidget
+
+        :param checksum: Expected checksum of the file as
+            'algorithm:hexdigest'.
+        :type checksum: str
+
+        :param retries: Number of times an interrupted download is resumed.
+        :type retries: int
         """
         # noinspection PyArgumentList
         self.manager = QgsNetworkAccessManager.instance()
         self.url = QUrl(url)
         self.output_path = output_path
+        self.partial_path = output_path + PARTIAL_EXTENSION
         self.headers = headers if headers else {}
         self.progress_dialog = progress_dialog
         if self.progress_dialog:
             self.prefix_text = self.progress_dialog.labelText()
+        self.checksum = checksum
+        self.retries = retries
+        self.attempts = 0
+        self.future = DownloadFuture(self)
         self.output_file = None
         self.reply = None
-        self.downloaded_file_buffer = None
-        self.finished_flag = False
+        self.canceled = False
+        # Bytes of the partial file when the current request was sent
+        self.offset = 0
+        # Expected size of the complete file, None when unknown
+        self.total_size = None
+        # ETag or Last-Modified value of the partial file content
+        self.validator = None
+        # Whether the partial file belongs to this download
+        self.resumable = False
+        # Whether the last failed request may succeed if resumed
+        self.retryable = False
+        self.error_message = None
+
+    def start(self):
+        """Start downloading the file.
+
+        :return: Future of the download.
+        :rtype: DownloadFuture
+        """
+        if not self.load_partial_state():
+            self.remove_partial()
+        self.send_request()
+        return self.future
+
+    def load_partial_state(self):
+        """Resume a partial file left by an interrupted download of the url.
+
+        :return: True if the partial file can be resumed.
+        :rtype: bool
+        """
+        state_path = self.partial_path + PARTIAL_STATE_EXTENSION
+        if not os.path.exists(self.partial_path):
+            return False
+        try:
+            with open(state_path) as state_file:
+                state = json.load(state_file)
+        except (IOError, OSError, ValueError):
+            return False
+        if state.get('url') != self.url.toString() or \
+                not state.get('validator'):
+            return False
+        self.validator = state['validator']
+        self.resumable = True
+        LOGGER.debug('Resuming partial download %s' % self.partial_path)
+        return True
+
+    def save_partial_state(self):
+        """Record what the partial file is downloaded from.
+
+        Without a validator the server can not tell whether the file has
+        changed since, so such a partial file is not resumed later.
+        """
+        state_path = self.partial_path + PARTIAL_STATE_EXTENSION
+        try:
+            if self.validator:
+                with open(state_path, 'w') as state_file:
+                    json.dump({
+                        'url': self.url.toString(),
+                        'validator': self.validator
+                    }, state_file)
+            elif os.path.exists(state_path):
+                os.remove(state_path)
+        except (IOError, OSError) as e:
+            LOGGER.debug('Unable to save download state: %s' % e)
+
+    def remove_partial(self):
+        """Remove the partial file and its state."""
+        for path in (
+                self.partial_path,
+                self.partial_path + PARTIAL_STATE_EXTENSION):
+            if os.path.exists(path):
+                os.remove(path)
 
     def download(self):
-        """Downloading the file.
+        """Downloading the file and wait until it is finished.
 
         :returns: True if success, otherwise returns a tuple with format like
-            this (QNetworkReply.NetworkError, error_message)
-
-        :raises: IOError - when cannot create output_path
+            this (False, error_message)
         """
-        # Prepare output path
-        self.output_file = QFile(self.output_path)
-        if not self.output_file.open(QFile.WriteOnly):
-            raise IOError(self.output_file.errorString())
-
-        # Prepare downloaded buffer
-        self.downloaded_file_buffer = QByteArray()
+        exception = self.start().exception()
+        if exception is not None:
+            return False, str(exception)
+        return True, None
+
+    def cancel(self):
+        """Abort the download."""
+        self.canceled = True
+        if self.reply is not None:
+            self.reply.abort()
+
+    def send_request(self):
+        """Send the request, resuming from the partial file if any."""
+        self.offset = (
+            os.path.getsize(self.partial_path)
+            if os.path.exists(self.partial_path) else 0)
+        self.output_file = QFile(self.partial_path)
+        self.retryable = False
+        self.error_message = None
 
         # Request the url
         request = QNetworkRequest(self.url)
@@ -160,51 +536,95 @@ class FileDownloader:
             #   request.setRawHeader(b'user-agent', userAgent)
             request.setRawHeader(
                 bytes(header_name, 'utf-8'), bytes(header_value, 'utf-8'))
+        if self.offset:
+            request.setRawHeader(
+                b'Range', bytes('bytes=%s-' % self.offset, 'utf-8'))
+            if self.validator:
+                # The server sends the whole file if it has changed.
+                request.setRawHeader(
+                    b'If-Range', bytes(self.validator, 'utf-8'))
         self.reply = self.manager.get(request)
+        self.reply.setReadBufferSize(DOWNLOAD_BUFFER_SIZE)
         self.reply.readyRead.connect(self.get_buffer)
-        self.reply.finished.connect(self.write_data)
-        self.manager.requestTimedOut.connect(self.request_timeout)
+        self.reply.finished.connect(self.reply_finished)
 
         if self.progress_dialog:
-            # progress bar
-            def progress_event(received, total):
-                """Update progress.
+            self.reply.downloadProgress.connect(self.progress_event)
+            if self.attempts == 0:
+                self.progress_dialog.canceled.connect(self.cancel)
 
-                :param received: Data received so far.
-                :type received: int
+    def progress_event(self, received, total):
+        """Update progress.
 
-                :param total: Total expected data.
-                :type total: int
-                """
-                # noinspection PyArgumentList
-                QgsApplication.processEvents()
+        :param received: Data received so far.
+        :type received: int
 
-                self.progress_dialog.adjustSize()
+        :param total: Total expected data.
+        :type total: int
+        """
+        self.progress_dialog.adjustSize()
 
-                label_text = (
-                        "%s : %s of %s" % (self.prefix_text, received, total))
+        received += self.offset
+        if total >= 0:
+            total += self.offset
 
-                self.progress_dialog.setLabelText(label_text)
-                self.progress_dialog.setMaximum(total)
-                self.progress_dialog.setValue(received)
+        label_text = (
+                "%s : %s of %s" % (self.prefix_text, received, total))
 
-            # cancel
-            def cancel_action():
-                """Cancel download."""
-                self.reply.abort()
-                self.reply.deleteLater()
+        self.progress_dialog.setLabelText(label_text)
+        self.progress_dialog.setMaximum(total)
+        self.progress_dialog.setValue(received)
 
-            self.reply.downloadProgress.connect(progress_event)
-            self.progress_dialog.canceled.connect(cancel_action)
+    def reply_finished(self):
+        """Handle the end of a request, retrying or finishing the future."""
+        self.write_data()
+        success, message = self.reply_result()
+        self.reply.deleteLater()
+        self.reply = None
 
-        # Wait until finished
-        # On Windows 32bit AND QGIS 2.2, self.reply.isFinished() always
-        # returns False even after finished slot is called. So, that's why we
-        # are adding self.finished_flag (see #864)
-        while not self.reply.isFinished() and not self.finished_flag:
-            # noinspection PyArgumentList
-            QgsApplication.processEvents()
+        if success:
+            self.finish(True)
+            self.future.set_result(self.output_path)
+            return
+
+        if self.retryable and not self.canceled and \
+                self.attempts < self.retries:
+            self.attempts += 1
+            LOGGER.debug(
+                'Resuming download of %s (%s): %s' % (
+                    self.url.toString(), self.attempts, message))
+            if not self.resumable:
+                self.remove_partial()
+            self.send_request()
+            return
+
+        self.finish(False)
+        self.future.set_exception(Exception(message))
+
+    def finish(self, success):
+        """Release the resources of the download.
+
+        A partial file which can be resumed is kept, even when the download
+        was canceled, so a later download of the same url to the same path
+        continues from it.
+
+        :param success: Whether the download succeeded.
+        :type success: bool
+        """
+        if self.progress_dialog:
+            self.progress_dialog.canceled.disconnect(self.cancel)
+        if success or not self.resumable:
+            self.remove_partial()
+        else:
+            self.save_partial_state()
+
+    def reply_result(self):
+        """Check the finished reply, renaming the file on success.
 
+        :returns: A tuple (True, None) if success, otherwise
+            (False, error_message).
+        :rtype: tuple
+        """
         result = self.reply.error()
         try:
             http_code = int(self.reply.attribute(
@@ -213,13 +633,29 @@ class FileDownloader:
             # If the user cancels the request, the HTTP response will be None.
             http_code = None
 
-        self.reply.abort()
-        self.reply.deleteLater()
+        if result == QNetworkReply.NoError and self.error_message is None:
+            if http_code not in (None, 200, 206):
+                # No file content was received, e.g. an unfollowed redirect.
+                self.error_message = (
+                    'Unexpected response %s from %s.' % (
+                        http_code, self.url.toString()))
+            else:
+                self.verify()
+
+        if self.error_message is not None:
+            LOGGER.debug(self.error_message)
+            return False, self.error_message
 
         if result == QNetworkReply.NoError:
+            if os.path.exists(self.output_path):
+                os.remove(self.output_path)
+            os.rename(self.partial_path, self.output_path)
             return True, None
 
-        elif result == QNetworkReply.UnknownNetworkError:
+        self.retryable = self.resumable and (
+            result in RETRYABLE_ERRORS or http_code in (408, 502, 503, 504))
+
+        if result == QNetworkReply.UnknownNetworkError:
             return False, (
                 'The network is unreachable. Please check your internet '
                 'connection.')
@@ -251,21 +687,159 @@ class FileDownloader:
             return False, 'Sorry, the content was not found on the server.'
 
         else:
-            return result, self.reply.errorString()
+            return False, self.reply.errorString()
+
+    def raw_header(self, name):
+        """Get a response header of self.reply as a string.
+
+        :param name: Header name.
+        :type name: bytes
+
+        :return: Header value or None if not set.
+        :rtype: str
+        """
+        if not self.reply.hasRawHeader(name):
+            return None
+        return bytes(self.reply.rawHeader(name)).decode('latin-1')
+
+    def open_output(self):
+        """Open the partial file according to the response status.
+
+        A partial content response is appended to the bytes already
+        received, a complete one replaces them. The body of any other
+        response, e.g. a server error page, is not file content, the partial
+        file is left unchanged and the error is handled once the reply is
+        finished.
+
+        :return: True if the response body is written to the partial file.
+        :rtype: bool
+        """
+        http_code = self.reply.attribute(
+            QNetworkRequest.HttpStatusCodeAttribute)
+        if http_code is not None and http_code not in (200, 206):
+            return False
+        content_length = self.reply.header(
+            QNetworkRequest.ContentLengthHeader)
+        mode = QFile.WriteOnly | QFile.Truncate
+        self.total_size = None
+        if http_code == 206:
+            content_range = re.match(
+                r'bytes (\d+)-\d+/(\d+|\*)',
+                self.raw_header(b'Content-Range') or '')
+            if not content_range or \
+                    int(content_range.group(1)) != self.offset:
+                # The bytes do not follow the partial file, start over.
+                self.fail('The server sent an unexpected range.')
+                return False
+            mode = QFile.Append
+            if content_range.group(2) != '*':
+                self.total_size = int(content_range.group(2))
+        else:
+            self.offset = 0
+            # Decompressed content does not match the transferred length.
+            if content_length is not None and \
+                    not self.raw_header(b'Content-Encoding'):
+                self.total_size = int(content_length)
+
+        self.validator = (
+            self.raw_header(b'ETag') or self.raw_header(b'Last-Modified'))
+        if not self.output_file.open(mode):
+            self.fail(self.output_file.errorString(), retryable=False)
+            return False
+        self.resumable = True
+        return True
+
+    def fail(self, message, retryable=True):
+        """Abort the request and discard the partial file.
+
+        :param message: Error message.
+        :type message: str
+
+        :param retryable: Whether the download may succeed if retried.
+        :type retryable: bool
+        """
+        self.error_message = message
+        self.resumable = False
+        self.retryable = retryable
+        self.reply.abort()
 
     def get_buffer(self):
-        """Get buffer from self.reply and store it to our buffer container."""
-        buffer_size = self.reply.size()
-        data = self.reply.read(buffer_size)
-        self.downloaded_file_buffer.append(data)
+        """Write the data available in self.reply to the partial file.
+
+        Data is written in chunks of DOWNLOAD_BUFFER_SIZE, so the memory
+        used does not depend on the size of the downloaded file.
+        """
+        if self.error_message is not None:
+            return
+        # A failure aborts the reply, which finishes it right away and may
+        # replace self.reply with a retried one.
+        reply = self.reply
+        if not self.output_file.isOpen() and not self.open_output():
+            if self.error_message is None:
+                # Discard the body so the reply does not stall on a full
+                # buffer.
+                reply.readAll()
+            return
+        while reply.bytesAvailable() > 0:
+            data = reply.read(DOWNLOAD_BUFFER_SIZE)
+            if not data:
+                break
+            if self.output_file.write(data) == -1:
+                self.fail(
+                    'Unable to write to %s: %s' % (
+                        self.partial_path, self.output_file.errorString()),
+                    retryable=False)
+                break
 
     def write_data(self):
-        """Write data to a file."""
-        self.output_file.write(self.downloaded_file_buffer)
-        self.output_file.close()
-        self.finished_flag = True
+        """Write the remaining data and close the file."""
+        if self.reply.error() == QNetworkReply.NoError:
+            self.get_buffer()
+        if self.output_file.isOpen():
+            self.output_file.close()
 
-    def request_timeout(self):
-        """The request timed out."""
-        if self.progress_dialog:
-            self.progress_dialog.hide()
+    def verify(self):
+        """Check the length and checksum of the complete partial file.
+
+        self.error_message is set when the file does not match.
+        """
+        if not os.path.exists(self.partial_path):
+            # Empty response
+            open(self.partial_path, 'wb').close()
+
+        size = os.path.getsize(self.partial_path)
+        if self.total_size is not None and size != self.total_size:
+            self.error_message = (
+                'Incomplete download of %s: %s of %s bytes.' % (
+                    self.url.toString(), size, self.total_size))
+            # The received bytes are still valid, resume from them.
+            self.retryable = True
+            self.resumable = size < self.total_size
+            return
+
+        expected = []
+        if self.checksum:
+            algorithm, digest = self.checksum.split(':', 1)
+            expected.append((algorithm, digest.lower()))
+        content_md5 = self.raw_header(b'Content-MD5')
+        if content_md5 and not self.offset:
+            # Content-MD5 covers the response body, i.e. the whole file only
+            # when it was not resumed.
+            try:
+                expected.append((
+                    'md5', base64.b64decode(content_md5).hex()))
+            except ValueError:
+                LOGGER.debug('Invalid Content-MD5 header: %s' % content_md5)
+
+        for algorithm, digest in expected:
+            file_hash = hashlib.new(algorithm)
+            with open(self.partial_path, 'rb') as partial_file:
+                for chunk in iter(
+                        lambda: partial_file.read(DOWNLOAD_BUFFER_SIZE), b''):
+                    file_hash.update(chunk)
+            if file_hash.hexdigest() != digest:
+                self.error_message = (
+                    'Checksum mismatch of %s.' % self.url.toString())
+                self.retryable = True
+                self.resumable = False
+                return
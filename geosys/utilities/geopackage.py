@@ -0,0 +1,90 @@
+# coding=utf-8
+"""Layers of the GeoPackage holding the vector outputs.
+
+A layer of a GeoPackage is referred to by its OGR uri, the path of the
+GeoPackage and the layer name, e.g. 'outputs.gpkg|layername=map'. The
+layers are listed from the GeoPackage contents table with sqlite3, so
+outputs can be checked without QGIS, e.g. by the run manifest.
+"""
+import logging
+import os
+import sqlite3
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+LOGGER = logging.getLogger('geosys')
+
+# Separator of the GeoPackage path and the layer name in an OGR uri
+LAYER_NAME_SEPARATOR = '|layername='
+
+
+def layer_uri(geopackage_path, layer_name):
+    """OGR uri of a layer of a GeoPackage.
+
+    :param geopackage_path: Path of the GeoPackage.
+    :type geopackage_path: str
+
+    :param layer_name: Name of the layer.
+    :type layer_name: str
+
+    :return: The uri.
+    :rtype: str
+    """
+    return '{}{}{}'.format(geopackage_path, LAYER_NAME_SEPARATOR, layer_name)
+
+
+def split_layer_uri(uri):
+    """Split the OGR uri of a layer of a GeoPackage.
+
+    :param uri: The uri, or the path of a file.
+    :type uri: str
+
+    :return: Tuple of (path, layer name), the layer name is None if the uri
+        is the path of a file.
+    :rtype: tuple
+    """
+    path, separator, layer_name = uri.partition(LAYER_NAME_SEPARATOR)
+    return path, (layer_name if separator else None)
+
+
+def layer_names(geopackage_path):
+    """Names of the layers of a GeoPackage.
+
+    :param geopackage_path: Path of the GeoPackage.
+    :type geopackage_path: str
+
+    :return: The layer names, empty if the GeoPackage does not exist or can
+        not be read.
+    :rtype: set
+    """
+    if not os.path.exists(geopackage_path):
+        return set()
+    try:
+        connection = sqlite3.connect(
+            'file:{}?mode=ro'.format(geopackage_path), uri=True)
+        try:
+            rows = connection.execute(
+                'SELECT table_name FROM gpkg_contents').fetchall()
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        LOGGER.debug('Unable to read %s: %s' % (geopackage_path, e))
+        return set()
+    return set(row[0] for row in rows)
+
+
+def output_exists(uri):
+    """Whether an output file or GeoPackage layer exists.
+
+    :param uri: Path of the file, or OGR uri of the layer.
+    :type uri: str
+
+    :rtype: bool
+    """
+    path, layer_name = split_layer_uri(uri)
+    if layer_name is None:
+        return os.path.exists(path)
+    return layer_name in layer_names(path)
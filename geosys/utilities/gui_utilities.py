@@ -1,6 +1,8 @@
 # coding=utf-8
 """GUI utilities for the dock and the multi Exposure Tool."""
+import logging
 import os
+import threading
 from past.builtins import cmp
 
 from qgis.core import (
@@ -10,10 +12,9 @@ from qgis.core import (
     QgsWkbTypes,
     QgsCoordinateTransform,
     QgsFeature,
+    QgsFeatureRequest,
     QgsMemoryProviderUtils,
-    QgsFields,
     QgsCoordinateReferenceSystem,
-    QgsVectorLayer,
     QgsField,
     QgsFields,
     QgsGeometry,
@@ -23,14 +24,44 @@ from qgis.PyQt.QtCore import Qt
 from PyQt5.QtCore import QVariant
 
 from geosys.utilities.qgis import qgis_version
-from geosys.bridge_api.default import SHP_EXT
+from geosys.bridge_api.default import (
+    SHP_EXT, GPKG_EXT, GEOMETRY_PRECISION, GEOMETRY_SIMPLIFY_TOLERANCE,
+    SESSION_GEOPACKAGE)
+from geosys.utilities.geopackage import layer_names, layer_uri
 from geosys.utilities.settings import setting
+from geosys.utilities.utilities import check_if_file_exists
 
 __copyright__ = "Copyright 2019, Kartoza"
 __license__ = "GPL version 3"
 __email__ = "rohmat@kartoza.com"
 __revision__ = "$Format:%H$"
 
+LOGGER = logging.getLogger('geosys')
+
+# Coordinate transforms of every thread, see coordinate_transform
+_TRANSFORMS = threading.local()
+
+# Schema of the hotspot and segment layers
+HOTSPOT_FIELDS = [('segmentId', QVariant.String)]
+SEGMENT_FIELDS = [
+    ('id', QVariant.Int),
+    ('mean', QVariant.Double),
+    ('max', QVariant.Double),
+    ('min', QVariant.Double),
+    ('area', QVariant.Double),
+    ('std', QVariant.Double)
+]
+
+# Writes to the session GeoPackage are serialized, maps are created
+# concurrently.
+_GEOPACKAGE_LOCK = threading.Lock()
+
+# OGR driver and extension of the hotspot layer formats
+HOTSPOT_LAYER_FORMATS = {
+    'shp': ('ESRI Shapefile', SHP_EXT),
+    'gpkg': ('GPKG', GPKG_EXT)
+}
+
 
 def layer_from_combo(combo):
     """Get the QgsMapLayer currently selected in a combo.
@@ -297,41 +328,61 @@ def create_memory_layer(
     return memory_layer
 
 
-def reproject(layer, output_crs):
-    """Reproject a vector layer to a specific CRS.
+def coordinate_transform(source_crs, destination_crs):
+    """Get a coordinate transform between two CRS.
 
-    :param layer: The layer to reproject.
-    :type layer: QgsVectorLayer
+    Transforms are cached per CRS pair and per thread, so repeated
+    reprojections, e.g. by processing algorithms, reuse them.
 
-    :param output_crs: The destination CRS.
-    :type output_crs: QgsCoordinateReferenceSystem
+    :param source_crs: The source CRS.
+    :type source_crs: QgsCoordinateReferenceSystem
 
-    :return: Reprojected memory layer.
-    :rtype: QgsVectorLayer
+    :param destination_crs: The destination CRS.
+    :type destination_crs: QgsCoordinateReferenceSystem
+
+    :return: The coordinate transform.
+    :rtype: QgsCoordinateTransform
     """
-    output_layer_name = '{}_reprojected'.format(layer.name())
+    transforms = getattr(_TRANSFORMS, 'transforms', None)
+    if transforms is None:
+        transforms = _TRANSFORMS.transforms = {}
+    key = (source_crs.toWkt(), destination_crs.toWkt())
+    if key not in transforms:
+        transforms[key] = QgsCoordinateTransform(
+            source_crs, destination_crs, QgsProject.instance())
+    return transforms[key]
+
 
-    input_crs = layer.crs()
-    input_fields = layer.fields()
+def reprojected_features(source, output_crs, request=None):
+    """Iterate over the features of a source reprojected to a specific CRS.
 
-    reprojected = create_memory_layer(
-        output_layer_name, layer.geometryType(), output_crs, input_fields)
-    reprojected.startEditing()
+    The features are transformed as they are read, no layer is created.
 
-    crs_transform = QgsCoordinateTransform(
-        input_crs, output_crs, QgsProject.instance())
+    :param source: The features source e.g. a vector layer.
+    :type source: QgsFeatureSource
 
-    out_feature = QgsFeature()
+    :param output_crs: The destination CRS.
+    :type output_crs: QgsCoordinateReferenceSystem
 
-    for i, feature in enumerate(layer.getFeatures()):
-        geom = feature.geometry()
-        geom.transform(crs_transform)
-        out_feature.setGeometry(geom)
-        out_feature.setAttributes(feature.attributes())
-        reprojected.addFeature(out_feature)
+    :param request: Request filtering the features.
+    :type request: QgsFeatureRequest
 
-    reprojected.commitChanges()
-    return reprojected
+    :return: Iterator of the reprojected features.
+    :rtype: iterator
+    """
+    features = source.getFeatures(request or QgsFeatureRequest())
+    if source.sourceCrs() == output_crs:
+        for feature in features:
+            yield feature
+        return
+
+    crs_transform = coordinate_transform(source.sourceCrs(), output_crs)
+    for feature in features:
+        if feature.hasGeometry():
+            geom = feature.geometry()
+            geom.transform(crs_transform)
+            feature.setGeometry(geom)
+        yield feature
 
 
 def wkt_geometries_from_feature_iterator(
@@ -352,27 +403,91 @@ def wkt_geometries_from_feature_iterator(
     :return: List of wkt geometries.
     :rtype: list
     """
-    geom = None
     geoms = []
     for index, feature in enumerate(feature_iterator):
         if index >= max_features:
             break
         if not feature.hasGeometry():
             continue
-        if as_single_geometry:
-            if not geom:
-                geom = feature.geometry()
-            else:
-                geom = geom.combine(feature.geometry())
-        else:
-            geoms.append(feature.geometry())
+        geoms.append(feature.geometry())
+
+    if as_single_geometry:
+        geom = merge_geometries(geoms)
+        return [prepare_geometry(geom)] if geom else []
+    return [prepare_geometry(geom) for geom in geoms]
+
+
+def merge_geometries(geometries):
+    """Merge geometries into a single geometry.
+
+    The geometries are dissolved in one unary union, which is much faster
+    than combining them one after the other as the merged geometry grows.
+
+    :param geometries: The geometries to merge.
+    :type geometries: list
+
+    :return: The merged geometry, None if there is no geometry to merge.
+    :rtype: QgsGeometry
+    """
+    if not geometries:
+        return None
+    if len(geometries) == 1:
+        return QgsGeometry(geometries[0])
+    geometry = QgsGeometry.unaryUnion(geometries)
+    if geometry.isNull():
+        return None
+    return geometry
+
+
+def prepare_geometry(geometry, precision=None, tolerance=None):
+    """Get the WKT of a geometry sent to Bridge API.
+
+    The coordinates are snapped to the given precision and polygons are
+    optionally simplified, which shrinks the WKT of densely digitised
+    fields. Simplified polygons are grown by the tolerance so they still
+    cover the field. The full precision WKT is returned if the prepared
+    geometry is not valid or does not cover the field anymore.
+
+    :param geometry: Geometry in EPSG:4326.
+    :type geometry: QgsGeometry
+
+    :param precision: Number of decimals of the coordinates, read from the
+        geometry_precision setting if not given.
+    :type precision: int
+
+    :param tolerance: Simplification tolerance in degrees, read from the
+        geometry_simplify_tolerance setting if not given. Geometries are
+        not simplified with a tolerance of 0.
+    :type tolerance: float
+
+    :return: The WKT of the geometry.
+    :rtype: str
+    """
+    if precision is None:
+        precision = setting(
+            'geometry_precision', GEOMETRY_PRECISION, expected_type=int)
+    if tolerance is None:
+        tolerance = setting(
+            'geometry_simplify_tolerance', GEOMETRY_SIMPLIFY_TOLERANCE,
+            expected_type=float)
+
+    prepared = QgsGeometry(geometry)
+    is_polygon = geometry.type() == QgsWkbTypes.PolygonGeometry
+    if tolerance > 0 and is_polygon:
+        # A single segment per quarter circle keeps the vertex count low.
+        prepared = prepared.simplify(tolerance).buffer(tolerance, 1)
+    step = 10 ** -precision
+    prepared = prepared.snappedToGrid(step, step)
+
+    if prepared.isNull() or not prepared.isGeosValid():
+        return geometry.asWkt()
+    if is_polygon:
+        # Snapping moves the boundary by up to half a grid step.
+        uncovered = geometry.difference(prepared.buffer(step, 1))
+        if not uncovered.isEmpty() and uncovered.area() > 0:
+            return geometry.asWkt()
+    return prepared.asWkt(precision)
 
-    if geom:
-        return [geom.asWkt()]
-    elif geoms:
-        return [geom.asWkt() for geom in geoms]
-    else:
-        return []
 
 def attribute_from_feature_iterator(
         feature_iterator, attribute):
@@ -397,8 +512,12 @@ def attribute_from_feature_iterator(
 
     return attr_vals
 
+
 def create_hotspot_layer(source, source_type, source_filename):
-    """Creates layer from wkt text in the source.
+    """Writes a layer from wkt text in the source.
+
+        The layer is only written, it is safe to call from a worker thread.
+        It is added to the project by the caller on the main thread.
 
         :param source: Array with json objects containing WKT text.
         :type source: array
@@ -439,71 +558,183 @@ def create_hotspot_layer(source, source_type, source_filename):
 
         :param source_filename: Filename of the result layer
         :type source_filename: string
+
+        :return: Path of the saved layer, None if it could not be written.
+        :rtype: str
     """
-    crs = QgsCoordinateReferenceSystem()
+    crs = QgsCoordinateReferenceSystem('EPSG:4326')
     fields = QgsFields()
-    features = []
 
     if source_type == "hotspots":
-        layer_type = "MULTIPOINT?crs={}".format(crs.authid())
-        fields.append(QgsField("segmentId", QVariant.String))
-
-        for spot in source:
-            geom = QgsGeometry.fromWkt(spot['geometry'])
-            feature = QgsFeature()
-            feature.setFields(fields)
-            feature.setGeometry(geom)
-            feature[0] = spot['segmentId']
-            features.append(feature)
+        wkb_type = QgsWkbTypes.MultiPoint
+        for name, field_type in HOTSPOT_FIELDS:
+            fields.append(QgsField(name, field_type))
+        records = [
+            (spot['geometry'], [spot['segmentId']]) for spot in source]
     else:
-        layer_type = "MULTIPOLYGON?crs={}".format(crs.authid())
+        wkb_type = QgsWkbTypes.MultiPolygon
+        for name, field_type in SEGMENT_FIELDS:
+            fields.append(QgsField(name, field_type))
+        records = []
         for zone in source:
-            fields.append(QgsField("id", QVariant.Int))
-            fields.append(QgsField("mean", QVariant.Double))
-            fields.append(QgsField("max", QVariant.Double))
-            fields.append(QgsField("min", QVariant.Double))
-            fields.append(QgsField("area", QVariant.Double))
-            fields.append(QgsField("std", QVariant.Double))
-
             for polygon in zone.get('segments'):
-                geom = QgsGeometry.fromWkt(polygon['geometry'])
-                feature = QgsFeature()
-                feature.setFields(fields)
-                feature.setGeometry(geom)
-                feature[0] = int(polygon['id'])
-                feature[1] = float(polygon['stats']['mean'])
-                feature[2] = float(polygon['stats']['max'])
-                feature[3] = float(polygon['stats']['min'])
-                feature[4] = float(polygon['stats']['area'])
-
-                # The API produces None values for standard deviation
-                # This check will leave the standard deviation as None in the attribute table if the response from the API is None
-                # Otherwise the value from the API will be used
-                std_value = polygon['stats']['std']
-                if std_value is not None:
-                    feature[5] = float(polygon['stats']['std'])
-
-                features.append(feature)
-
-    layer = QgsVectorLayer(layer_type, source_filename, "memory")
-    layer.dataProvider().addAttributes(fields)
-    layer.dataProvider().addFeatures(features)
-    layer.updateExtents()
-    layer.reload()
-
-    file_name = '{}{}'.format(source_filename, SHP_EXT)
+                stats = polygon['stats']
+                records.append((polygon['geometry'], [
+                    int(polygon['id']),
+                    float(stats['mean']),
+                    float(stats['max']),
+                    float(stats['min']),
+                    float(stats['area']),
+                    # The API produces None values for standard deviation,
+                    # they are left as NULL in the attribute table.
+                    float(stats['std'])
+                    if stats['std'] is not None else None
+                ]))
+
+    features = []
+    for wkt, attributes in records:
+        geom = QgsGeometry.fromWkt(wkt)
+        geom.convertToMultiType()
+        feature = QgsFeature(fields)
+        feature.setGeometry(geom)
+        feature.setAttributes(attributes)
+        features.append(feature)
+
     output_dir = setting(
             'output_directory', expected_type=str)
-    file_name = os.path.join(output_dir, file_name)
-
-    # Save memory layer to disk
-    error, error_message = QgsVectorFileWriter.writeAsVectorFormat(
-        layer,
-        file_name,
-        "UTF-8",
-        crs,
-        "ESRI Shapefile")
-
-    if error == QgsVectorFileWriter.NoError:
-        saved_layer = QgsVectorLayer(file_name, source_filename, "ogr")
-        add_layer_to_canvas(saved_layer, source_filename)
+    geopackage_path = vector_output_geopackage(output_dir)
+    if geopackage_path:
+        layer = create_memory_layer(
+            source_filename, QgsWkbTypes.geometryType(wkb_type), crs, fields)
+        layer.dataProvider().addFeatures(features)
+        return write_to_geopackage(layer, geopackage_path, source_filename)
+
+    driver_name, extension = hotspot_layer_format()
+    file_name = os.path.join(
+        output_dir, '{}{}'.format(source_filename, extension))
+
+    # The features are written in one batch, straight to the file.
+    writer = QgsVectorFileWriter(
+        file_name, "UTF-8", fields, wkb_type, crs, driver_name)
+    if writer.hasError() != QgsVectorFileWriter.NoError:
+        LOGGER.debug('Unable to write {}: {}'.format(
+            file_name, writer.errorMessage()))
+        return None
+    writer.addFeatures(features)
+    # Deleting the writer flushes the features to disk.
+    del writer
+    return file_name
+
+
+def vector_output_geopackage(output_dir):
+    """Path of the GeoPackage holding the vector outputs of a directory.
+
+    With the vector_output_mode setting set to geopackage, the vector maps,
+    hotspots and segments are layers of a single GeoPackage with spatial
+    indexes instead of separate shapefiles.
+
+    :param output_dir: The output directory.
+    :type output_dir: str
+
+    :return: Path of the GeoPackage, None if vector outputs are written as
+        separate files.
+    :rtype: str
+    """
+    mode = setting('vector_output_mode', 'files', expected_type=str)
+    if mode != 'geopackage':
+        return None
+    return os.path.join(output_dir, SESSION_GEOPACKAGE)
+
+
+def geopackage_layer_uri(geopackage_path, layer_name):
+    """OGR uri of a layer of a GeoPackage.
+
+    :param geopackage_path: Path of the GeoPackage.
+    :type geopackage_path: str
+
+    :param layer_name: Name of the layer.
+    :type layer_name: str
+
+    :return: The uri.
+    :rtype: str
+    """
+    return layer_uri(geopackage_path, layer_name)
+
+
+def write_to_geopackage(layer, geopackage_path, layer_name):
+    """Write a vector layer to a GeoPackage with a spatial index.
+
+    A layer of the GeoPackage with the same name is replaced.
+
+    :param layer: The layer to write.
+    :type layer: QgsVectorLayer
+
+    :param geopackage_path: Path of the GeoPackage, created if needed.
+    :type geopackage_path: str
+
+    :param layer_name: Name of the layer in the GeoPackage.
+    :type layer_name: str
+
+    :return: OGR uri of the written layer, None if it could not be written.
+    :rtype: str
+    """
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'GPKG'
+    options.fileEncoding = 'UTF-8'
+    options.layerName = layer_name
+    options.layerOptions = ['SPATIAL_INDEX=YES']
+    with _GEOPACKAGE_LOCK:
+        if os.path.exists(geopackage_path):
+            options.actionOnExistingFile = (
+                QgsVectorFileWriter.CreateOrOverwriteLayer)
+        else:
+            options.actionOnExistingFile = (
+                QgsVectorFileWriter.CreateOrOverwriteFile)
+        error, error_message = QgsVectorFileWriter.writeAsVectorFormat(
+            layer, geopackage_path, options)
+    if error != QgsVectorFileWriter.NoError:
+        LOGGER.debug('Unable to write {} to {}: {}'.format(
+            layer_name, geopackage_path, error_message))
+        return None
+    return geopackage_layer_uri(geopackage_path, layer_name)
+
+
+def vector_output_name(output_dir, name, extension):
+    """Output name of a vector layer.
+
+    The name does not clash with the existing files, or with the existing
+    layers of the session GeoPackage, which would be replaced.
+
+    :param output_dir: The output directory.
+    :type output_dir: str
+
+    :param name: The name of the layer.
+    :type name: str
+
+    :param extension: Extension of the layer file.
+    :type extension: str
+
+    :return: The output name.
+    :rtype: str
+    """
+    geopackage_path = vector_output_geopackage(output_dir)
+    if geopackage_path:
+        return check_if_file_exists(
+            output_dir, name, '', taken=layer_names(geopackage_path))
+    return check_if_file_exists(output_dir, name, extension)
+
+
+def hotspot_layer_format():
+    """Format of the hotspot and segment layers.
+
+    Layers are written as shapefiles unless the hotspot_layer_format
+    setting is gpkg, GeoPackages being faster to write and load for
+    layers with many segments.
+
+    :return: Tuple of (OGR driver name, file extension).
+    :rtype: tuple
+    """
+    layer_format = setting(
+        'hotspot_layer_format', 'shp', expected_type=str)
+    return HOTSPOT_LAYER_FORMATS.get(
+        layer_format, HOTSPOT_LAYER_FORMATS['shp'])
@@ -0,0 +1,234 @@
+# coding=utf-8
+"""Background job queue backed by the QGIS task manager.
+
+Every job is a ``QgsTask``. The queue hands at most ``max_workers`` tasks to
+the task manager at a time and tracks the status of every job. Status
+changes are delivered on the main thread, where the task ``finished``
+handlers also run, so tasks can safely load layers into QGIS.
+"""
+import logging
+from functools import partial
+
+from qgis.core import QgsApplication
+from qgis.PyQt.QtCore import QObject, pyqtSignal
+
+from geosys.bridge_api.default import DEFAULT_MAP_CREATION_WORKERS
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+LOGGER = logging.getLogger('geosys')
+
+# Job status
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELED = 'canceled'
+
+
+class Job(object):
+    """A unit of work of the job queue."""
+
+    def __init__(self, job_id, task, description='', key=None):
+        """A unit of work of the job queue.
+
+        :param job_id: Identifier of the job in its queue.
+        :type job_id: int
+
+        :param task: The task doing the work. It may set a message attribute
+            describing its outcome.
+        :type task: QgsTask
+
+        :param description: Human readable description of the job.
+        :type description: str
+
+        :param key: Key of the work, jobs doing the same work share it.
+        :type key: str
+        """
+        self.job_id = job_id
+        self.key = key
+        # The reference also keeps the python task object alive while the
+        # task manager runs it.
+        self.task = task
+        self.description = description or task.description()
+        self.status = QUEUED
+        self.message = ''
+        self.canceled = False
+
+    @property
+    def is_done(self):
+        """Whether the job has finished, whatever its outcome.
+
+        :rtype: bool
+        """
+        return self.status in (SUCCEEDED, FAILED, CANCELED)
+
+
+class JobQueue(QObject):
+    """Queue running tasks in parallel in the QGIS task manager.
+
+    A failed job does not stop the queue, the remaining jobs keep running.
+    """
+    job_status_changed = pyqtSignal(object)
+    finished = pyqtSignal()
+
+    def __init__(
+            self, max_workers=DEFAULT_MAP_CREATION_WORKERS,
+            task_manager=None, parent=None):
+        """Queue running tasks in parallel in the QGIS task manager.
+
+        :param max_workers: Number of jobs running at the same time.
+        :type max_workers: int
+
+        :param task_manager: Task manager running the tasks, the QGIS one if
+            not given.
+        :type task_manager: QgsTaskManager
+
+        :param parent: Parent object.
+        :type parent: QObject
+        """
+        super(JobQueue, self).__init__(parent)
+        self.task_manager = task_manager or QgsApplication.taskManager()
+        self.max_workers = 1
+        self.jobs = []
+        self._next_id = 0
+        self.set_max_workers(max_workers)
+
+    def set_max_workers(self, max_workers):
+        """Set the number of jobs running at the same time.
+
+        :param max_workers: Number of parallel jobs, at least one.
+        :type max_workers: int
+        """
+        self.max_workers = max(1, max_workers)
+        self.start_next()
+
+    def submit(self, task, description='', key=None):
+        """Add a task to the queue.
+
+        :param task: The task.
+        :type task: QgsTask
+
+        :param description: Human readable description of the job.
+        :type description: str
+
+        :param key: Key of the work of the task, see find_active_job.
+        :type key: str
+
+        :return: The queued job.
+        :rtype: Job
+        """
+        if not self.is_running():
+            # A new batch starts, forget the jobs of the previous one.
+            self.jobs = []
+        job = Job(self._next_id, task, description=description, key=key)
+        self._next_id += 1
+        self.jobs.append(job)
+        self.job_status_changed.emit(job)
+        self.start_next()
+        return job
+
+    def start_next(self):
+        """Hand queued tasks to the task manager while workers are free."""
+        running = len(self.jobs_with_status(RUNNING))
+        for job in self.jobs_with_status(QUEUED):
+            if running >= self.max_workers:
+                break
+            job.task.taskCompleted.connect(
+                partial(self.job_finished, job.job_id, True))
+            job.task.taskTerminated.connect(
+                partial(self.job_finished, job.job_id, False))
+            job.status = RUNNING
+            running += 1
+            self.task_manager.addTask(job.task)
+            self.job_status_changed.emit(job)
+
+    def cancel(self, job=None):
+        """Cancel a job, or every unfinished job when none is given.
+
+        :param job: The job to cancel.
+        :type job: Job
+        """
+        jobs = [job] if job else list(self.jobs)
+        for job in jobs:
+            if job.is_done:
+                continue
+            job.canceled = True
+            if job.status == QUEUED:
+                # Never handed to the task manager, the task is terminated
+                # here and its finished handler called as the task manager
+                # would, so it releases what it holds.
+                job.task.cancel()
+                job.task.finished(False)
+                self.job_finished(job.job_id, False)
+            else:
+                job.task.cancel()
+
+    def is_running(self):
+        """Whether some jobs are still queued or running.
+
+        :rtype: bool
+        """
+        return any(not job.is_done for job in self.jobs)
+
+    def jobs_with_status(self, *status):
+        """Get the jobs of the current batch with a given status.
+
+        :param status: The job status e.g. FAILED.
+        :type status: str
+
+        :return: The jobs.
+        :rtype: list
+        """
+        return [job for job in self.jobs if job.status in status]
+
+    def find_job(self, job_id):
+        """Get a job of the current batch from its identifier.
+
+        :rtype: Job
+        """
+        for job in self.jobs:
+            if job.job_id == job_id:
+                return job
+        return None
+
+    def find_active_job(self, key):
+        """Get the queued or running job doing some work.
+
+        :param key: Key of the work.
+        :type key: str
+
+        :return: The job, None if no unfinished job has the key.
+        :rtype: Job
+        """
+        for job in self.jobs:
+            if key is not None and job.key == key and not job.is_done:
+                return job
+        return None
+
+    def job_finished(self, job_id, is_success):
+        """Record the outcome of a job and start the next ones.
+
+        :param job_id: Identifier of the job.
+        :type job_id: int
+
+        :param is_success: Whether the task completed successfully.
+        :type is_success: bool
+        """
+        job = self.find_job(job_id)
+        if job is None or job.is_done:
+            return
+        job.message = getattr(job.task, 'message', '')
+        if job.canceled:
+            job.status = CANCELED
+        elif is_success:
+            job.status = SUCCEEDED
+        else:
+            job.status = FAILED
+        self.job_status_changed.emit(job)
+        self.start_next()
+        if not self.is_running():
+            self.finished.emit()
@@ -0,0 +1,184 @@
+# coding=utf-8
+"""Local content-addressed store of created maps.
+
+Each entry is a directory named after the key of the map request, holding
+the map files, e.g. the raster and its world file. A map requested again is
+linked or copied out of the store instead of being created and downloaded
+again, so the store may live on a drive shared by several users. The
+modification time of an entry directory records its last access, entries
+are evicted least recently used first once the store grows beyond its size
+budget.
+"""
+import glob
+import logging
+import os
+import shutil
+import tempfile
+
+from geosys.bridge_api.response_cache import request_fingerprint
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+LOGGER = logging.getLogger('geosys')
+
+# Base name of the map files in an entry
+ENTRY_BASENAME = 'map'
+
+
+def link_file(source_path, destination_path):
+    """Hard link a file, or copy it when the file system does not allow it.
+
+    :param source_path: Path of the file.
+    :type source_path: str
+
+    :param destination_path: Path of the link.
+    :type destination_path: str
+    """
+    try:
+        os.link(source_path, destination_path)
+    except OSError:
+        shutil.copy2(source_path, destination_path)
+
+
+class MapStore(object):
+    """Size-bounded LRU store of map files keyed by their request."""
+
+    def __init__(self, directory, max_size):
+        """Size-bounded LRU store of map files keyed by their request.
+
+        :param directory: Directory where the entries are stored.
+        :type directory: str
+
+        :param max_size: Size budget of the store in bytes.
+        :type max_size: int
+        """
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    @staticmethod
+    def key(*parameters):
+        """Key of a map request.
+
+        :param parameters: Canonical parameters of the request.
+        :type parameters: list
+
+        :return: The key.
+        :rtype: str
+        """
+        return request_fingerprint(*parameters)
+
+    def _entry_path(self, key):
+        """Path of the entry directory of a key."""
+        return os.path.join(self.directory, key)
+
+    def _entries(self):
+        """List entries as (path, last access, size) tuples."""
+        entries = []
+        for name in os.listdir(self.directory):
+            # Entries being written are hidden
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                last_access = os.stat(path).st_mtime
+                size = sum(
+                    os.path.getsize(os.path.join(path, file_name))
+                    for file_name in os.listdir(path))
+            except OSError:
+                continue
+            entries.append((path, last_access, size))
+        return entries
+
+    def get(self, key, destination_base_path, hardlink=True):
+        """Get the files of a stored map.
+
+        :param key: Key of the map request.
+        :type key: str
+
+        :param destination_base_path: Base path of the map files, the
+            extension of every stored file is appended to it.
+        :type destination_base_path: str
+
+        :param hardlink: Whether the files may be hard linked. Linked files
+            share their content with the store, so maps edited in place
+            must be copied.
+        :type hardlink: bool
+
+        :return: Paths of the map files, None if the map is not stored.
+        :rtype: list
+        """
+        entry_path = self._entry_path(key)
+        paths = []
+        try:
+            for file_name in os.listdir(entry_path):
+                extension = file_name[len(ENTRY_BASENAME):]
+                path = destination_base_path + extension
+                if hardlink:
+                    link_file(os.path.join(entry_path, file_name), path)
+                else:
+                    shutil.copy2(os.path.join(entry_path, file_name), path)
+                paths.append(path)
+            os.utime(entry_path, None)
+        except (IOError, OSError) as e:
+            if os.path.exists(entry_path):
+                LOGGER.debug('Unable to get stored map %s: %s' % (key, e))
+            # The entry may have been evicted meanwhile
+            for path in paths:
+                os.remove(path)
+            return None
+        return paths or None
+
+    def put(self, key, source_base_path):
+        """Store the files of a map.
+
+        :param key: Key of the map request.
+        :type key: str
+
+        :param source_base_path: Base path of the map files. Every file
+            sharing it, e.g. the world file of a PNG map, is stored.
+        :type source_base_path: str
+        """
+        entry_path = self._entry_path(key)
+        if os.path.exists(entry_path):
+            return
+        source_paths = glob.glob(glob.escape(source_base_path) + '.*')
+        if not source_paths:
+            return
+
+        # The entry is written aside and renamed, so it is never seen
+        # incomplete by other users of the store.
+        staging_path = tempfile.mkdtemp(prefix='.', dir=self.directory)
+        try:
+            for source_path in source_paths:
+                extension = source_path[len(source_base_path):]
+                # The store keeps its own copy, the map may be edited.
+                shutil.copy2(
+                    source_path,
+                    os.path.join(staging_path, ENTRY_BASENAME + extension))
+            os.rename(staging_path, entry_path)
+        except (IOError, OSError) as e:
+            # The map may have been stored by another user meanwhile.
+            LOGGER.debug('Unable to store map %s: %s' % (key, e))
+            shutil.rmtree(staging_path, ignore_errors=True)
+            return
+        self._evict()
+
+    def clear(self):
+        """Remove every entry."""
+        for path, _, _ in self._entries():
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _evict(self):
+        """Remove least recently used entries until within the budget."""
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        size = sum(entry_size for _, _, entry_size in entries)
+        for path, _, entry_size in entries:
+            if size <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            size -= entry_size
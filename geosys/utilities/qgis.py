@@ -1,7 +1,9 @@
 # coding=utf-8
 """Helpers for QGIS related functionality."""
 
-from qgis.core import Qgis
+import os
+
+from qgis.core import Qgis, QgsApplication
 
 __copyright__ = "Copyright 2019, Kartoza"
 __license__ = "GPL version 3"
@@ -28,3 +30,21 @@ def qgis_version():
     version = str(Qgis.QGIS_VERSION_INT)
     version = int(version)
     return version
+
+
+def geosys_profile_path(*args):
+    """Get a path inside the GEOSYS folder of the user profile.
+
+    The directory is created if it does not exist.
+
+    :param args: List of path elements e.g. ['cache', 'thumbnails']
+    :type args: list
+
+    :returns: Absolute path to the directory.
+    :rtype: str
+    """
+    path = os.path.join(
+        QgsApplication.qgisSettingsDirPath(), 'geosys', *args)
+    if not os.path.exists(path):
+        os.makedirs(path)
+    return path
@@ -0,0 +1,88 @@
+# coding=utf-8
+"""Post-processing of downloaded rasters."""
+import logging
+import os
+
+from osgeo import gdal
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+LOGGER = logging.getLogger('geosys')
+
+# Extension of the raster being converted
+CONVERSION_EXTENSION = '.cog.part'
+
+# Creation options of the Cloud-Optimized GeoTIFF driver (GDAL >= 3.1)
+COG_OPTIONS = [
+    'COMPRESS=DEFLATE',
+    'BLOCKSIZE=512',
+    'OVERVIEWS=AUTO',
+    'NUM_THREADS=ALL_CPUS'
+]
+
+# Equivalent GeoTIFF creation options for older GDAL versions
+TILED_GTIFF_OPTIONS = [
+    'TILED=YES',
+    'BLOCKXSIZE=512',
+    'BLOCKYSIZE=512',
+    'COMPRESS=DEFLATE',
+    'COPY_SRC_OVERVIEWS=YES',
+    'NUM_THREADS=ALL_CPUS'
+]
+
+# Decimation factors of the overviews built for older GDAL versions
+OVERVIEW_LEVELS = [2, 4, 8, 16, 32]
+
+
+def convert_to_cog(raster_path):
+    """Convert a GeoTIFF to a tiled, compressed Cloud-Optimized GeoTIFF.
+
+    The raster gets internal overviews so QGIS renders it at any scale
+    without reading every pixel. It is converted to a file next to it which
+    replaces it once complete, the raster is left unchanged if the
+    conversion fails. Errors are logged, not raised, the raster being
+    usable as downloaded.
+
+    :param raster_path: Path of the GeoTIFF.
+    :type raster_path: str
+
+    :return: True if the raster was converted.
+    :rtype: bool
+    """
+    converted_path = raster_path + CONVERSION_EXTENSION
+    overview_path = raster_path + '.ovr'
+    try:
+        if gdal.GetDriverByName('COG'):
+            options = gdal.TranslateOptions(
+                format='COG', creationOptions=COG_OPTIONS)
+        else:
+            # The overviews are built aside and copied into the tiled file.
+            source = gdal.Open(raster_path, gdal.GA_ReadOnly)
+            if source is None:
+                return False
+            source.BuildOverviews('AVERAGE', OVERVIEW_LEVELS)
+            source = None
+            options = gdal.TranslateOptions(
+                format='GTiff', creationOptions=TILED_GTIFF_OPTIONS)
+
+        converted = gdal.Translate(
+            converted_path, raster_path, options=options)
+        if converted is None:
+            LOGGER.debug('Unable to convert %s: %s' % (
+                raster_path, gdal.GetLastErrorMsg()))
+            return False
+        # Flush the converted raster to disk
+        converted = None
+        os.replace(converted_path, raster_path)
+        return True
+    except (RuntimeError, OSError) as e:
+        # GDAL raises RuntimeError when its exceptions are enabled
+        LOGGER.debug('Unable to convert %s: %s' % (raster_path, e))
+        return False
+    finally:
+        for path in (converted_path, overview_path):
+            if os.path.exists(path):
+                os.remove(path)
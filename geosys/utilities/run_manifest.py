@@ -0,0 +1,250 @@
+# coding=utf-8
+"""Run manifest of batch map creations.
+
+The manifest is a JSON file in the output directory recording, for every
+map of a batch, its request parameters, its state and its output files.
+A batch run again with the same requests skips the maps already created
+and reuses the output names of the unfinished ones, so their partial
+downloads are resumed.
+
+Several runs, e.g. the dock widget and a processing algorithm, may share an
+output directory. Every update is made under a lock file, merging the
+record into the manifest as currently saved, so no run overwrites the
+records of another one.
+"""
+import contextlib
+import errno
+import json
+import logging
+import os
+import threading
+import time
+
+from geosys.bridge_api.response_cache import request_fingerprint
+from geosys.utilities.geopackage import output_exists
+
+__copyright__ = "Copyright 2019, Kartoza"
+__license__ = "GPL version 3"
+__email__ = "rohmat@kartoza.com"
+__revision__ = "$Format:%H$"
+
+LOGGER = logging.getLogger('geosys')
+
+MANIFEST_FILENAME = 'geosys_manifest.json'
+MANIFEST_VERSION = 1
+
+# Seconds after which the lock file of a crashed run is removed
+LOCK_STALE_AGE = 30
+
+# Seconds between two attempts to take the lock file
+LOCK_POLL_INTERVAL = 0.05
+
+# Map state
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold a lock file shared by the processes writing a file.
+
+    The lock is taken by creating path + '.lock' exclusively. When the lock
+    file can not be created, e.g. in a read-only directory, the file is
+    written without lock.
+
+    :param path: Path of the locked file.
+    :type path: str
+    """
+    lock_path = path + '.lock'
+    descriptor = None
+    while True:
+        try:
+            descriptor = os.open(
+                lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                LOGGER.debug('Unable to lock %s: %s' % (path, e))
+                break
+        try:
+            if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_AGE:
+                os.remove(lock_path)
+                continue
+        except OSError:
+            # Released meanwhile
+            continue
+        time.sleep(LOCK_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        if descriptor is not None:
+            os.close(descriptor)
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+
+
+class RunManifest(object):
+    """JSON manifest of the maps of batch runs in an output directory."""
+
+    def __init__(self, directory, filename=MANIFEST_FILENAME):
+        """JSON manifest of the maps of batch runs in an output directory.
+
+        :param directory: Output directory of the batch.
+        :type directory: str
+
+        :param filename: File name of the manifest.
+        :type filename: str
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, filename)
+        self._lock = threading.Lock()
+        self.items = {}
+        self.load()
+
+    @staticmethod
+    def key(*parameters):
+        """Key of a map request.
+
+        :param parameters: Canonical parameters of the request.
+        :type parameters: list
+
+        :return: The key.
+        :rtype: str
+        """
+        return request_fingerprint(*parameters)
+
+    def _read(self):
+        """Read the items of the manifest file.
+
+        :return: The items, None if the file is missing or unreadable.
+        :rtype: dict
+        """
+        try:
+            with open(self.path) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (IOError, OSError, ValueError):
+            return None
+        if not isinstance(manifest, dict) or \
+                manifest.get('version') != MANIFEST_VERSION:
+            return None
+        return manifest.get('items', {})
+
+    def load(self):
+        """Read the manifest file, an unreadable file is ignored."""
+        items = self._read()
+        with self._lock:
+            self.items = items or {}
+
+    def _save(self):
+        """Write the manifest file atomically, the locks must be held."""
+        temporary_path = self.path + '.tmp'
+        try:
+            with open(temporary_path, 'w') as manifest_file:
+                json.dump({
+                    'version': MANIFEST_VERSION,
+                    'items': self.items
+                }, manifest_file, indent=2, sort_keys=True)
+            os.replace(temporary_path, self.path)
+        except (IOError, OSError) as e:
+            LOGGER.debug('Unable to save the run manifest: %s' % e)
+
+    def get(self, key):
+        """Get the record of a map.
+
+        :param key: Key of the map request.
+        :type key: str
+
+        :return: Record with parameters, state, outputs and message keys,
+            None if the map is not in the manifest.
+        :rtype: dict
+        """
+        with self._lock:
+            item = self.items.get(key)
+            return dict(item) if item else None
+
+    def is_done(self, key):
+        """Whether a map was created and its outputs still exist.
+
+        :param key: Key of the map request.
+        :type key: str
+
+        :rtype: bool
+        """
+        item = self.get(key)
+        if not item or item['state'] != DONE:
+            return False
+        return all(
+            output_exists(os.path.join(self.directory, output))
+            for output in item['outputs'])
+
+    def start(self, key, parameters, outputs):
+        """Record a map whose creation starts.
+
+        :param key: Key of the map request.
+        :type key: str
+
+        :param parameters: JSON serializable request parameters.
+        :type parameters: dict
+
+        :param outputs: Output files, relative to the output directory. A
+            layer of a GeoPackage is given by its OGR uri, see
+            geopackage.layer_uri.
+        :type outputs: list
+        """
+        self._update(key, parameters=parameters, outputs=outputs,
+                     state=PENDING, message='')
+
+    def complete(self, key, outputs=None, details=None):
+        """Record a map as created.
+
+        :param key: Key of the map request.
+        :type key: str
+
+        :param outputs: Output files, relative to the output directory. The
+            recorded ones are kept if not given.
+        :type outputs: list
+
+        :param details: JSON serializable details of the created map, e.g.
+            its image date.
+        :type details: dict
+        """
+        values = {'state': DONE, 'message': '', 'details': details or {}}
+        if outputs is not None:
+            values['outputs'] = outputs
+        self._update(key, **values)
+
+    def fail(self, key, message=''):
+        """Record a map whose creation failed.
+
+        :param key: Key of the map request.
+        :type key: str
+
+        :param message: Error message.
+        :type message: str
+        """
+        self._update(key, state=FAILED, message=message)
+
+    def _update(self, key, **values):
+        """Update the record of a map and save the manifest.
+
+        The manifest is read again first, so the records saved by other
+        runs since it was last read are kept.
+        """
+        with self._lock, file_lock(self.path):
+            items = self._read()
+            if items is not None:
+                if key not in items and key in self.items:
+                    items[key] = self.items[key]
+                self.items = items
+            item = self.items.setdefault(key, {
+                'parameters': {},
+                'outputs': [],
+                'state': PENDING,
+                'message': ''
+            })
+            item.update(values)
+            item['updated_at'] = time.time()
+            self._save()
@@ -4,6 +4,7 @@
 
 
 import codecs
+import glob
 import json
 import logging
 import platform
@@ -19,6 +20,7 @@ from geosys import messaging as m
 from geosys.messaging import styles, Message
 from geosys.messaging.error_message import ErrorMessage
 from geosys.utilities.i18n import tr
+from geosys.utilities.map_store import link_file
 
 __copyright__ = "Copyright 2019, Kartoza"
 __license__ = "GPL version 3"
@@ -313,7 +315,8 @@ def readable_os_version():
         return platform.platform()
 
 
-def check_if_file_exists(output_dir, file_name, extension):
+def check_if_file_exists(
+        output_dir, file_name, extension, reserved=None, taken=None):
     """The method checks if a file exists, and if it does, then it adds an increment to the filename.
     This is done until there are no longer a clash with the filename.
 
@@ -326,19 +329,59 @@ def check_if_file_exists(output_dir, file_name, extension):
     :param extension: The output file extension.
     :type extension: str
 
+    :param reserved: Names already taken by files which are not written
+        yet, e.g. outputs of queued jobs. The returned name is added to it.
+    :type reserved: set
+
+    :param taken: Names already taken by outputs which are not files, e.g.
+        the layers of a GeoPackage.
+    :type taken: set
+
     :returns: Returns the updated name for the output file which will have no clashes with existing files.
     :rtype: str
     """
+    reserved = reserved if reserved is not None else set()
+    taken = taken or set()
     cur_file_name = file_name
-    file_full_dir = '{}\\{}{}'.format(output_dir, cur_file_name, extension)
+    file_full_dir = os.path.join(
+        output_dir, '{}{}'.format(cur_file_name, extension))
 
     i = 1
     while True:  # Will break out of the loop if no clash is found
-        if os.path.exists(file_full_dir):  # Filename exists, add counter value
+        # Filename exists, add counter value
+        if os.path.exists(file_full_dir) or cur_file_name in reserved or \
+                cur_file_name in taken:
             cur_file_name = '{}_{}'.format(file_name, str(i))
-            file_full_dir = '{}\\{}{}'.format(output_dir, cur_file_name, extension)
+            file_full_dir = os.path.join(
+                output_dir, '{}{}'.format(cur_file_name, extension))
             i = i + 1
         else:  # Filename does not exist, use current filename
             break
 
+    reserved.add(cur_file_name)
     return cur_file_name
+
+
+def copy_map_outputs(source_base_path, destination_base_path):
+    """Copy the files of a map to another base path.
+
+    Every file sharing the source base path, e.g. the world file of a PNG
+    map or the sidecar files of a shapefile, gets the destination base path.
+    Files are hard linked when the file system allows it, copied otherwise.
+
+    :param source_base_path: Base path of the map files.
+    :type source_base_path: str
+
+    :param destination_base_path: Base path of the copies.
+    :type destination_base_path: str
+
+    :returns: Paths of the copies.
+    :rtype: list
+    """
+    copies = []
+    for source_path in glob.glob(glob.escape(source_base_path) + '.*'):
+        extension = source_path[len(source_base_path):]
+        destination_path = destination_base_path + extension
+        link_file(source_path, destination_path)
+        copies.append(destination_path)
+    return copies